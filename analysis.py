@@ -0,0 +1,357 @@
+import logging
+import re
+from matcher import TermMatcher, TopicIndex
+from context_index import ContextIndex, BENIGN_CONTEXT_INDICATORS
+from highlight import render_highlighted_text
+from segmentation import get_tokenizers
+from metrics import NULL_TIMER
+
+logger = logging.getLogger(__name__)
+
+def build_context_index(text):
+    """
+    Tokenize the document once into sentence and word spans for analyze_term_context().
+    Uses NLTK's tokenizers when its data is available and the regex segmenter otherwise.
+    Returns None if tokenization fails.
+    """
+    sent_tokenize, word_tokenize = get_tokenizers()
+    try:
+        return ContextIndex(text, sent_tokenize, word_tokenize)
+    except Exception as tokenize_error:
+        logger.warning(f"Tokenization error: {str(tokenize_error)}")
+        return None
+
+
+def analyze_term_context(text, span, window_size=5, context_index=None):
+    """
+    Analyze the context around a matched term to determine if it's likely to be problematic in this context.
+    Takes the (start, end) span of the match and an optional ContextIndex of the document.
+    Returns a confidence score (0-1) and contextual information.
+
+    The context is the window_size words on either side of the tokens the match overlaps, so a match
+    spanning several words is judged by the words around all of them. A match that overlaps no token
+    (it lies in whitespace the tokenizer skipped) is judged by the words of its sentence instead, and
+    only a match outside every sentence reports "Could not analyze context". Without a ContextIndex,
+    the 50 characters on either side of the match are searched.
+    """
+    try:
+        start, end = span
+        
+        if context_index is not None:
+            # Look up the words around the term in the document's token index
+            found, indicator = context_index.benign_indicator(start, end, window_size)
+            if not found:
+                # Fall back to the words of the sentence containing the term
+                sentence_span = context_index.sentence_span(start, end)
+                if sentence_span is None:
+                    return 1.0, "Could not analyze context"
+                context_text = text[sentence_span[0]:sentence_span[1]].lower()
+                indicator = next((i for i in BENIGN_CONTEXT_INDICATORS if i in context_text), None)
+        else:
+            # Fallback if the document could not be tokenized
+            context_text = text[max(0, start - 50):min(len(text), end + 50)].lower()
+            indicator = next((i for i in BENIGN_CONTEXT_INDICATORS if i in context_text), None)
+        
+        # Check if any benign indicators are in the context
+        if indicator:
+            return 0.5, f"May be in benign context ('{indicator}' found nearby)"
+        
+        # Default to high confidence if no benign indicators found
+        return 1.0, "No benign context indicators found"
+    except Exception as e:
+        logger.error(f"Error in analyze_term_context: {str(e)}")
+        return 1.0, "Error analyzing context"
+
+
+def analyze_term_contexts(text, spans, window_size=5):
+    """
+    Analyze the context of every matched span in a document, tokenizing the document only once.
+    Returns a list of (confidence, context_note) tuples in the same order as spans.
+    """
+    context_index = build_context_index(text)
+    return [analyze_term_context(text, span, window_size, context_index) for span in spans]
+
+
+# Start of each whitespace-separated word, so words can be counted within a region of the text
+WORD_START_PATTERN = re.compile(r'(?<!\S)\S')
+
+def count_topic_matches(text, topics_data, start=0, end=None, topic_index=None):
+    """
+    Count topic term matches and words that start within text[start:end].
+    Counts from adjacent regions can be added together, which lets chunked analysis score topics
+    without holding the whole document. Returns a tuple (matches per topic, word count).
+    Pass the catalog's prebuilt topic index to avoid indexing the topics again.
+    """
+    if end is None:
+        end = len(text)
+    if topic_index is None:
+        topic_index = TopicIndex(topics_data)
+
+    # Tokenize the text once; every topic is then counted from the same term-frequency table
+    counts = topic_index.count(*topic_index.fold(text, start, end))
+    topic_counts = dict(zip(topic_index.topics, counts))
+
+    word_count = len(WORD_START_PATTERN.findall(text, start, end))
+    return topic_counts, word_count
+
+def score_topics(topic_counts, word_count):
+    """
+    Turn topic match counts into relevance scores.
+    Returns a dictionary of the matched topics sorted by relevance.
+    """
+    topic_matches = {}
+    for topic, matches in topic_counts.items():
+        if matches > 0:
+            # Calculate a simple relevance score based on number of matches and text length
+            relevance = min(1.0, matches / (word_count / 50))
+            topic_matches[topic] = {
+                "matches": matches,
+                "relevance": relevance
+            }
+    
+    # Sort topics by relevance
+    return {k: v for k, v in sorted(topic_matches.items(), 
+                                    key=lambda item: item[1]['relevance'], 
+                                    reverse=True)}
+
+def analyze_topics(text, topics_data, topic_index=None):
+    """
+    Analyze the text to identify prevalent topics based on the presence of topic-related terms.
+    Returns a dictionary of topics with their relevance scores.
+    """
+    return score_topics(*count_topic_matches(text, topics_data, topic_index=topic_index))
+
+
+def build_analysis_result(term_info, result_id, matched_term, confidence, context_note):
+    """Build the analysis entry reported to the client for one match."""
+    return {
+        "id": result_id,
+        "term": matched_term,
+        "feedback": term_info["feedback"],
+        "category": term_info["category"] or "General",
+        "source": term_info["source"] or "Internal",
+        "confidence": confidence,
+        "context_note": context_note
+    }
+
+
+def score_matches(text, terms_data, matcher=None, timer=NULL_TIMER):
+    """
+    Match the problematic terms against the text and analyze the context of every match.
+    Returns a list of (term index, start, end, confidence, context_note) tuples.
+    """
+    # Process problematic terms in a single pass over the text
+    if matcher is None:
+        matcher = TermMatcher(terms_data)
+    with timer.stage('match'):
+        matches = matcher.find_matches(text)
+    timer.count('terms_evaluated', len(terms_data))
+    timer.count('matches', len(matches))
+    
+    # Analyze the context of all matches against a single tokenization of the text
+    with timer.stage('context'):
+        try:
+            contexts = analyze_term_contexts(text, [(start, end) for _, start, end in matches])
+        except Exception as context_error:
+            logger.warning(f"Error analyzing context: {str(context_error)}")
+            contexts = [(1.0, "Context analysis failed")] * len(matches)
+
+    return [match + context for match, context in zip(matches, contexts)]
+
+
+def find_problematic_terms(text, terms_data, matcher=None, highlight=True, timer=NULL_TIMER):
+    """
+    Match the problematic terms against the text and analyze the context of every match.
+    Pass the catalog's prebuilt matcher to avoid compiling the terms again, and a StageTimer to time each stage.
+    Returns a tuple (analysis_results, highlighted_text); highlighted_text is None when highlight is False.
+    """
+    analysis_results = []
+    highlights = []
+    for idx, start_pos, end_pos, confidence, context_note in score_matches(text, terms_data, matcher, timer):
+        result = build_analysis_result(
+            terms_data[idx], f"term-{idx}-{len(analysis_results)}", text[start_pos:end_pos], confidence, context_note
+        )
+        analysis_results.append(result)
+        highlights.append((start_pos, end_pos, result))
+    
+    # Render all highlights in one pass over the original text
+    highlighted_text = None
+    if highlight:
+        with timer.stage('highlight'):
+            highlighted_text = render_highlighted_text(text, highlights)
+    return analysis_results, highlighted_text
+
+
+def analyze_document(text, catalog, highlight=True, timer=NULL_TIMER):
+    """
+    Run the full analysis of one document against a Catalog snapshot.
+    Returns the response dictionary shared by /analyze, /upload and the batch endpoint.
+    Every endpoint passes the text exactly as submitted or extracted, never stripped, so that the
+    offsets of the compact and streamed formats and the original_text echoed here all refer to it.
+    """
+    analysis_results, highlighted_text = find_problematic_terms(
+        text, catalog.terms, matcher=catalog.matcher, highlight=highlight, timer=timer
+    )
+
+    # Analyze topics in the text
+    with timer.stage('topics'):
+        try:
+            topics_analysis = analyze_topics(text, catalog.topics, topic_index=catalog.topic_index)
+        except Exception as topics_error:
+            logger.warning(f"Error analyzing topics: {str(topics_error)}")
+            topics_analysis = {}  # Use empty dict if topic analysis fails
+
+    response = {
+        "analysis": analysis_results,
+        "topics": topics_analysis,
+        "original_text": text  # Include original text for report
+    }
+    if highlighted_text is not None:
+        response["input_text"] = highlighted_text
+    return response
+
+
+def compact_term_info(term_info):
+    """The metadata of a term as listed once in the 'terms' of compact responses."""
+    return {
+        "term": term_info["term"],
+        "feedback": term_info["feedback"],
+        "category": term_info["category"] or "General",
+        "source": term_info["source"] or "Internal"
+    }
+
+
+def analyze_document_compact(text, catalog, timer=NULL_TIMER):
+    """
+    Analyze one document and return the compact response format. Instead of one result per match with
+    its feedback embedded, and a highlighted HTML copy of the text, the response holds:
+      matches: [term id, start, end, confidence, note id] arrays, with character offsets into text
+      terms:   the metadata of every matched term, once, keyed by term id
+      notes:   the distinct context notes, indexed by note id
+    The text itself is not echoed; clients render the highlights from the offsets.
+    """
+    terms = {}
+    notes = {}                  # context note -> note id
+    matches = []
+    for idx, start, end, confidence, context_note in score_matches(text, catalog.terms, catalog.matcher, timer):
+        if idx not in terms:
+            terms[idx] = compact_term_info(catalog.terms[idx])
+        note_id = notes.setdefault(context_note, len(notes))
+        matches.append([idx, start, end, confidence, note_id])
+
+    with timer.stage('topics'):
+        try:
+            topics_analysis = analyze_topics(text, catalog.topics, topic_index=catalog.topic_index)
+        except Exception as topics_error:
+            logger.warning(f"Error analyzing topics: {str(topics_error)}")
+            topics_analysis = {}  # Use empty dict if topic analysis fails
+
+    return {
+        "format": "compact",
+        "matches": matches,
+        "terms": {str(idx): term for idx, term in terms.items()},
+        "notes": list(notes),
+        "topics": topics_analysis
+    }
+
+
+def split_text(text, piece_size):
+    """Yield text in pieces of piece_size characters, so it can be fed to iter_chunked_analysis()."""
+    for start in range(0, len(text), piece_size):
+        yield text[start:start + piece_size]
+
+
+def iter_chunked_analysis(pieces, catalog, chunk_size=65536, overlap=1024):
+    """
+    Analyze a document in overlapping windows and yield NDJSON-ready records as findings are made.
+
+    pieces is an iterable of consecutive text fragments: split_text() of a document, or the pages of a
+    PDF as they are extracted. Each chunk of chunk_size characters is scanned together with overlap
+    characters on both sides, so terms spanning a chunk boundary are still found, and a match is
+    reported by the chunk in which it starts. Only the current window is held in memory.
+
+    Yields {"type": "finding", ...} for each match (with absolute start/end offsets),
+    {"type": "progress", ...} after each chunk, then {"type": "topics", ...} and {"type": "done", ...}.
+    """
+    # The overlap must be longer than any literal or topic term, so a match in the window is never cut short
+    matcher = catalog.matcher
+    overlap = max(overlap, matcher.max_literal_length + 1, catalog.topic_index.max_length + 1)
+
+    buffer = ''                     # Text from buffer_offset onwards that is still needed
+    buffer_offset = 0
+    owned_from = 0                  # Absolute offset of the first character of the current chunk
+    previous_spans = []             # Spans reported by the previous chunk that may reach into this one
+    finding_count = 0
+    topic_totals = dict.fromkeys(catalog.topics, 0)
+    word_total = 0
+
+    def analyze_chunk(owned_to):
+        nonlocal finding_count, previous_spans, word_total
+        window_start = max(buffer_offset, owned_from - overlap)
+        window = buffer[window_start - buffer_offset:owned_to + overlap - buffer_offset]
+        local_from = owned_from - window_start
+        local_to = owned_to - window_start
+
+        # Keep matches that start in this chunk and do not collide with a match from the previous chunk
+        matches = []
+        for idx, start, end in matcher.find_matches(window):
+            if not local_from <= start < local_to:
+                continue
+            absolute_start = window_start + start
+            if any(absolute_start < previous_end for _, previous_end in previous_spans):
+                continue
+            matches.append((idx, start, end))
+
+        try:
+            contexts = analyze_term_contexts(window, [(start, end) for _, start, end in matches])
+        except Exception as context_error:
+            logger.warning(f"Error analyzing context: {str(context_error)}")
+            contexts = [(1.0, "Context analysis failed")] * len(matches)
+
+        spans = []
+        for (idx, start, end), (confidence, context_note) in zip(matches, contexts):
+            record = build_analysis_result(
+                catalog.terms[idx], f"term-{idx}-{finding_count}", window[start:end], confidence, context_note
+            )
+            record["type"] = "finding"
+            record["start"] = window_start + start
+            record["end"] = window_start + end
+            spans.append((record["start"], record["end"]))
+            finding_count += 1
+            yield record
+        previous_spans = [span for span in spans if span[1] > owned_to]
+
+        topic_counts, word_count = count_topic_matches(
+            window, catalog.topics, local_from, local_to, topic_index=catalog.topic_index
+        )
+        for topic, matches_in_chunk in topic_counts.items():
+            topic_totals[topic] += matches_in_chunk
+        word_total += word_count
+
+        yield {"type": "progress", "offset": owned_to, "matches": finding_count}
+
+    for piece in pieces:
+        buffer += piece
+        # Analyze every chunk whose right-hand overlap is already available
+        while buffer_offset + len(buffer) >= owned_from + chunk_size + overlap:
+            owned_to = owned_from + chunk_size
+            yield from analyze_chunk(owned_to)
+            owned_from = owned_to
+            # Drop text that no later window can reach
+            cut = owned_from - overlap - buffer_offset
+            if cut > 0:
+                buffer = buffer[cut:]
+                buffer_offset += cut
+
+    document_length = buffer_offset + len(buffer)
+    if owned_from < document_length or document_length == 0:
+        yield from analyze_chunk(document_length)
+
+    try:
+        topics_analysis = score_topics(topic_totals, word_total)
+    except Exception as topics_error:
+        logger.warning(f"Error analyzing topics: {str(topics_error)}")
+        topics_analysis = {}  # Use empty dict if topic analysis fails
+
+    yield {"type": "topics", "topics": topics_analysis}
+    yield {"type": "done", "matches": finding_count, "length": document_length}
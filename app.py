@@ -1,256 +1,234 @@
+import time
+STARTUP_STARTED = time.perf_counter()                              # Measure module startup against STARTUP_TIME_BUDGET.
 import logging
-from flask import Flask, request, jsonify, render_template  # Import modules for handling requests and JSON responses.
+from flask import Flask, Request, Response, g, request, jsonify, render_template, stream_with_context  # Import modules for handling requests and JSON responses.
 from werkzeug.utils import secure_filename
+import io
 import os
-import docx
-import PyPDF2
-import nltk
+import hashlib
+import json
+import uuid
+import tempfile
+import shutil
 import sqlite3
 import re
+import db
+import schema
+import segmentation
+from analysis import analyze_document, analyze_document_compact, iter_chunked_analysis, split_text
+from extraction import extract_text, iter_pdf_pages, preload_extractors
+from catalog import Catalog, CatalogCache
+from catalog_artifact import load_or_build_catalog
+from batch import BatchAnalyzer
+from result_cache import ResultCache, decode_response, make_cache_key, hash_stream
+from text_cache import TextCache
+from jobs import JobStore, JobRunner
+from metrics import Metrics, SharedMetrics, StageTimer, NULL_TIMER
+from logging_setup import configure_logging, start_request, end_request
+from compression import negotiate_encoding, encode_json_body, encode_json_chunks
+from sessions import SessionStore, EditError
+
+LOG_MAX_BYTES = 10 * 1024 * 1024                                    # Define the size at which app.log is rotated (10 MB).
+LOG_BACKUP_COUNT = 5                                                # Define the number of rotated log files kept.
 
-logging.basicConfig(                                                # Configure the logging module.
-    level=logging.DEBUG,  # Set to INFO or ERROR for production
-    format="%(asctime)s [%(levelname)s] %(message)s",
-    handlers=[
-        logging.FileHandler("app.log"),  # Log to a file
-        logging.StreamHandler()         # Log to console
-    ]
-)
 logger = logging.getLogger(__name__)                                # Get a logger object.
 
+class HashingSpooledFile(tempfile.SpooledTemporaryFile):
+    """Spooled temporary file that computes the SHA-256 of an upload while it streams in."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._digest = hashlib.sha256()
+
+    def write(self, data):
+        self._digest.update(data)
+        return super().write(data)
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+class SpooledUploadRequest(Request):
+    """Request class that keeps uploaded files in memory, spilling them to a temporary file only above a size threshold."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingSpooledFile(max_size=app.config['UPLOAD_SPOOL_THRESHOLD'])
+
 app = Flask(__name__)                                               # Create a Flask app.  
+app.request_class = SpooledUploadRequest                            # Stream uploads into spooled temporary files.
 
-# Download necessary NLTK data
-nltk_data_downloaded = False
-try:
-    nltk.download('punkt', quiet=True)
-    nltk.download('wordnet', quiet=True)
-    nltk.download('averaged_perceptron_tagger', quiet=True)
-    nltk_data_downloaded = True
-    logger.info("NLTK data successfully downloaded")
-except Exception as e:
-    logger.error(f"Error downloading NLTK data: {str(e)}")
-    logger.warning("Application will run with limited functionality")
-
-UPLOAD_FOLDER = 'uploads'                                # Define the upload folder.
 ALLOWED_EXTENSIONS = {'txt', 'docx', 'pdf'}              # Define the allowed file extensions.
+INSTRUMENTED_ENDPOINTS = {'analyze', 'upload_file', 'create_session', 'edit_session'}  # Define the endpoints timed for Server-Timing and /metrics.
 MAX_CONTENT_LENGTH = 10 * 1024 * 1024                    # Define the maximum file size (10 MB).
+MAX_BATCH_DOCUMENTS = 100                                # Define the maximum number of documents in one batch request.
+UPLOAD_SPOOL_THRESHOLD = 2 * 1024 * 1024                 # Define the upload size above which files spill to disk (2 MB).
+RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024                # Define the memory budget of the analysis result cache (64 MB).
+TEXT_CACHE_MAX_BYTES = 256 * 1024 * 1024                 # Define the disk budget of the extracted text cache (256 MB).
+STREAM_CHUNK_SIZE = 64 * 1024                            # Define the number of characters analyzed per chunk when streaming.
+STREAM_CHUNK_OVERLAP = 1024                              # Define the overlap between streamed chunks, in characters.
+JOB_TTL = 60 * 60                                        # Define how long finished jobs are kept, in seconds (1 hour).
+MAX_PENDING_JOBS = 100                                   # Define the maximum number of queued or running jobs.
+MAX_SESSIONS = 1000                                      # Define the maximum number of live editor sessions kept in memory.
+SESSION_TTL = 30 * 60                                    # Define how long an idle editor session is kept, in seconds (30 minutes).
+COMPRESSION_MIN_SIZE = 8 * 1024                          # Define the response size above which JSON is streamed and compressed (8 KB).
+STARTUP_TIME_BUDGET = 1.0                                # Define the time the module may take to start, in seconds.
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER                     # Set the upload folder in the app configuration.
 app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH           # Set the maximum content length in the app configuration.
-
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)                       # Create the upload folder if it does not exist.
+app.config['MAX_BATCH_DOCUMENTS'] = MAX_BATCH_DOCUMENTS         # Set the maximum batch size in the app configuration.
+app.config['UPLOAD_SPOOL_THRESHOLD'] = UPLOAD_SPOOL_THRESHOLD   # Set the in-memory upload limit in the app configuration.
+app.config['RESULT_CACHE_MAX_BYTES'] = RESULT_CACHE_MAX_BYTES   # Set the result cache budget in the app configuration.
+app.config['RESULT_CACHE_DB'] = os.environ.get('RESULT_CACHE_DB')  # Set an optional SQLite file that persists cached results.
+app.config['TEXT_CACHE_DIR'] = os.environ.get('TEXT_CACHE_DIR', 'text_cache')  # Set the extracted text cache folder; empty disables it.
+app.config['TEXT_CACHE_MAX_BYTES'] = TEXT_CACHE_MAX_BYTES       # Set the text cache budget in the app configuration.
+app.config['STREAM_CHUNK_SIZE'] = STREAM_CHUNK_SIZE             # Set the streaming chunk size in the app configuration.
+app.config['STREAM_CHUNK_OVERLAP'] = STREAM_CHUNK_OVERLAP       # Set the streaming chunk overlap in the app configuration.
+app.config['BATCH_WORKERS'] = int(os.environ.get('BATCH_WORKERS', os.cpu_count() or 1))  # Set the number of batch worker processes.
+app.config['JOBS_DB'] = os.environ.get('JOBS_DB', 'jobs.db')   # Set the SQLite file that holds asynchronous job state.
+app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))  # Set the number of threads that run jobs.
+app.config['JOB_TTL'] = JOB_TTL                                 # Set the finished job lifetime in the app configuration.
+app.config['MAX_PENDING_JOBS'] = MAX_PENDING_JOBS               # Set the job queue limit in the app configuration.
+app.config['LOG_SAMPLE_RATE'] = float(os.environ.get('LOG_SAMPLE_RATE', 1.0))  # Set the fraction of requests whose INFO lines are logged.
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'  # Set to 0 to turn off request timing and /metrics.
+app.config['METRICS_DB'] = os.environ.get('METRICS_DB')         # Set an optional SQLite file through which processes serving the app combine /metrics.
+app.config['MAX_SESSIONS'] = MAX_SESSIONS                       # Set the editor session limit in the app configuration.
+app.config['SESSION_TTL'] = SESSION_TTL                         # Set the idle editor session lifetime in the app configuration.
+app.config['SESSIONS_DB'] = os.environ.get('SESSIONS_DB')       # Set an optional SQLite file through which processes serving the app share editor sessions.
+app.config['COMPRESSION_ENABLED'] = os.environ.get('COMPRESSION_ENABLED', '1') == '1'  # Set to 0 to never compress responses.
+app.config['COMPRESSION_LEVEL'] = int(os.environ.get('COMPRESSION_LEVEL', 6))  # Set the zlib level (1 fastest - 9 smallest).
+app.config['COMPRESSION_MIN_SIZE'] = COMPRESSION_MIN_SIZE       # Set the compression threshold in the app configuration.
+app.config['CATALOG_ARTIFACT'] = os.environ.get('CATALOG_ARTIFACT', 'catalog.artifact')  # Set the prebuilt catalog written by catalog_artifact.py; empty disables it.
+app.config['PRELOAD_NLP'] = os.environ.get('PRELOAD_NLP', '0') == '1'  # Set to load NLTK and the document parsers at startup instead of on first use.
+app.config['STARTUP_TIME_BUDGET'] = float(os.environ.get('STARTUP_TIME_BUDGET', STARTUP_TIME_BUDGET))  # Set the startup time budget in the app configuration.
 
 def allowed_file(filename):                                                             # Function to check if the file extension is allowed.
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS # Check if the file extension is allowed.
 
-def extract_text_from_docx(file_path):
-    try:
-        doc = docx.Document(file_path)
-        text = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
-        return text
-    except Exception as e:
-        logger.error(f"Error extracting text from DOCX file {file_path}: {str(e)}")
-        raise Exception(f"Could not read DOCX file. It may be corrupted or in an unsupported format: {str(e)}")
-
-def extract_text_from_pdf(file_path):
-    try:
-        text = ''
-        with open(file_path, 'rb') as f:
-            try:
-                pdf_reader = PyPDF2.PdfReader(f)
-                if len(pdf_reader.pages) == 0:
-                    raise Exception("PDF has no pages")
-                    
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text
-                
-                if not text.strip():
-                    raise Exception("No text content could be extracted from PDF")
-                    
-                return text
-            except Exception as e:
-                logger.error(f"Error reading PDF content: {str(e)}")
-                raise Exception(f"Could not extract text from PDF: {str(e)}")
-    except Exception as e:
-        logger.error(f"Error opening PDF file {file_path}: {str(e)}")
-        raise Exception(f"Could not open PDF file: {str(e)}")
+def highlight_requested(value):
+    """Interpret the optional 'highlight' request flag; highlighting stays on unless the client turns it off."""
+    if isinstance(value, str):
+        return value.strip().lower() not in ('0', 'false', 'no', 'off')
+    return value is None or bool(value)
 
-def get_problematic_terms():
-    """
-    Function to fetch problematic terms and feedback from the database.
-    Returns a list of term dictionaries or raises an exception if the database operation fails.
-    """
-    try:
-        conn = sqlite3.connect('terms.db')
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("""
-                SELECT t.term, t.pattern, t.feedback, c.name, s.name 
-                FROM problematic_terms t
-                LEFT JOIN categories c ON t.category_id = c.id
-                LEFT JOIN sources s ON t.source_id = s.id
-            """)
-            terms = cursor.fetchall()
-            
-            if not terms:
-                logger.warning("No problematic terms found in database")
-            
-            return [
-                {
-                    "term": term,
-                    "pattern": pattern or r'\b' + re.escape(term) + r'\b',
-                    "feedback": feedback,
-                    "category": category,
-                    "source": source
-                }
-                for term, pattern, feedback, category, source in terms
-            ]
-        except sqlite3.Error as query_error:
-            logger.error(f"SQL error in get_problematic_terms: {str(query_error)}")
-            raise
-        finally:
-            conn.close()
-    except sqlite3.Error as conn_error:
-        logger.error(f"Database connection error in get_problematic_terms: {str(conn_error)}")
-        raise Exception(f"Failed to retrieve problematic terms from database: {str(conn_error)}")
-
-def get_topics():
+def json_response(payload, status=200):
     """
-    Function to fetch topics and associated terms from the database.
-    Returns a dictionary of topics with their terms or raises an exception if the database operation fails.
+    Send payload as JSON like jsonify(), but encoded incrementally so the serialized string is never held
+    in memory as a whole. Bodies of at least COMPRESSION_MIN_SIZE bytes are streamed, compressed with
+    gzip or deflate if the client accepts either.
     """
-    try:
-        conn = sqlite3.connect('terms.db')
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("SELECT topic, terms FROM topics")
-            topics = cursor.fetchall()
-            
-            if not topics:
-                logger.warning("No topics found in database")
-                return {}
-                
-            return {topic: terms.split(", ") for topic, terms in topics}
-        except sqlite3.Error as query_error:
-            logger.error(f"SQL error in get_topics: {str(query_error)}")
-            raise
-        finally:
-            conn.close()
-    except sqlite3.Error as conn_error:
-        logger.error(f"Database connection error in get_topics: {str(conn_error)}")
-        raise Exception(f"Failed to retrieve topics from database: {str(conn_error)}")
-
-def analyze_term_context(text, match, window_size=5):
+    return encoded_json_response(encode_json_body, payload, status)
+
+def cached_json_response(body, status=200):
+    """Send a response of the result cache, encoded as JSON chunks, like json_response()."""
+    return encoded_json_response(encode_json_chunks, body, status)
+
+def encoded_json_response(encode, content, status):
+    encoding = None
+    if app.config['COMPRESSION_ENABLED']:
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    body, content_encoding = encode(content, encoding, app.config['COMPRESSION_LEVEL'], app.config['COMPRESSION_MIN_SIZE'])
+    response = Response(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    return response
+
+def compact_requested(value):
+    """Interpret the optional 'format' request field; 'compact' selects the offset-based response format."""
+    return isinstance(value, str) and value.strip().lower() == 'compact'
+
+def text_cache_key(input_text, catalog, highlight, compact=False):
+    """Result cache key of submitted text: identical text analyzed against the same catalog shares it."""
+    response_format = 'compact' if compact else str(highlight)
+    return make_cache_key('analyze', input_text, repr(catalog.version), response_format)
+
+def analyze_text_cached(input_text, catalog, highlight, timer=NULL_TIMER, compact=False):
     """
-    Analyze the context around a matched term to determine if it's likely to be problematic in this context.
-    Returns a confidence score (0-1) and contextual information.
+    Analyze text, reusing the response for identical text already analyzed against the same catalog.
+    Returns the response as an iterable of JSON chunks, for cached_json_response(); a new response is
+    encoded, and cached, as the chunks are sent.
     """
-    try:
-        start, end = match.span()
-        
-        # Get the sentence containing the term
-        if nltk_data_downloaded:
-            try:
-                sentences = nltk.sent_tokenize(text)
-                term_sentence = ""
-                for sentence in sentences:
-                    if start >= text.find(sentence) and end <= text.find(sentence) + len(sentence):
-                        term_sentence = sentence
-                        break
-                
-                if not term_sentence:
-                    term_sentence = text[max(0, start - 50):min(len(text), end + 50)]
-            except Exception as nltk_error:
-                logger.warning(f"NLTK sentence tokenization error: {str(nltk_error)}")
-                term_sentence = text[max(0, start - 50):min(len(text), end + 50)]
+    cache_key = text_cache_key(input_text, catalog, highlight, compact)
+    body = result_cache.get(cache_key)
+    if body is None:
+        if compact:
+            response = analyze_document_compact(input_text, catalog, timer=timer)
         else:
-            # Fallback if NLTK data is not available
-            term_sentence = text[max(0, start - 50):min(len(text), end + 50)]
-        
-        # Get words around the term
-        if nltk_data_downloaded:
-            try:
-                words = nltk.word_tokenize(text)
-                term_position = -1
-                for i, word in enumerate(words):
-                    word_start = text.find(word, max(0, start-50), min(len(text), end+50))
-                    if word_start != -1 and start >= word_start and end <= word_start + len(word):
-                        term_position = i
-                        break
-                
-                if term_position == -1:
-                    return 1.0, "Could not analyze context"
-                
-                # Get context words
-                start_pos = max(0, term_position - window_size)
-                end_pos = min(len(words), term_position + window_size + 1)
-                context_words = words[start_pos:term_position] + words[term_position+1:end_pos]
-            except Exception as nltk_error:
-                logger.warning(f"NLTK word tokenization error: {str(nltk_error)}")
-                # Fallback to simple word splitting
-                context_words = term_sentence.split()
-        else:
-            # Fallback if NLTK data is not available
-            context_words = term_sentence.split()
-        
-        # List of words that might indicate benign context
-        benign_context_indicators = [
-            'quote', 'quotes', 'quoted', 'quoting', 
-            'example', 'examples', 'exemplifies',
-            'reference', 'references', 'referenced',
-            'citation', 'citations', 'cited',
-            'definition', 'defines', 'defined',
-            'mention', 'mentions', 'mentioned',
-            'discuss', 'discusses', 'discussed', 'discussing', 'discussion'
-        ]
-        
-        # Check if any benign indicators are in the context
-        context_text = ' '.join(context_words).lower()
-        for indicator in benign_context_indicators:
-            if indicator in context_text:
-                return 0.5, f"May be in benign context ('{indicator}' found nearby)"
-        
-        # Default to high confidence if no benign indicators found
-        return 1.0, "No benign context indicators found"
-    except Exception as e:
-        logger.error(f"Error in analyze_term_context: {str(e)}")
-        return 1.0, "Error analyzing context"
-
-def analyze_topics(text, topics_data):
+            response = analyze_document(input_text, catalog, highlight=highlight, timer=timer)
+        body = result_cache.stream(cache_key, response)
+    else:
+        logger.info("Analysis served from the result cache")
+        timer.count('result_cache_hits')
+    return body
+
+def upload_cache_key(file_hash, filename, catalog, highlight, compact=False):
+    """Result cache key of an uploaded file: identical files analyzed against the same catalog share it."""
+    extension = os.path.splitext(filename)[1]
+    response_format = 'compact' if compact else str(highlight)
+    return make_cache_key('upload', file_hash, extension, repr(catalog.version), response_format)
+
+def extract_upload_text(filename, stream, file_hash, on_page=None, timer=NULL_TIMER):
     """
-    Analyze the text to identify prevalent topics based on the presence of topic-related terms.
-    Returns a dictionary of topics with their relevance scores.
+    Return the text of an uploaded file, reusing the text of an identical earlier upload.
+    Otherwise the text is extracted straight from the spooled upload stream and cached.
     """
-    text_lower = text.lower()
-    topic_matches = {}
-    
-    for topic, terms in topics_data.items():
-        matches = 0
-        for term in terms:
-            # Count how many times each term appears in the text
-            term_lower = term.lower()
-            # Use word boundaries to avoid partial matches
-            pattern = r'\b' + re.escape(term_lower) + r'\b'
-            term_matches = len(re.findall(pattern, text_lower, re.IGNORECASE))
-            matches += term_matches
-        
-        if matches > 0:
-            # Calculate a simple relevance score based on number of matches and text length
-            relevance = min(1.0, matches / (len(text_lower.split()) / 50))
-            topic_matches[topic] = {
-                "matches": matches,
-                "relevance": relevance
-            }
-    
-    # Sort topics by relevance
-    return {k: v for k, v in sorted(topic_matches.items(), 
-                                    key=lambda item: item[1]['relevance'], 
-                                    reverse=True)}
+    extension = os.path.splitext(filename)[1]
+    extracted_text = text_cache.get(file_hash, extension) if text_cache else None
+    if extracted_text is None:
+        with timer.stage('extract'):
+            extracted_text = extract_text(filename, stream, on_page)
+        if text_cache and extracted_text.strip():
+            text_cache.put(file_hash, extension, extracted_text)
+    else:
+        logger.info(f"Extracted text of {filename} served from the text cache")
+        timer.count('text_cache_hits')
+    return extracted_text
+
+@app.before_request
+def start_request_logging():
+    """Assign the request an id, taken from X-Request-ID if the client or proxy sent one, for its log records."""
+    g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+    g.log_token = start_request(g.request_id, app.config['LOG_SAMPLE_RATE'])
+
+@app.teardown_request
+def end_request_logging(exc):
+    token = g.pop('log_token', None)
+    if token is not None:
+        end_request(token)
+
+@app.before_request
+def start_request_timer():
+    """Give instrumented endpoints a StageTimer; every other request gets the no-op timer."""
+    if app.config['METRICS_ENABLED'] and request.endpoint in INSTRUMENTED_ENDPOINTS:
+        g.timer = StageTimer()
+        g.timer.count('bytes_in', request.content_length or 0)
+    else:
+        g.timer = NULL_TIMER
+
+@app.after_request
+def report_request_timer(response):
+    """Report the request's stage timings in a Server-Timing header and fold them into /metrics."""
+    timer = g.get('timer', NULL_TIMER)
+    if timer.enabled:
+        response.headers['Server-Timing'] = timer.server_timing()
+        metrics.observe(request.endpoint, timer)
+        logger.info("Request completed", extra={"fields": {
+            "method": request.method,
+            "path": request.path,
+            "status": response.status_code,
+            "duration_ms": round(timer.elapsed() * 1000, 2),
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in timer.stages.items()},
+            "counts": timer.counts
+        }})
+    if 'request_id' in g:
+        response.headers['X-Request-ID'] = g.request_id
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose the stage duration histograms and counters in the Prometheus text format."""
+    if not app.config['METRICS_ENABLED']:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route("/")                                                     # Define a route for the landing page.
 def input_text():                                                   # Define a function to render the index.html template.
@@ -273,98 +251,26 @@ def analyze():
             logger.warning("Invalid or missing text field")
             return jsonify({"error": "Invalid text format"}), 400
 
-        input_text = data['text'].strip()
-        if not input_text:
+        # The text is analyzed exactly as sent, so offsets index into it; stripping only rejects blank input
+        input_text = data['text']
+        if not input_text.strip():
             logger.warning("Empty text received")
             return jsonify({"error": "Please enter some text to analyze"}), 400
 
-        # Verify database before attempting to use it
-        db_ok, db_error = verify_database()
-        if not db_ok:
-            logger.error(f"Database verification failed during analyze: {db_error}")
-            return jsonify({"error": f"Database error: {db_error}"}), 500
+        # Get the cached term catalog; it is only reloaded when terms.db changes
+        with g.timer.stage('catalog'):
+            catalog = catalog_cache.get()
+        if catalog.error:
+            logger.error(f"Term catalog unavailable during analyze: {catalog.error}")
+            return jsonify({"error": catalog.error}), 500
 
-        # Get terms from database
+        # Process text, unless the same text was already analyzed against this catalog
         try:
-            terms_data = get_problematic_terms()
-            if not terms_data:
-                logger.warning("No terms found in database")
-                return jsonify({"error": "No analysis terms available in the database. Analysis cannot be performed."}), 500
-                
-            topics_data = get_topics()
-        except sqlite3.Error as db_error:
-            logger.error(f"Database error: {str(db_error)}")
-            return jsonify({"error": f"Database error: {str(db_error)}"}), 500
-        except Exception as term_error:
-            logger.error(f"Error fetching terms: {str(term_error)}")
-            return jsonify({"error": f"Error fetching analysis terms: {str(term_error)}"}), 500
-
-        # Process text
-        analysis_results = []
-        highlighted_text = input_text
+            highlight = highlight_requested(data.get('highlight', request.args.get('highlight')))
+            if compact_requested(data.get('format', request.args.get('format'))):
+                return cached_json_response(analyze_text_cached(input_text, catalog, highlight, timer=g.timer, compact=True))
 
-        try:
-            # Process problematic terms
-            for idx, term_info in enumerate(terms_data):
-                pattern = term_info["pattern"]
-                try:
-                    regex = re.compile(pattern, re.IGNORECASE)
-                except re.error as regex_compile_error:
-                    logger.warning(f"Invalid regex pattern: {pattern}. Error: {str(regex_compile_error)}")
-                    continue  # Skip this term if the pattern is invalid
-                
-                for match in regex.finditer(input_text):
-                    term_id = f"term-{idx}-{len(analysis_results)}"
-                    matched_term = match.group()
-                    
-                    # Analyze the context of the match
-                    try:
-                        confidence, context_note = analyze_term_context(input_text, match)
-                    except Exception as context_error:
-                        logger.warning(f"Error analyzing context: {str(context_error)}")
-                        confidence, context_note = 1.0, "Context analysis failed"
-                    
-                    analysis_results.append({
-                        "id": term_id,
-                        "term": matched_term,
-                        "feedback": term_info["feedback"],
-                        "category": term_info["category"] or "General",
-                        "source": term_info["source"] or "Internal",
-                        "confidence": confidence,
-                        "context_note": context_note
-                    })
-                    
-                    # Create highlight span with data attributes
-                    # Add confidence class based on confidence level
-                    confidence_class = "high-confidence"
-                    if confidence < 0.7:
-                        confidence_class = "medium-confidence"
-                    if confidence < 0.3:
-                        confidence_class = "low-confidence"
-                        
-                    highlight_span = f'<span class="highlight {confidence_class}" data-id="{term_id}" data-feedback="{term_info["feedback"]}" data-category="{term_info["category"] or "General"}" data-source="{term_info["source"] or "Internal"}" data-confidence="{confidence}" data-context="{context_note}">{matched_term}</span>'
-                    
-                    # Replace this occurrence only
-                    start_pos = match.start()
-                    end_pos = match.end()
-                    highlighted_text = highlighted_text[:start_pos] + highlight_span + highlighted_text[end_pos:]
-                    
-                    # Adjust input text to prevent overlapping highlights
-                    input_text = input_text[:start_pos] + ' ' * len(matched_term) + input_text[end_pos:]
-            
-            # Analyze topics in the text
-            try:
-                topics_analysis = analyze_topics(data['text'], topics_data)
-            except Exception as topics_error:
-                logger.warning(f"Error analyzing topics: {str(topics_error)}")
-                topics_analysis = {}  # Use empty dict if topic analysis fails
-
-            return jsonify({
-                "input_text": highlighted_text,
-                "analysis": analysis_results,
-                "topics": topics_analysis,
-                "original_text": data['text']  # Include original text for report
-            })
+            return cached_json_response(analyze_text_cached(input_text, catalog, highlight, timer=g.timer))
 
         except re.error as regex_error:
             logger.error(f"Regex error: {str(regex_error)}")
@@ -396,29 +302,30 @@ def upload_file():
 
     try:                                                                
         filename = secure_filename(file.filename)                       
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename) 
-
-        logger.info(f"Saving file in chunks to: {file_path}")           
-        with open(file_path, 'wb') as f:                                
-            for chunk in file.stream:                                   
-                f.write(chunk)                                          
 
-        logger.info(f"File saved: {file_path}")
+        # Get the cached term catalog; it is only reloaded when terms.db changes
+        with g.timer.stage('catalog'):
+            catalog = catalog_cache.get()
+        if catalog.error:
+            logger.error(f"Term catalog unavailable during upload: {catalog.error}")
+            return jsonify({"error": catalog.error}), 500
+
+        # Identical files analyzed against the same catalog skip extraction and analysis entirely
+        highlight = highlight_requested(request.values.get('highlight'))
+        compact = compact_requested(request.values.get('format'))
+        file_hash = getattr(file.stream, 'sha256', None) or hash_stream(file.stream)  # Hashed while the upload streamed in
+        cache_key = upload_cache_key(file_hash, filename, catalog, highlight, compact)
+        body = result_cache.get(cache_key)
+        if body is not None:
+            logger.info(f"Analysis of {filename} served from the result cache")
+            g.timer.count('result_cache_hits')
+            return cached_json_response(body)
 
         # Extract text based on file type
         try:
-            if filename.endswith('.docx'):                                  
-                extracted_text = extract_text_from_docx(file_path)          
-            elif filename.endswith('.pdf'):                                 
-                extracted_text = extract_text_from_pdf(file_path)           
-            else:  # For .txt files                                         
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:           
-                        extracted_text = f.read()
-                except UnicodeDecodeError:
-                    # Try a different encoding if utf-8 fails
-                    with open(file_path, 'r', encoding='latin-1') as f:
-                        extracted_text = f.read()
+            extracted_text = extract_upload_text(
+                filename, file.stream, file_hash, on_page=lambda number: g.timer.count('pages'), timer=g.timer
+            )
                         
             if not extracted_text or len(extracted_text.strip()) == 0:
                 logger.warning(f"Extracted empty text from file: {filename}")
@@ -428,93 +335,14 @@ def upload_file():
             logger.error(f"Error extracting text from file: {str(extract_error)}")
             return jsonify({"error": f"Failed to extract text from the file: {str(extract_error)}"}), 500
 
-        # Verify database before attempting to use it
-        db_ok, db_error = verify_database()
-        if not db_ok:
-            logger.error(f"Database verification failed during upload: {db_error}")
-            return jsonify({"error": f"Database error: {db_error}"}), 500
-
-        # Check if database exists and fetch terms
-        try:
-            terms_data = get_problematic_terms()
-            if not terms_data:
-                logger.warning("No terms found in database")
-                return jsonify({"error": "No analysis terms available in the database. Analysis cannot be performed."}), 500
-                
-            topics_data = get_topics()
-            
-        except sqlite3.Error as db_error:
-            logger.error(f"Database error: {str(db_error)}")
-            return jsonify({"error": f"Database error: {str(db_error)}"}), 500
-        except Exception as term_error:
-            logger.error(f"Error fetching terms: {str(term_error)}")
-            return jsonify({"error": f"Error fetching analysis terms: {str(term_error)}"}), 500
-
         # Process text and find matches
-        analysis_results = []                                   
-        highlighted_text = extracted_text
-        input_text = extracted_text
-
         try:
-            for idx, term_info in enumerate(terms_data):
-                pattern = term_info["pattern"]
-                try:
-                    regex = re.compile(pattern, re.IGNORECASE)
-                except re.error:
-                    logger.warning(f"Invalid regex pattern: {pattern}")
-                    continue  # Skip this term if the pattern is invalid
-                
-                for match in regex.finditer(input_text):
-                    term_id = f"term-{idx}-{len(analysis_results)}"
-                    matched_term = match.group()
-                    
-                    # Analyze the context of the match
-                    try:
-                        confidence, context_note = analyze_term_context(input_text, match)
-                    except Exception as context_error:
-                        logger.warning(f"Error analyzing context: {str(context_error)}")
-                        confidence, context_note = 1.0, "Context analysis failed"
-                    
-                    analysis_results.append({
-                        "id": term_id,
-                        "term": matched_term,
-                        "feedback": term_info["feedback"],
-                        "category": term_info["category"] or "General",
-                        "source": term_info["source"] or "Internal",
-                        "confidence": confidence,
-                        "context_note": context_note
-                    })
-                    
-                    # Create highlight span with data attributes
-                    confidence_class = "high-confidence"
-                    if confidence < 0.7:
-                        confidence_class = "medium-confidence"
-                    if confidence < 0.3:
-                        confidence_class = "low-confidence"
-                        
-                    highlight_span = f'<span class="highlight {confidence_class}" data-id="{term_id}" data-feedback="{term_info["feedback"]}" data-category="{term_info["category"] or "General"}" data-source="{term_info["source"] or "Internal"}" data-confidence="{confidence}" data-context="{context_note}">{matched_term}</span>'
-                    
-                    # Replace this occurrence only
-                    start_pos = match.start()
-                    end_pos = match.end()
-                    highlighted_text = highlighted_text[:start_pos] + highlight_span + highlighted_text[end_pos:]
-                    
-                    # Adjust input text to prevent overlapping highlights
-                    input_text = input_text[:start_pos] + ' ' * len(matched_term) + input_text[end_pos:]
-
-            # Analyze topics in the extracted text
-            try:
-                topics_analysis = analyze_topics(extracted_text, topics_data)
-            except Exception as topics_error:
-                logger.warning(f"Error analyzing topics: {str(topics_error)}")
-                topics_analysis = {}  # Use empty dict if topic analysis fails
-
-            return jsonify({
-                "input_text": highlighted_text,
-                "analysis": analysis_results,
-                "topics": topics_analysis,
-                "original_text": extracted_text  # Include original text for report
-            })
+            if compact:
+                # The client has no copy of the extracted text, so the compact format carries it once
+                response = dict(analyze_document_compact(extracted_text, catalog, timer=g.timer), text=extracted_text)
+            else:
+                response = analyze_document(extracted_text, catalog, highlight=highlight, timer=g.timer)
+            return cached_json_response(result_cache.stream(cache_key, response))
 
         except Exception as analysis_error:
             logger.error(f"Error analyzing text: {str(analysis_error)}")
@@ -524,50 +352,486 @@ def upload_file():
         logger.error(f"Error while processing file: {str(e)}")
         return jsonify({"error": f"An error occurred while processing the file: {str(e)}"}), 500
 
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analyze many documents in one request across a pool of worker processes.
+    Accepts a JSON body {"texts": [...]} or a multipart form with repeated 'texts' fields and 'files' uploads.
+    Returns one result per document, texts first and then files, each in the order received.
+    """
+    try:
+        logger.info("Batch analyze endpoint accessed.")
+        if request.is_json:
+            data = request.get_json(silent=True) or {}
+            texts = data.get('texts', [])
+            files = []
+            highlight = highlight_requested(data.get('highlight', request.args.get('highlight')))
+        else:
+            texts = request.form.getlist('texts')
+            files = request.files.getlist('files')
+            highlight = highlight_requested(request.values.get('highlight'))
+
+        if not isinstance(texts, list):
+            logger.warning("Invalid texts field in batch request")
+            return jsonify({"error": "The 'texts' field must be a list of strings"}), 400
+
+        document_count = len(texts) + len(files)
+        if document_count == 0:
+            logger.warning("Empty batch received")
+            return jsonify({"error": "Please provide at least one text or file to analyze"}), 400
+
+        if document_count > app.config['MAX_BATCH_DOCUMENTS']:
+            logger.warning(f"Batch of {document_count} documents exceeds the limit")
+            return jsonify({"error": f"A batch may contain at most {app.config['MAX_BATCH_DOCUMENTS']} documents"}), 400
+
+        # Get the cached term catalog; it is only reloaded when terms.db changes
+        catalog = catalog_cache.get()
+        if catalog.error:
+            logger.error(f"Term catalog unavailable during batch analyze: {catalog.error}")
+            return jsonify({"error": catalog.error}), 500
+
+        # Validate each document; invalid ones get an error result without failing the batch
+        results = [None] * document_count
+        names = [None] * len(texts) + [file.filename for file in files]
+        items = []
+        positions = []
+        for position, text in enumerate(texts):
+            if not isinstance(text, str) or not text.strip():
+                results[position] = {"error": "Please enter some text to analyze"}
+                continue
+            items.append({"text": text, "highlight": highlight})
+            positions.append(position)
+
+        for position, file in enumerate(files, start=len(texts)):
+            if not file.filename or not allowed_file(file.filename):
+                results[position] = {"error": "Invalid file type. Only .txt, .docx, and .pdf files are supported."}
+                continue
+            items.append({"filename": secure_filename(file.filename), "content": file.read(), "highlight": highlight})
+            positions.append(position)
+
+        for position, result in zip(positions, batch_analyzer.analyze(items, catalog)):
+            results[position] = result
+
+        for position, result in enumerate(results):
+            result["index"] = position
+            result["name"] = names[position]
+
+        logger.info(f"Batch of {document_count} documents analyzed")
+        return jsonify({"results": results})
+
+    except Exception as e:
+        logger.error(f"Unexpected error in batch analyze route: {str(e)}")
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+
+@app.route('/analyze/stream', methods=['POST'])
+def analyze_stream():
+    """
+    Analyze a large document in overlapping chunks and stream the findings back as newline-delimited JSON.
+    Accepts the same JSON body as /analyze or the same multipart 'file' upload as /upload.
+    Each line is a record: 'finding' and 'progress' records while scanning, then 'topics' and 'done'.
+    Like every other endpoint, the text is analyzed exactly as sent, so offsets index into it unstripped.
+    """
+    try:
+        logger.info("Stream analyze endpoint accessed.")
+        if 'file' in request.files:
+            file = request.files['file']
+            if file.filename == '' or not allowed_file(file.filename):
+                logger.warning(f"Invalid file type: {file.filename}")
+                return jsonify({"error": "Invalid file type. Only .txt, .docx, and .pdf files are supported."}), 400
+
+            filename = secure_filename(file.filename)
+            if filename.endswith('.pdf'):
+                # Start analyzing the first pages while later pages are still being extracted
+                # The upload is read now because the request's file is closed once the response starts
+                content = io.BytesIO(file.read())
+                pieces = (page_text for _, page_text in iter_pdf_pages(content))
+            else:
+                pieces = iter([extract_text(filename, file.stream)])
+        else:
+            data = request.get_json(silent=True)
+            if not data or 'text' not in data or not isinstance(data['text'], str):
+                logger.warning("Invalid or missing text field")
+                return jsonify({"error": "Invalid text format"}), 400
+
+            input_text = data['text']
+            if not input_text.strip():
+                logger.warning("Empty text received")
+                return jsonify({"error": "Please enter some text to analyze"}), 400
+            pieces = split_text(input_text, app.config['STREAM_CHUNK_SIZE'])
+
+        # Get the cached term catalog; it is only reloaded when terms.db changes
+        catalog = catalog_cache.get()
+        if catalog.error:
+            logger.error(f"Term catalog unavailable during stream analyze: {catalog.error}")
+            return jsonify({"error": catalog.error}), 500
+
+        chunk_size = app.config['STREAM_CHUNK_SIZE']
+        overlap = app.config['STREAM_CHUNK_OVERLAP']
+
+        def generate():
+            try:
+                for record in iter_chunked_analysis(pieces, catalog, chunk_size, overlap):
+                    yield json.dumps(record) + "\n"
+            except Exception as stream_error:
+                logger.error(f"Error during streamed analysis: {str(stream_error)}")
+                yield json.dumps({"type": "error", "error": f"Error during text analysis: {str(stream_error)}"}) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+    except Exception as e:
+        logger.error(f"Unexpected error in stream analyze route: {str(e)}")
+        return jsonify({"error": f"An unexpected error occurred: {str(e)}"}), 500
+
+def run_text_job(progress, text, highlight):
+    """Job body for text submitted to /jobs; returns the same response as /analyze."""
+    catalog = catalog_cache.get()
+    if catalog.error:
+        raise Exception(catalog.error)
+    progress(stage='analyzing')
+    cache_key = text_cache_key(text, catalog, highlight)
+    body = result_cache.get(cache_key)
+    if body is None:
+        response = analyze_document(text, catalog, highlight=highlight)
+        result_cache.put(cache_key, response)
+    else:
+        logger.info("Analysis served from the result cache")
+        response = decode_response(body)
+    progress(matches_found=len(response['analysis']))
+    return response
+
+def run_upload_job(progress, filename, stream, file_hash, highlight):
+    """Job body for a file submitted to /jobs; returns the same response as /upload."""
+    try:
+        catalog = catalog_cache.get()
+        if catalog.error:
+            raise Exception(catalog.error)
+
+        cache_key = upload_cache_key(file_hash, filename, catalog, highlight)
+        body = result_cache.get(cache_key)
+        if body is None:
+            progress(stage='extracting')
+            try:
+                extracted_text = extract_upload_text(
+                    filename, stream, file_hash, on_page=lambda number: progress(pages_extracted=number)
+                )
+            except Exception as extract_error:
+                raise Exception(f"Failed to extract text from the file: {str(extract_error)}")
+            if not extracted_text or len(extracted_text.strip()) == 0:
+                raise Exception("Could not extract text from the file. The file may be empty or in an unsupported format.")
+
+            progress(stage='analyzing')
+            response = analyze_document(extracted_text, catalog, highlight=highlight)
+            result_cache.put(cache_key, response)
+        else:
+            logger.info(f"Analysis of {filename} served from the result cache")
+            response = decode_response(body)
+
+        progress(matches_found=len(response['analysis']))
+        return response
+    finally:
+        stream.close()
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue an analysis and return its job id right away.
+    Accepts a 'file' upload like /upload or a JSON body like /analyze; poll GET /jobs/<id> for the result.
+    """
+    logger.info("Job submission endpoint accessed.")
+    try:
+        job_store.expire()
+
+        if 'file' in request.files:
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({"error": "No file selected. Please choose a file to upload."}), 400
+            if not allowed_file(file.filename):
+                logger.warning(f"Invalid file type: {file.filename}")
+                return jsonify({"error": "Invalid file type. Only .txt, .docx, and .pdf files are supported."}), 400
+
+            filename = secure_filename(file.filename)
+            highlight = highlight_requested(request.values.get('highlight'))
+            file_hash = getattr(file.stream, 'sha256', None) or hash_stream(file.stream)
+
+            # The request's upload stream is closed when the request ends, so the job gets its own copy
+            stream = tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_THRESHOLD'])
+            file.stream.seek(0)
+            shutil.copyfileobj(file.stream, stream)
+            job_id = job_runner.submit('upload', run_upload_job, filename, stream, file_hash, highlight)
+            if job_id is None:
+                stream.close()
+        else:
+            data = request.get_json(silent=True)
+            if not data:
+                return jsonify({"error": "No data provided"}), 400
+            if 'text' not in data or not isinstance(data['text'], str):
+                return jsonify({"error": "Invalid text format"}), 400
+            if not data['text'].strip():
+                return jsonify({"error": "Please enter some text to analyze"}), 400
+
+            highlight = highlight_requested(data.get('highlight', request.args.get('highlight')))
+            job_id = job_runner.submit('analyze', run_text_job, data['text'], highlight)
+
+        if job_id is None:
+            logger.warning("Job queue is full")
+            return jsonify({"error": "Too many analysis jobs are pending. Please try again later."}), 503
+
+        logger.info(f"Job {job_id} queued")
+        response = jsonify({"job_id": job_id, "status": "queued"})
+        response.status_code = 202
+        response.headers['Location'] = f"/jobs/{job_id}"
+        return response
+
+    except Exception as e:
+        logger.error(f"Error while submitting job: {str(e)}")
+        return jsonify({"error": f"An error occurred while submitting the job: {str(e)}"}), 500
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return the status and progress of a job, and its result once it is done."""
+    try:
+        job = job_store.get(job_id)
+        if job is None:
+            return jsonify({"error": "Job not found. It may have expired."}), 404
+        return json_response(job)
+    except Exception as e:
+        logger.error(f"Error while reading job {job_id}: {str(e)}")
+        return jsonify({"error": f"An error occurred while reading the job: {str(e)}"}), 500
+
+
+@app.route('/sessions', methods=['POST'])
+def create_session():
+    """
+    Start a live editor session: analyze the text in full and keep it, so later edits are re-analyzed
+    incrementally through POST /sessions/<id>/edits. An existing session with the same document_id is replaced.
+    """
+    logger.info("Session creation endpoint accessed.")
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            return jsonify({"error": "No data provided"}), 400
+        if 'text' not in data or not isinstance(data['text'], str):
+            return jsonify({"error": "Invalid text format"}), 400
+        document_id = data.get('document_id')
+        if document_id is not None and (not isinstance(document_id, str) or not document_id):
+            return jsonify({"error": "Invalid document_id"}), 400
+
+        with g.timer.stage('catalog'):
+            catalog = catalog_cache.get()
+        if catalog.error:
+            logger.error(f"Term catalog unavailable during session creation: {catalog.error}")
+            return jsonify({"error": catalog.error}), 500
+
+        session = session_store.create(data['text'], catalog, document_id, timer=g.timer)
+        with session.lock:
+            response = session.describe(session.findings, catalog)
+            response.update(document_id=session.document_id, version=session.version, topics=session.topics())
+        response = json_response(response, 201)
+        response.headers['Location'] = f"/sessions/{session.document_id}"
+        return response
+
+    except Exception as e:
+        logger.error(f"Error while creating session: {str(e)}")
+        return jsonify({"error": f"An error occurred while creating the session: {str(e)}"}), 500
+
+
+@app.route('/sessions/<document_id>/edits', methods=['POST'])
+def edit_session(document_id):
+    """
+    Apply edits to a session's text and re-analyze only the sentences around them.
+    Expects {"version": n, "edits": [{"start", "end", "text"}]}, with offsets in characters of version n
+    of the text. Returns the ids of the findings that were removed, the findings that were added, and
+    shift {"from", "delta"}: every other finding that started at or after "from" moved by "delta".
+    If the whole document had to be re-analyzed, e.g. because the terms changed, "reset" is true and
+    every previous finding is listed in "removed".
+    """
+    try:
+        session = session_store.get(document_id)
+        if session is None:
+            return jsonify({"error": "Session not found. It may have expired."}), 404
+
+        data = request.get_json(silent=True)
+        if not data or not isinstance(data.get('edits'), list):
+            return jsonify({"error": "No edits provided"}), 400
+
+        with g.timer.stage('catalog'):
+            catalog = catalog_cache.get()
+        if catalog.error:
+            logger.error(f"Term catalog unavailable during session edit: {catalog.error}")
+            return jsonify({"error": catalog.error}), 500
+
+        with session.lock:
+            if data.get('version') != session.version:
+                return jsonify({
+                    "error": "The session has changed since this version. Send the edits again against the current text.",
+                    "version": session.version
+                }), 409
+            try:
+                removed, added, shift = session.edit(data['edits'], catalog, timer=g.timer)
+            except EditError as edit_error:
+                return jsonify({"error": str(edit_error)}), 400
+            if not session_store.save(session):
+                # Another process applied an edit first; the client resends against the stored version
+                current = session_store.get(document_id)
+                if current is None:
+                    return jsonify({"error": "Session not found. It may have expired."}), 404
+                return jsonify({
+                    "error": "The session has changed since this version. Send the edits again against the current text.",
+                    "version": current.version
+                }), 409
+
+            g.timer.count('findings_removed', len(removed))
+            g.timer.count('findings_added', len(added))
+            response = session.describe(added, catalog)
+            response["added"] = response.pop("findings")
+            response.update(
+                removed=removed,
+                shift={"from": shift[0], "delta": shift[1]} if shift else None,
+                reset=shift is None,
+                version=session.version,
+                topics=session.topics()
+            )
+        return json_response(response)
+
+    except Exception as e:
+        logger.error(f"Error while editing session {document_id}: {str(e)}")
+        return jsonify({"error": f"An error occurred while updating the session: {str(e)}"}), 500
+
+
+@app.route('/sessions/<document_id>', methods=['DELETE'])
+def delete_session(document_id):
+    """End a live editor session."""
+    if not session_store.delete(document_id):
+        return jsonify({"error": "Session not found. It may have expired."}), 404
+    return jsonify({"document_id": document_id, "status": "deleted"})
+
+
 def verify_database():
     """
     Verify that the database exists and has the required tables.
     Returns a tuple (success, error_message).
     """
-    if not os.path.exists('terms.db'):
-        return False, "Database file 'terms.db' not found"
+    if not os.path.exists(db.DB_PATH):
+        return False, f"Database file '{db.DB_PATH}' not found"
     
     try:
-        conn = sqlite3.connect('terms.db')
+        conn = db.read_connection()
         cursor = conn.cursor()
         
         # Check if the problematic_terms table exists
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='problematic_terms'")
         if not cursor.fetchone():
-            conn.close()
+            cursor.close()
             return False, "Required table 'problematic_terms' not found in database"
         
         # Check if the topics table exists
         cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='topics'")
         if not cursor.fetchone():
-            conn.close()
+            cursor.close()
             return False, "Required table 'topics' not found in database"
         
         # Check if there's data in the problematic_terms table
         cursor.execute("SELECT COUNT(*) FROM problematic_terms")
         if cursor.fetchone()[0] == 0:
-            conn.close()
+            cursor.close()
             return False, "No terms found in the 'problematic_terms' table"
         
-        conn.close()
+        version = schema.schema_version(conn)
+        if version < schema.SCHEMA_VERSION:
+            logger.warning(f"Database schema version {version} is older than {schema.SCHEMA_VERSION}; "
+                           f"run init_db.py to upgrade it in place")
+        
+        cursor.close()
         return True, ""
     except sqlite3.Error as e:
         return False, f"Database error: {str(e)}"
     except Exception as e:
         return False, f"Error verifying database: {str(e)}"
 
-# Verify database on startup
-db_ok, db_error = verify_database()
-if not db_ok:
-    logger.error(f"Database verification failed: {db_error}")
-    logger.warning("Application may not function correctly without a properly initialized database")
-else:
-    logger.info("Database verification successful")
+def load_catalog(version):
+    """
+    Build a Catalog snapshot of the problematic terms and topics for the catalog cache.
+    Verification and query failures are recorded on the snapshot rather than raised.
+    """
+    db_ok, db_error = verify_database()
+    if not db_ok:
+        logger.error(f"Database verification failed: {db_error}")
+        return Catalog(version, error=f"Database error: {db_error}")
+
+    try:
+        catalog = load_or_build_catalog(app.config['CATALOG_ARTIFACT'], version)
+    except sqlite3.Error as db_error:
+        logger.error(f"Database error: {str(db_error)}")
+        return Catalog(version, error=f"Database error: {str(db_error)}")
+
+    if not catalog.terms:
+        logger.warning("No terms found in database")
+        return Catalog(version, error="No analysis terms available in the database. Analysis cannot be performed.")
+    return catalog
+
+catalog_cache = None                                            # Process-wide term catalog, rebuilt when terms.db changes.
+result_cache = None                                             # Cache of analysis responses by input hash.
+text_cache = None                                               # Extracted text by upload hash.
+batch_analyzer = None                                           # Worker processes for /analyze/batch, started on first use.
+metrics = None                                                  # Stage timing histograms and counters served at /metrics.
+job_store = None                                                # Job state, shared by every process using the same file.
+job_runner = None                                               # Threads that run queued jobs.
+session_store = None                                            # Live editor documents, re-analyzed incrementally.
+
+
+def create_app():
+    """
+    Set up logging and the process-wide state the routes share, warm the catalog, and return the app.
+    Called once by the process that serves requests (the __main__ block below, or serve.py) rather than
+    on import: the extraction and batch pool workers import the main module again, and must not repeat it.
+    """
+    global catalog_cache, result_cache, text_cache, batch_analyzer, metrics, job_store, job_runner, session_store
+    if catalog_cache is not None:
+        return app
+
+    configure_logging(                                              # Log through a queue to a background listener thread.
+        level=getattr(logging, os.environ.get('LOG_LEVEL', 'INFO').upper(), logging.INFO),
+        log_file=os.environ.get('LOG_FILE', 'app.log'),             # Rotated log file; empty logs to the console only
+        max_bytes=int(os.environ.get('LOG_MAX_BYTES', LOG_MAX_BYTES)),
+        backup_count=int(os.environ.get('LOG_BACKUP_COUNT', LOG_BACKUP_COUNT)),
+        json_format=os.environ.get('LOG_FORMAT', 'json') == 'json'  # One JSON object per line, or 'text'
+    )
+
+    catalog_cache = CatalogCache(load_catalog, db.DB_PATH)
+    result_cache = ResultCache(app.config['RESULT_CACHE_MAX_BYTES'], app.config['RESULT_CACHE_DB'])
+    text_cache = TextCache(app.config['TEXT_CACHE_DIR'], app.config['TEXT_CACHE_MAX_BYTES']) if app.config['TEXT_CACHE_DIR'] else None
+    batch_analyzer = BatchAnalyzer(app.config['BATCH_WORKERS'], app.config['TEXT_CACHE_DIR'], app.config['TEXT_CACHE_MAX_BYTES'], app.config['CATALOG_ARTIFACT'])
+
+    metrics = SharedMetrics(app.config['METRICS_DB']) if app.config['METRICS_DB'] else Metrics()
+    job_store = JobStore(app.config['JOBS_DB'], app.config['JOB_TTL'])
+    job_runner = JobRunner(job_store, app.config['JOB_WORKERS'], app.config['MAX_PENDING_JOBS'])
+    session_store = SessionStore(app.config['MAX_SESSIONS'], app.config['SESSION_TTL'], app.config['SESSIONS_DB'])
+
+    # Verify database on startup
+    db_ok, db_error = verify_database()
+    if not db_ok:
+        logger.error(f"Database verification failed: {db_error}")
+        logger.warning("Application may not function correctly without a properly initialized database")
+    else:
+        logger.info("Database verification successful")
+        catalog_cache.get()                                         # Warm the catalog before serving requests.
+
+    if app.config['PRELOAD_NLP']:
+        segmentation.get_tokenizers()                               # Locate NLTK data once, before any worker forks.
+        preload_extractors()
+
+    startup_time = time.perf_counter() - STARTUP_STARTED
+    if startup_time > app.config['STARTUP_TIME_BUDGET']:
+        logger.warning(f"Startup took {startup_time:.2f}s, over the {app.config['STARTUP_TIME_BUDGET']:.2f}s budget")
+    else:
+        logger.info(f"Startup took {startup_time:.2f}s")
+
+    return app
+
 
 if __name__ == "__main__":
-    app.run(debug=True)  # Run the app in debug mode.
+    create_app().run(debug=True)  # Run the app in debug mode.
@@ -0,0 +1,212 @@
+import hashlib
+import io
+import logging
+import os
+import signal
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import analysis
+import extraction
+from catalog import Catalog
+from catalog_artifact import load_artifact
+from extraction import extract_text
+from logging_setup import init_pool_logging, pool_log_queue
+from text_cache import TextCache
+
+logger = logging.getLogger(__name__)
+
+_worker_catalog = None                                          # Catalog preloaded in each worker process.
+_worker_text_cache = None                                       # Extracted text cache shared with the web process.
+
+
+def _init_worker(version, terms, topics, text_cache_dir=None, text_cache_max_bytes=0, artifact=None, log_queue=None,
+                 log_level=logging.WARNING):
+    """
+    Build the worker's catalog (and compile its matcher) once, when the worker process starts.
+    artifact is an optional (path, digest) of a prebuilt catalog to load instead, if it still holds those terms.
+    log_queue and log_level are passed on to init_pool_logging().
+    """
+    global _worker_catalog, _worker_text_cache
+    init_pool_logging(log_queue, log_level)
+    extraction.PDF_WORKERS = 1                                  # Batch workers already run in parallel.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)                # The parent process decides when workers stop.
+    _worker_catalog = load_artifact(artifact[0], version, artifact[1]) if artifact else None
+    if _worker_catalog is None:
+        _worker_catalog = Catalog(version, terms, topics)
+    if text_cache_dir:
+        _worker_text_cache = TextCache(text_cache_dir, text_cache_max_bytes)
+
+
+def analyze_item(item):
+    """
+    Analyze one batch document in a worker process.
+    item is a dict with either 'text' or 'filename' and 'content' (the raw file bytes), plus 'highlight'.
+    Returns the analysis response, or a dict with an 'error' message.
+    """
+    try:
+        if 'text' in item:
+            text = item['text']
+        else:
+            digest = hashlib.sha256(item['content']).hexdigest()
+            extension = os.path.splitext(item['filename'])[1]
+            text = _worker_text_cache.get(digest, extension) if _worker_text_cache else None
+            if text is None:
+                try:
+                    text = extract_text(item['filename'], io.BytesIO(item['content']))
+                except Exception as extract_error:
+                    return {"error": f"Failed to extract text from the file: {str(extract_error)}"}
+                if _worker_text_cache and text.strip():
+                    _worker_text_cache.put(digest, extension, text)
+
+        if not text or not text.strip():
+            return {"error": "Could not extract text from the document. It may be empty or in an unsupported format."}
+
+        return analysis.analyze_document(text, _worker_catalog, highlight=item['highlight'])
+    except Exception as e:
+        logger.error(f"Error analyzing batch document: {str(e)}")
+        return {"error": f"Error during text analysis: {str(e)}"}
+
+
+def scan_document(path):
+    """
+    Extract and analyze the file at path in a worker process, for the corpus scanner.
+    Returns a dict with the number of characters, every match (term, matched text, offsets, metadata,
+    confidence and context note) and the topics, or a dict with an 'error' message.
+    """
+    try:
+        text = extract_text(path.lower(), path)
+    except Exception as extract_error:
+        return {"error": f"Failed to extract text from the file: {str(extract_error)}"}
+    if not text or not text.strip():
+        return {"error": "Could not extract text from the document. It may be empty or in an unsupported format."}
+
+    try:
+        matches = []
+        terms = _worker_catalog.terms
+        for idx, start, end, confidence, context_note in analysis.score_matches(text, terms, _worker_catalog.matcher):
+            matches.append(dict(
+                analysis.compact_term_info(terms[idx]),
+                matched=text[start:end], start=start, end=end, confidence=confidence, context_note=context_note
+            ))
+        topics = analysis.analyze_topics(text, _worker_catalog.topics, topic_index=_worker_catalog.topic_index)
+        return {"characters": len(text), "matches": matches, "topics": topics}
+    except Exception as e:
+        logger.error(f"Error analyzing {path}: {str(e)}")
+        return {"error": f"Error during text analysis: {str(e)}"}
+
+
+class BatchAnalyzer:
+    """
+    Process pool for analyzing many documents at once.
+    Every worker is initialized with the current catalog, loaded from the artifact at artifact_path when
+    it holds the same terms; the pool is recreated when the catalog changes. Workers are started from
+    mp_context, by default extraction.pool_context(), since the web process that owns the pool runs threads.
+    """
+
+    def __init__(self, max_workers=None, text_cache_dir=None, text_cache_max_bytes=0, artifact_path=None, mp_context=None):
+        self.max_workers = max_workers
+        self.text_cache_dir = text_cache_dir
+        self.text_cache_max_bytes = text_cache_max_bytes
+        self.artifact_path = artifact_path
+        self.mp_context = mp_context
+        self._executor = None
+        self._version = None
+        self._lock = threading.Lock()
+
+    def _executor_for(self, catalog):
+        with self._lock:
+            if self._executor is None or self._version != catalog.version:
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                logger.info(f"Starting batch worker pool for catalog with {len(catalog.terms)} terms")
+                # Workers load the same artifact as this process, if it came from one
+                artifact = (self.artifact_path, catalog.digest) if self.artifact_path and catalog.digest else None
+                context = self.mp_context or extraction.pool_context()
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=context,
+                    initializer=_init_worker,
+                    initargs=(catalog.version, catalog.terms, catalog.topics, self.text_cache_dir, self.text_cache_max_bytes,
+                              artifact, pool_log_queue(context), logging.getLogger().getEffectiveLevel())
+                )
+                self._version = catalog.version
+            return self._executor
+
+    def _reset(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def analyze(self, items, catalog):
+        """
+        Analyze items across the pool and return their results in input order.
+        A failure in one document is reported in its own result and does not fail the batch.
+        """
+        executor = self._executor_for(catalog)
+        futures = [executor.submit(analyze_item, item) for item in items]
+
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except BrokenProcessPool as e:
+                logger.error(f"Batch worker pool failed: {str(e)}")
+                self._reset(executor)
+                results.append({"error": "The analysis worker stopped unexpectedly"})
+            except Exception as e:
+                logger.error(f"Error in batch worker: {str(e)}")
+                results.append({"error": f"Error during text analysis: {str(e)}"})
+        return results
+
+    def scan(self, documents, catalog, window=None, stop=None):
+        """
+        Run scan_document() across the pool for documents, an iterable of tuples whose first item is a
+        file path, and yield (document, result) pairs in the order the files finish. At most window
+        files (by default four per worker) are in flight, so documents can be a lazy directory walk.
+        Once stop (a threading.Event) is set, the files not started yet are dropped and no more are
+        taken, but the results of the files already running are still yielded.
+        """
+        window = window or 4 * (self.max_workers or os.cpu_count() or 1)
+        documents = iter(documents)
+        pending = {}                # future -> (document, executor)
+        exhausted = False
+        try:
+            while True:
+                if stop is not None and stop.is_set() and not exhausted:
+                    exhausted = True
+                    for future in [future for future in pending if future.cancel()]:
+                        del pending[future]
+                while not exhausted and len(pending) < window:
+                    document = next(documents, None)
+                    if document is None:
+                        exhausted = True
+                        break
+                    executor = self._executor_for(catalog)
+                    pending[executor.submit(scan_document, document[0])] = (document, executor)
+                if not pending:
+                    return
+
+                done, _ = wait(pending, timeout=None if stop is None else 0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    document, executor = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as e:
+                        logger.error(f"Batch worker pool failed while scanning {document[0]}: {str(e)}")
+                        self._reset(executor)
+                        result = {"error": "The analysis worker stopped unexpectedly"}
+                    except Exception as e:
+                        result = {"error": f"Error during text analysis: {str(e)}"}
+                    yield document, result
+        finally:
+            # Files not started yet are dropped when the caller stops early
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
@@ -0,0 +1,328 @@
+"""
+Micro-benchmarks for the analysis pipeline.
+
+Generates a synthetic term catalog and corpus for every combination of --terms and --words, times
+each stage of the pipeline separately and writes the timings as JSON. With --baseline, the timings
+are compared against an earlier run and the script exits with status 1 if any stage slowed down by
+more than --threshold. Independently of any baseline, the run also fails if a stage scales worse
+than --max-exponent with the document size (time ~ words ** exponent), which catches accidental
+quadratic behaviour on any machine.
+
+Example:
+    python benchmark.py --terms 10,1000,50000 --words 1000,50000 --output before.json
+    python benchmark.py --terms 10,1000,50000 --words 1000,50000 --baseline before.json
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import platform
+import random
+import statistics
+import sys
+import textwrap
+import time
+
+import analysis
+from catalog import Catalog
+from context_index import BENIGN_CONTEXT_INDICATORS
+from extraction import extract_text_from_docx, extract_text_from_pdf
+from highlight import render_highlighted_text
+
+# Syllables for catalog terms and for filler words; the sets are disjoint so filler never hits a term
+TERM_SYLLABLES = ['ka', 'lo', 'mi', 'ru', 'te', 'za', 'no', 'vi', 'pe', 'su', 'do', 'ge', 'ha', 'jo', 'bu',
+                  'fi', 'xo', 'qua', 'wen', 'tor']
+FILLER_SYLLABLES = ['an', 'el', 'is', 'om', 'ut', 'ar', 'en', 'il', 'on', 'ur', 'ab', 'ec', 'id', 'ob', 'ud']
+
+PATTERN_KINDS = ('literal', 'phrase', 'regex')
+
+
+def make_words(syllables, count, rng, min_syllables=2, max_syllables=4):
+    """Return count distinct pseudo-words built from syllables."""
+    words = set()
+    while len(words) < count:
+        words.add(''.join(rng.choice(syllables) for _ in range(rng.randint(min_syllables, max_syllables))))
+    return sorted(words)
+
+
+def make_catalog(term_count, filler, rng):
+    """
+    Build a Catalog with term_count terms: mostly word-bounded literals, plus multi-word phrases and
+    custom regex patterns, the same mix as a curated terms.db. Topics are drawn from the filler words.
+    """
+    words = make_words(TERM_SYLLABLES, term_count, rng)
+    terms = []
+    for idx, word in enumerate(words):
+        kind = rng.choices(PATTERN_KINDS, weights=(85, 10, 5))[0]
+        if kind == 'phrase':
+            word = f"{word} {rng.choice(words)}"
+            pattern = r'\b' + word + r'\b'
+        elif kind == 'regex':
+            pattern = r'\b' + word + r'(?:s|es)?\b'
+        else:
+            pattern = r'\b' + word + r'\b'
+        terms.append({
+            "term": word,
+            "pattern": pattern,
+            "feedback": f"Consider an alternative to '{word}'.",
+            "category": rng.choice(['Gender', 'Race', 'Disability', None]),
+            "source": rng.choice(['Style guide', None])
+        })
+
+    topics = {
+        f"Topic {number}": [rng.choice(filler) for _ in range(10)] + [f"{rng.choice(filler)} {rng.choice(filler)}"]
+        for number in range(20)
+    }
+    return Catalog(('benchmark', term_count), terms, topics)
+
+
+def make_corpus(word_count, density, catalog, filler, rng):
+    """
+    Build a document of word_count words in which about density of the words are catalog terms.
+    About one word in a hundred is a benign context indicator.
+    """
+    sentences = []
+    sentence = []
+    for _ in range(word_count):
+        if rng.random() < density:
+            sentence.append(rng.choice(catalog.terms)["term"])
+        elif rng.random() < 0.01:
+            sentence.append(rng.choice(BENIGN_CONTEXT_INDICATORS))
+        else:
+            sentence.append(rng.choice(filler))
+        if len(sentence) >= rng.randint(8, 25):
+            sentences.append(' '.join(sentence).capitalize() + '.')
+            sentence = []
+    if sentence:
+        sentences.append(' '.join(sentence).capitalize() + '.')
+    return ' '.join(sentences)
+
+
+def make_docx(text, paragraph_words=120):
+    """Return the bytes of a DOCX file containing text, split into paragraphs."""
+    import docx
+    document = docx.Document()
+    words = text.split(' ')
+    for first in range(0, len(words), paragraph_words):
+        document.add_paragraph(' '.join(words[first:first + paragraph_words]))
+    output = io.BytesIO()
+    document.save(output)
+    return output.getvalue()
+
+
+def make_pdf(text, lines_per_page=60, line_length=95):
+    """Return the bytes of a minimal PDF with text laid out in Helvetica, one content stream per page."""
+    lines = textwrap.wrap(text, line_length) or ['']
+    pages = [lines[first:first + lines_per_page] for first in range(0, len(lines), lines_per_page)]
+
+    def escape(line):
+        return line.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+    # Objects 1-3 are the catalog, the page tree and the font; each page adds a page and a content object
+    bodies = {3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    number = 4
+    for page_lines in pages:
+        stream = "BT /F1 9 Tf 11 TL 36 806 Td " + ' '.join(f"({escape(line)}) Tj T*" for line in page_lines) + " ET"
+        bodies[number] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                          f"/Resources << /Font << /F1 3 0 R >> >> /Contents {number + 1} 0 R >>")
+        bodies[number + 1] = f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"
+        kids.append(number)
+        number += 2
+    bodies[1] = "<< /Type /Catalog /Pages 2 0 R >>"
+    bodies[2] = f"<< /Type /Pages /Kids [{' '.join(f'{kid} 0 R' for kid in kids)}] /Count {len(kids)} >>"
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for object_number in range(1, number):
+        offsets.append(output.tell())
+        output.write(f"{object_number} 0 obj\n{bodies[object_number]}\nendobj\n".encode('latin-1'))
+    xref = output.tell()
+    output.write(f"xref\n0 {number}\n0000000000 65535 f \n".encode('latin-1'))
+    for offset in offsets:
+        output.write(f"{offset:010d} 00000 n \n".encode('latin-1'))
+    output.write(f"trailer\n<< /Size {number} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1'))
+    return output.getvalue()
+
+
+def time_stage(func, repeat):
+    """Run func repeat times; return the minimum and median wall time in seconds and the last return value."""
+    timings = []
+    value = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        value = func()
+        timings.append(time.perf_counter() - started)
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": repeat}, value
+
+
+def record(results, stage, terms, words, density, timing):
+    key = f"{stage}[terms={terms},words={words}]"
+    results[key] = dict(timing, stage=stage, terms=terms, words=words, density=density)
+    print(f"{key:<52} min {timing['min'] * 1000:10.2f} ms   median {timing['median'] * 1000:10.2f} ms")
+
+
+def run_benchmarks(term_counts, word_counts, density, repeat, seed, extraction=True):
+    """Time every stage for every (terms, words) combination. Returns the results keyed by stage and size."""
+    results = {}
+    rng = random.Random(seed)
+    filler = make_words(FILLER_SYLLABLES, 2000, rng)
+
+    for term_count in term_counts:
+        catalog = make_catalog(term_count, filler, random.Random(seed))
+        # Compiling the matcher and topic index is what the web app pays whenever terms.db changes
+        timing, _ = time_stage(lambda: Catalog(catalog.version, catalog.terms, catalog.topics), repeat)
+        record(results, 'catalog_build', term_count, 0, density, timing)
+
+        for word_count in word_counts:
+            text = make_corpus(word_count, density, catalog, filler, random.Random(seed + word_count))
+
+            timing, matches = time_stage(lambda: catalog.matcher.find_matches(text), repeat)
+            record(results, 'match', term_count, word_count, density, timing)
+
+            spans = [(start, end) for _, start, end in matches]
+            timing, contexts = time_stage(lambda: analysis.analyze_term_contexts(text, spans), repeat)
+            record(results, 'context', term_count, word_count, density, timing)
+
+            timing, _ = time_stage(
+                lambda: analysis.analyze_topics(text, catalog.topics, topic_index=catalog.topic_index), repeat
+            )
+            record(results, 'topics', term_count, word_count, density, timing)
+
+            highlights = [
+                (start, end, analysis.build_analysis_result(
+                    catalog.terms[idx], f"term-{idx}-{position}", text[start:end], confidence, context_note
+                ))
+                for position, ((idx, start, end), (confidence, context_note)) in enumerate(zip(matches, contexts))
+            ]
+            timing, _ = time_stage(lambda: render_highlighted_text(text, highlights), repeat)
+            record(results, 'highlight', term_count, word_count, density, timing)
+
+    if extraction:
+        catalog = make_catalog(term_counts[0], filler, random.Random(seed))
+        for word_count in word_counts:
+            text = make_corpus(word_count, density, catalog, filler, random.Random(seed + word_count))
+            docx_bytes = make_docx(text)
+            timing, _ = time_stage(lambda: extract_text_from_docx(io.BytesIO(docx_bytes)), repeat)
+            record(results, 'extract_docx', 0, word_count, density, timing)
+
+            pdf_bytes = make_pdf(text)
+            timing, _ = time_stage(lambda: extract_text_from_pdf(io.BytesIO(pdf_bytes)), repeat)
+            record(results, 'extract_pdf', 0, word_count, density, timing)
+
+    return results
+
+
+def scaling_exponents(results, min_time):
+    """
+    Estimate, for every stage and catalog size, the exponent k in time ~ words ** k between the smallest
+    and the largest document. Stages faster than min_time at the largest size are too noisy and are skipped.
+    """
+    series = {}
+    for entry in results.values():
+        if entry["words"]:
+            series.setdefault(f"{entry['stage']}[terms={entry['terms']}]", []).append((entry["words"], entry["min"]))
+
+    exponents = {}
+    for key, points in series.items():
+        points.sort()
+        (small_words, small_time), (large_words, large_time) = points[0], points[-1]
+        if large_words == small_words or large_time < min_time or small_time <= 0:
+            continue
+        exponents[key] = math.log(large_time / small_time) / math.log(large_words / small_words)
+    return exponents
+
+
+def compare(current, baseline, threshold, min_delta, max_exponent, exponent_tolerance):
+    """Return a list of regression messages for current against baseline and the exponent limits."""
+    regressions = []
+    for key, entry in current["results"].items():
+        previous = (baseline or {}).get("results", {}).get(key)
+        if previous is None or previous["min"] <= 0:
+            continue
+        ratio = entry["min"] / previous["min"]
+        entry["baseline_min"] = previous["min"]
+        entry["ratio"] = ratio
+        if ratio > threshold and entry["min"] - previous["min"] > min_delta:
+            regressions.append(f"{key}: {previous['min'] * 1000:.2f} ms -> {entry['min'] * 1000:.2f} ms ({ratio:.2f}x)")
+
+    for key, exponent in current["scaling"].items():
+        if exponent > max_exponent:
+            regressions.append(f"{key}: time grows as words ** {exponent:.2f}, above the limit of {max_exponent:.2f}")
+        previous = (baseline or {}).get("scaling", {}).get(key)
+        if previous is not None and exponent > previous + exponent_tolerance:
+            regressions.append(f"{key}: scaling exponent rose from {previous:.2f} to {exponent:.2f}")
+    return regressions
+
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(',') if size]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the analysis pipeline.")
+    parser.add_argument('--terms', type=parse_sizes, default=[10, 1000, 10000, 50000],
+                        help="comma-separated catalog sizes (default: 10,1000,10000,50000)")
+    parser.add_argument('--words', type=parse_sizes, default=[1000, 10000, 50000],
+                        help="comma-separated document sizes in words (default: 1000,10000,50000)")
+    parser.add_argument('--density', type=float, default=0.02, help="fraction of words that are catalog terms")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage; the minimum is compared")
+    parser.add_argument('--seed', type=int, default=1, help="seed for the synthetic catalog and corpus")
+    parser.add_argument('--no-extraction', action='store_true', help="skip the DOCX and PDF extraction stages")
+    parser.add_argument('--output', default='benchmark_results.json', help="file the results are written to")
+    parser.add_argument('--baseline', help="results of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help="fail if a stage is this many times slower than the baseline (default: 1.5)")
+    parser.add_argument('--min-delta', type=float, default=0.002,
+                        help="ignore slowdowns smaller than this many seconds (default: 0.002)")
+    parser.add_argument('--max-exponent', type=float, default=1.4,
+                        help="fail if a stage scales worse than words ** this (default: 1.4)")
+    parser.add_argument('--exponent-tolerance', type=float, default=0.25,
+                        help="fail if a scaling exponent rises by more than this over the baseline (default: 0.25)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR, format="%(asctime)s [%(levelname)s] %(message)s")
+
+    results = run_benchmarks(args.terms, args.words, args.density, args.repeat, args.seed,
+                             extraction=not args.no_extraction)
+    current = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "terms": args.terms,
+            "words": args.words,
+            "density": args.density,
+            "repeat": args.repeat,
+            "seed": args.seed
+        },
+        "results": results,
+        "scaling": scaling_exponents(results, args.min_delta)
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    regressions = compare(current, baseline, args.threshold, args.min_delta, args.max_exponent,
+                          args.exponent_tolerance)
+    current["regressions"] = regressions
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(current, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    for key, exponent in sorted(current["scaling"].items()):
+        print(f"{key:<40} scales as words ** {exponent:.2f}")
+    if regressions:
+        print("Performance regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+import db
+import schema
+from matcher import TermMatcher, TopicIndex
+
+logger = logging.getLogger(__name__)
+
+
+def database_version(db_path):
+    """
+    Return a cheap version token for the database: the size and modification time of the
+    database file and its write-ahead log. Any committed write changes at least one of them.
+    An empty write-ahead log, as created by the first reader, counts as no log.
+    """
+    token = []
+    for path in (db_path, db_path + '-wal'):
+        try:
+            stat = os.stat(path)
+            token.append((stat.st_mtime_ns, stat.st_size) if stat.st_size or path == db_path else None)
+        except OSError:
+            token.append(None)
+    return tuple(token)
+
+
+def get_problematic_terms():
+    """
+    Function to fetch problematic terms and feedback from the database.
+    Returns a list of term dictionaries or raises an exception if the database operation fails.
+    """
+    try:
+        conn = db.read_connection()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("""
+                SELECT t.term, t.pattern, t.feedback, c.name, s.name 
+                FROM problematic_terms t
+                LEFT JOIN categories c ON t.category_id = c.id
+                LEFT JOIN sources s ON t.source_id = s.id
+            """)
+            terms = cursor.fetchall()
+            
+            if not terms:
+                logger.warning("No problematic terms found in database")
+            
+            return [
+                {
+                    "term": term,
+                    "pattern": pattern or r'\b' + re.escape(term) + r'\b',
+                    "feedback": feedback,
+                    "category": category,
+                    "source": source
+                }
+                for term, pattern, feedback, category, source in terms
+            ]
+        except sqlite3.Error as query_error:
+            logger.error(f"SQL error in get_problematic_terms: {str(query_error)}")
+            raise
+        finally:
+            cursor.close()
+    except sqlite3.Error as conn_error:
+        logger.error(f"Database connection error in get_problematic_terms: {str(conn_error)}")
+        raise Exception(f"Failed to retrieve problematic terms from database: {str(conn_error)}")
+
+
+def get_topics():
+    """
+    Function to fetch topics and associated terms from the database.
+    Returns a dictionary of topics with their terms or raises an exception if the database operation fails.
+    """
+    try:
+        conn = db.read_connection()
+        cursor = conn.cursor()
+        
+        try:
+            if schema.schema_version(conn) < 2:
+                # Until init_db.py upgrades them, databases keep the terms as the comma-separated string
+                # that is edited, even where version 1 added a copy in topic_terms
+                cursor.execute("SELECT topic, terms FROM topics")
+                topics = cursor.fetchall()
+                
+                if not topics:
+                    logger.warning("No topics found in database")
+                    return {}
+                    
+                return {topic: terms.split(", ") for topic, terms in topics}
+
+            cursor.execute("""
+                SELECT t.topic, tt.term
+                FROM topics t
+                LEFT JOIN topic_terms tt ON tt.topic_id = t.id
+                ORDER BY t.id, tt.position
+            """)
+            topics = {}
+            for topic, term in cursor.fetchall():
+                terms = topics.setdefault(topic, [])
+                if term is not None:
+                    terms.append(term)
+
+            if not topics:
+                logger.warning("No topics found in database")
+            return topics
+        except sqlite3.Error as query_error:
+            logger.error(f"SQL error in get_topics: {str(query_error)}")
+            raise
+        finally:
+            cursor.close()
+    except sqlite3.Error as conn_error:
+        logger.error(f"Database connection error in get_topics: {str(conn_error)}")
+        raise Exception(f"Failed to retrieve topics from database: {str(conn_error)}")
+
+
+class Catalog:
+    """
+    Immutable snapshot of the term catalog: problematic terms, topics, the compiled matcher and topic index.
+    If the catalog could not be loaded, error holds the message to report to the client.
+    """
+
+    def __init__(self, version, terms=None, topics=None, error=None):
+        self.version = version
+        self.terms = terms or []
+        self.topics = topics or {}
+        self.error = error
+        self.digest = None          # Content digest of terms and topics, set for catalogs loaded from an artifact
+        self.matcher = TermMatcher(self.terms) if self.terms else None
+        self.topic_index = TopicIndex(self.topics)
+
+
+class CatalogCache:
+    """
+    Process-wide cache of the current Catalog.
+
+    loader(version) builds a new Catalog. get() compares the database version token on every call
+    and, when the database has changed, rebuilds the catalog in a background thread while the
+    previous snapshot keeps serving requests. The new snapshot is swapped in with a single
+    assignment, so readers always see a complete catalog.
+    """
+
+    def __init__(self, loader, db_path):
+        self.loader = loader
+        self.db_path = db_path
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self.watch = True           # False where the owner replaces the process when the database changes
+
+    def _rebuild(self, version):
+        try:
+            snapshot = self.loader(version)
+        except Exception as e:
+            logger.error(f"Error rebuilding term catalog: {str(e)}")
+            snapshot = Catalog(version, error=f"Error fetching analysis terms: {str(e)}")
+        self._snapshot = snapshot
+        logger.info(f"Term catalog loaded: {len(snapshot.terms)} terms, {len(snapshot.topics)} topics")
+        return snapshot
+
+    def _rebuild_in_background(self, version):
+        try:
+            self._rebuild(version)
+        finally:
+            with self._lock:
+                self._rebuilding = False
+
+    def get(self):
+        """Return the current Catalog, scheduling a rebuild if the database has changed."""
+        snapshot = self._snapshot
+        if not self.watch and snapshot is not None and not snapshot.error:
+            return snapshot
+        version = database_version(self.db_path)
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        # Nothing usable to serve yet, so load synchronously
+        if snapshot is None or snapshot.error:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is not None and snapshot.version == version:
+                    return snapshot
+                return self._rebuild(version)
+
+        with self._lock:
+            if not self._rebuilding:
+                self._rebuilding = True
+                threading.Thread(target=self._rebuild_in_background, args=(version,), daemon=True).start()
+        return snapshot
+
+    def invalidate(self):
+        """Drop the current snapshot so the next get() reloads the catalog."""
+        self._snapshot = None
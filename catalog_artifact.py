@@ -0,0 +1,221 @@
+"""
+Build step for the catalog artifact: the term catalog of terms.db, with every pattern validated and
+the matcher and topic index compiled, serialized to one file that workers load instead of rebuilding.
+
+Invalid patterns are reported and fail the build (unless --allow-invalid is given), instead of being
+skipped at request time. The artifact records the database version it was built from and a digest of
+the terms and topics, so a loader can tell whether it still matches terms.db.
+
+Example:
+    python catalog_artifact.py --db terms.db --output catalog.artifact
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import struct
+import sys
+import tempfile
+import time
+
+import db
+from catalog import Catalog, database_version, get_problematic_terms, get_topics
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DEICATALOG\n'
+# Bump whenever Catalog, TermMatcher or TopicIndex change shape, so older artifacts are rebuilt
+ARTIFACT_FORMAT = 3
+HEADER_LENGTH = struct.Struct('<I')
+
+
+class ArtifactError(Exception):
+    """Raised for artifact files that are missing, corrupt or written by an incompatible build."""
+
+
+def artifact_format():
+    """Format of the artifacts this code reads and writes; pickled catalogs are only read by the same Python release."""
+    return (ARTIFACT_FORMAT, sys.version_info[:2])
+
+
+def catalog_digest(terms, topics):
+    """Digest of the catalog contents, independent of when or where the database was written."""
+    payload = json.dumps([terms, topics], sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def current_umask():
+    """The process umask, which can only be read by setting it."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def write_artifact(path, catalog):
+    """
+    Serialize catalog to path, replacing any previous artifact atomically so that workers reading it
+    concurrently see either the old or the new file. Returns the catalog's digest.
+    """
+    digest = catalog_digest(catalog.terms, catalog.topics)
+    header = pickle.dumps({
+        "format": artifact_format(),
+        "db_version": catalog.version,
+        "digest": digest,
+        "terms": len(catalog.terms),
+        "topics": len(catalog.topics),
+        "built": time.time()
+    })
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.catalog-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(MAGIC)
+            f.write(HEADER_LENGTH.pack(len(header)))
+            f.write(header)
+            pickle.dump(catalog, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # mkstemp creates the file readable by its owner only; give it the mode a plain open() would
+        os.chmod(temp_path, 0o644 & ~current_umask())
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    catalog.digest = digest
+    return digest
+
+
+def read_artifact(path):
+    """
+    Read an artifact with a single read of the file. Returns (header dict, Catalog).
+    Unpickling builds the catalog on the heap of each process that loads it; mapping the file would
+    not share it between processes, so it is read like any other file.
+    Raises ArtifactError if the file is missing, corrupt, or in another format.
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as open_error:
+        raise ArtifactError(f"Cannot open catalog artifact {path}: {open_error}")
+
+    try:
+        view = memoryview(data)
+        if bytes(view[:len(MAGIC)]) != MAGIC:
+            raise ArtifactError(f"{path} is not a catalog artifact")
+        offset = len(MAGIC) + HEADER_LENGTH.size
+        (header_length,) = HEADER_LENGTH.unpack(view[len(MAGIC):offset])
+        header = pickle.loads(view[offset:offset + header_length])
+        if header.get("format") != artifact_format():
+            raise ArtifactError(f"Catalog artifact {path} has format {header.get('format')}, "
+                                f"expected {artifact_format()}")
+        catalog = pickle.loads(view[offset + header_length:])
+    except ArtifactError:
+        raise
+    except Exception as load_error:
+        raise ArtifactError(f"Catalog artifact {path} is unreadable: {load_error}")
+    finally:
+        view.release()
+
+    if not isinstance(catalog, Catalog):
+        raise ArtifactError(f"Catalog artifact {path} does not hold a catalog")
+    catalog.digest = header["digest"]
+    return header, catalog
+
+
+def load_artifact(path, version, digest=None):
+    """
+    Return the Catalog stored at path if it matches the database: either the database version it was
+    built from equals version, or its content digest equals digest (the database was rewritten with
+    the same terms). The catalog is relabelled with the current version. Returns None otherwise.
+    """
+    try:
+        header, catalog = read_artifact(path)
+    except ArtifactError as artifact_error:
+        logger.debug(str(artifact_error))
+        return None
+
+    if header["db_version"] != version and (digest is None or header["digest"] != digest):
+        if digest is not None:
+            logger.warning(f"Catalog artifact {path} is out of date with the database; rebuild it with catalog_artifact.py")
+        return None
+    catalog.version = version
+    return catalog
+
+
+def load_or_build_catalog(artifact_path, version=None):
+    """
+    Return the term catalog of the current database: the one stored at artifact_path if it was built from
+    this database version or holds the same terms and topics, otherwise one compiled from the database.
+    version defaults to the current database version; an empty artifact_path skips the artifact.
+    Errors reading the database are raised to the caller.
+    """
+    if version is None:
+        version = database_version(db.DB_PATH)
+    if artifact_path:
+        # An artifact built from this very database file skips reading and compiling the terms
+        catalog = load_artifact(artifact_path, version)
+        if catalog is not None:
+            logger.info(f"Term catalog loaded from {artifact_path}")
+            return catalog
+
+    terms = get_problematic_terms()
+    topics = get_topics()
+    if artifact_path and os.path.exists(artifact_path):
+        # The database file changed; the artifact is still usable if the terms themselves did not
+        catalog = load_artifact(artifact_path, version, catalog_digest(terms, topics))
+        if catalog is not None:
+            logger.info(f"Term catalog loaded from {artifact_path}")
+            return catalog
+    return Catalog(version, terms, topics)
+
+
+def build_artifact(path, allow_invalid=False):
+    """
+    Build the catalog of the current database and write it to path.
+    Returns (catalog, invalid patterns): invalid patterns are (term, pattern, error) tuples; unless
+    allow_invalid is set, any invalid pattern stops the build before the artifact is written.
+    """
+    version = database_version(db.DB_PATH)
+    terms = get_problematic_terms()
+    topics = get_topics()
+    catalog = Catalog(version, terms, topics)
+    invalid = [(terms[idx]["term"], pattern, error) for idx, pattern, error in catalog.matcher.invalid] if terms else []
+    if invalid and not allow_invalid:
+        return catalog, invalid
+    write_artifact(path, catalog)
+    return catalog, invalid
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate the term catalog and compile it into an artifact.")
+    parser.add_argument('--db', help=f"database to build from (default: {db.DB_PATH})")
+    parser.add_argument('--output', default=os.environ.get('CATALOG_ARTIFACT', 'catalog.artifact'),
+                        help="artifact file to write (default: catalog.artifact, or $CATALOG_ARTIFACT)")
+    parser.add_argument('--allow-invalid', action='store_true',
+                        help="write the artifact even if some patterns do not compile; those terms are skipped")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR, format="%(asctime)s [%(levelname)s] %(message)s")
+    if args.db:
+        db.set_db_path(args.db)
+
+    started = time.perf_counter()
+    try:
+        catalog, invalid = build_artifact(args.output, args.allow_invalid)
+    except Exception as e:
+        print(f"Could not build the catalog artifact: {e}")
+        return 1
+
+    for term, pattern, error in invalid:
+        print(f"Invalid pattern for term '{term}': {pattern!r}: {error}")
+    if invalid and not args.allow_invalid:
+        print(f"{len(invalid)} invalid patterns; the artifact was not written")
+        return 1
+
+    print(f"Wrote {args.output}: {len(catalog.terms)} terms, {len(catalog.topics)} topics, "
+          f"{os.path.getsize(args.output):,} bytes in {time.perf_counter() - started:.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
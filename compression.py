@@ -0,0 +1,94 @@
+import json
+import zlib
+
+# Matches the output of Flask's jsonify() outside debug mode
+JSON_ENCODER = json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+
+# Window bits that make zlib produce each HTTP content coding
+ENCODING_WBITS = {
+    'gzip': 16 + zlib.MAX_WBITS,
+    'deflate': zlib.MAX_WBITS,      # HTTP "deflate" is the zlib format
+}
+
+
+def negotiate_encoding(accept_encoding):
+    """
+    Pick the content coding for a response from an Accept-Encoding header value.
+    Returns 'gzip', 'deflate' or None; gzip wins ties, and codings with q=0 are refused.
+    """
+    best, best_quality = None, 0.0
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        candidates = ENCODING_WBITS if name == '*' else ([name] if name in ENCODING_WBITS else [])
+        for candidate in candidates:
+            if quality > best_quality or (quality == best_quality and candidate == 'gzip' and best != 'gzip'):
+                best, best_quality = candidate, quality
+    return best if best_quality > 0 else None
+
+
+def iter_json(payload, chunk_size=64 * 1024):
+    """
+    Encode payload as JSON incrementally, yielding UTF-8 chunks of about chunk_size bytes.
+    Like jsonify(), the document ends with a newline.
+    """
+    buffer = []
+    size = 0
+    for piece in JSON_ENCODER.iterencode(payload):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    buffer.append('\n')
+    yield ''.join(buffer).encode('utf-8')
+
+
+def iter_compressed(chunks, encoding, level):
+    """Compress an iterable of byte chunks with the given content coding, yielding compressed chunks."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, ENCODING_WBITS[encoding])
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def encode_json_body(payload, encoding, level, min_size, chunk_size=64 * 1024):
+    """
+    Encode payload for an HTTP response body without holding the whole serialized JSON in memory.
+    Returns (body, content_encoding). JSON smaller than min_size is returned as bytes, uncompressed.
+    Anything larger is returned as a generator of chunks, compressed with the negotiated encoding
+    (if any), so it can be streamed to the client as it is encoded.
+    """
+    return encode_json_chunks(iter_json(payload, chunk_size=min(chunk_size, max(min_size, 1))), encoding, level, min_size)
+
+
+def encode_json_chunks(chunks, encoding, level, min_size):
+    """Like encode_json_body, for JSON that is already encoded as an iterable of UTF-8 byte chunks."""
+    chunks = iter(chunks)
+    head = []
+    size = 0
+    for chunk in chunks:
+        head.append(chunk)
+        size += len(chunk)
+        if size >= min_size:
+            break
+    else:
+        return b''.join(head), None
+
+    def body():
+        yield from head
+        yield from chunks
+
+    if encoding is None:
+        return body(), None
+    return iter_compressed(body(), encoding, level), encoding
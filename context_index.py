@@ -0,0 +1,106 @@
+import logging
+from bisect import bisect_left, bisect_right
+
+logger = logging.getLogger(__name__)
+
+# List of words that might indicate benign context
+BENIGN_CONTEXT_INDICATORS = [
+    'quote', 'quotes', 'quoted', 'quoting',
+    'example', 'examples', 'exemplifies',
+    'reference', 'references', 'referenced',
+    'citation', 'citations', 'cited',
+    'definition', 'defines', 'defined',
+    'mention', 'mentions', 'mentioned',
+    'discuss', 'discusses', 'discussed', 'discussing', 'discussion'
+]
+
+# word_tokenize rewrites double quotes, so map the rewritten tokens back to what appears in the text
+TOKEN_ALIASES = {'``': '"', "''": '"'}
+
+
+def first_indicator(token):
+    """Return the position in BENIGN_CONTEXT_INDICATORS of the first indicator contained in token, or None."""
+    token_lower = token.lower()
+    for position, indicator in enumerate(BENIGN_CONTEXT_INDICATORS):
+        if indicator in token_lower:
+            return position
+    return None
+
+
+class ContextIndex:
+    """
+    Sentence and token spans of a document, built once so every match can be located with a bisect.
+
+    sent_tokenize and word_tokenize are the NLTK tokenizers (or compatible callables). Tokens are
+    aligned back onto the text to recover their character offsets; tokens that cannot be found in
+    the text (rare rewrites by the tokenizer) are dropped.
+    """
+
+    def __init__(self, text, sent_tokenize, word_tokenize):
+        self.text = text
+        self.sentence_starts = []
+        self.sentence_ends = []
+        self.tokens = []
+        self.token_starts = []
+        self.token_ends = []
+
+        sentence_cursor = 0
+        token_cursor = 0
+        for sentence in sent_tokenize(text):
+            sentence_start = text.find(sentence, sentence_cursor)
+            if sentence_start == -1:
+                continue
+            sentence_end = sentence_start + len(sentence)
+            self.sentence_starts.append(sentence_start)
+            self.sentence_ends.append(sentence_end)
+            sentence_cursor = sentence_end
+
+            # word_tokenize() splits into sentences first, so tokenizing sentence by sentence gives the same tokens
+            token_cursor = max(token_cursor, sentence_start)
+            for token in word_tokenize(sentence):
+                token_start = text.find(token, token_cursor)
+                if token_start == -1 and token in TOKEN_ALIASES:
+                    token = TOKEN_ALIASES[token]
+                    token_start = text.find(token, token_cursor)
+                if token_start == -1:
+                    continue
+                token_end = token_start + len(token)
+                self.tokens.append(token)
+                self.token_starts.append(token_start)
+                self.token_ends.append(token_end)
+                token_cursor = token_end
+
+        # Batch the benign-indicator check: each token is tested against the indicator list exactly once
+        self.token_indicators = [first_indicator(token) for token in self.tokens]
+
+    def sentence_span(self, start, end):
+        """Return the (start, end) span of the sentence containing [start, end), or None."""
+        position = bisect_right(self.sentence_starts, start) - 1
+        if position >= 0 and end <= self.sentence_ends[position]:
+            return self.sentence_starts[position], self.sentence_ends[position]
+        return None
+
+    def token_range(self, start, end):
+        """Return the (first, last + 1) indices of the tokens overlapping [start, end), or None."""
+        first = bisect_right(self.token_ends, start)
+        last = bisect_left(self.token_starts, end)
+        if first >= last:
+            return None
+        return first, last
+
+    def benign_indicator(self, start, end, window_size=5):
+        """
+        Look for a benign indicator among the window_size tokens on either side of the match.
+        Returns (found, indicator): found is False if the match could not be located among the tokens.
+        """
+        token_range = self.token_range(start, end)
+        if token_range is None:
+            return False, None
+
+        first, last = token_range
+        window = (self.token_indicators[max(0, first - window_size):first] +
+                  self.token_indicators[last:last + window_size])
+        positions = [position for position in window if position is not None]
+        if not positions:
+            return True, None
+        return True, BENIGN_CONTEXT_INDICATORS[min(positions)]
@@ -0,0 +1,63 @@
+import logging
+import os
+import sqlite3
+import threading
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# Database path, overridable with the TERMS_DB_PATH environment variable
+DB_PATH = os.environ.get("TERMS_DB_PATH", "terms.db")
+
+_local = threading.local()                                      # Per-thread read-only connections.
+
+
+def set_db_path(path):
+    """Point the access layer at a different database file, closing this thread's cached connection."""
+    global DB_PATH
+    close_read_connection()
+    DB_PATH = path
+
+
+def enable_wal(conn):
+    """Switch the database to write-ahead logging so readers are not blocked by a writer."""
+    mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    if mode.lower() != "wal":
+        logger.warning(f"Could not enable WAL journal mode on {DB_PATH}, using '{mode}'")
+    return conn
+
+
+def connect():
+    """
+    Open a read-write connection for maintenance scripts such as init_db.py and enhance_feedback.py.
+    The database is created if it does not exist and is switched to WAL mode.
+    """
+    conn = sqlite3.connect(DB_PATH)
+    enable_wal(conn)
+    return conn
+
+
+def read_connection():
+    """
+    Return this thread's read-only connection to the database, opening it on first use.
+    Connections are reopened after a fork or a change of DB_PATH, and never write to the file.
+    """
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.pid == os.getpid() and _local.path == DB_PATH:
+        return conn
+
+    uri = f"file:{quote(os.path.abspath(DB_PATH))}?mode=ro"
+    conn = sqlite3.connect(uri, uri=True)
+    _local.conn = conn
+    _local.pid = os.getpid()
+    _local.path = DB_PATH
+    return conn
+
+
+def close_read_connection():
+    """Close this thread's read-only connection, if it has one."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None:
+        if _local.pid == os.getpid():
+            conn.close()
+        _local.conn = None
@@ -1,4 +1,6 @@
 import sqlite3
+import db
+from import_terms import import_terms
 import logging
 import sys
 
@@ -12,9 +14,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database path
-DB_PATH = "terms.db"
-
 # Enhanced feedback data
 enhanced_feedback = [
     # Gender-related terms
@@ -134,73 +133,39 @@ enhanced_feedback = [
     )
 ]
 
+# Categories of the terms above; terms not listed here are filed under "General"
+term_categories = {
+    "guys": "Gender",
+    "mankind": "Gender",
+    "manpower": "Gender",
+    "wheelchair bound": "Disability",
+    "handicapped": "Disability",
+    "special needs": "Disability",
+    "elderly": "Age",
+    "senior moment": "Age",
+    "minority": "Race & Ethnicity",
+    "exotic": "Race & Ethnicity",
+    "crazy": "General",
+    "OCD": "General",
+    "tone deaf": "General"
+}
+
 def update_feedback():
     """Updates the database with enhanced feedback for existing terms and adds new terms"""
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Get existing terms
-        cursor.execute("SELECT term FROM problematic_terms")
-        existing_terms = [row[0] for row in cursor.fetchall()]
-        
-        # Get category and source IDs
-        cursor.execute("SELECT id, name FROM categories")
-        categories = {name: id for id, name in cursor.fetchall()}
-        
-        cursor.execute("SELECT id, name FROM sources")
-        sources = {name: id for id, name in cursor.fetchall()}
-        
-        # Default category and source if not specified
-        default_category_id = categories.get("General", 5)
-        default_source_id = sources.get("Internal Guidelines", 1)
-        
-        # Create mapping for term categories
-        term_categories = {
-            "guys": "Gender",
-            "mankind": "Gender",
-            "manpower": "Gender",
-            "wheelchair bound": "Disability",
-            "handicapped": "Disability",
-            "special needs": "Disability",
-            "elderly": "Age",
-            "senior moment": "Age",
-            "minority": "Race & Ethnicity",
-            "exotic": "Race & Ethnicity",
-            "crazy": "General",
-            "OCD": "General",
-            "tone deaf": "General"
-        }
-        
-        updated_count = 0
-        added_count = 0
-        
-        for term, feedback in enhanced_feedback:
-            category_name = term_categories.get(term, "General")
-            category_id = categories.get(category_name, default_category_id)
-            
-            if term in existing_terms:
-                # Update existing term
-                cursor.execute(
-                    "UPDATE problematic_terms SET feedback = ?, category_id = ? WHERE term = ?",
-                    (feedback, category_id, term)
-                )
-                updated_count += 1
-                logger.info(f"Updated feedback for term: {term}")
-            else:
-                # Add new term
-                cursor.execute(
-                    "INSERT INTO problematic_terms (term, pattern, feedback, category_id, source_id) VALUES (?, ?, ?, ?, ?)",
-                    (term, None, feedback, category_id, default_source_id)
-                )
-                added_count += 1
-                logger.info(f"Added new term: {term}")
-        
-        conn.commit()
-        logger.info(f"Successfully updated {updated_count} terms and added {added_count} new terms.")
+        conn = db.connect()
+
+        # Upsert every term in one transaction, through the same path as bulk imports
+        records = (
+            (number, {"term": term, "feedback": feedback, "category": term_categories.get(term, "General")})
+            for number, (term, feedback) in enumerate(enhanced_feedback, 1)
+        )
+        stats = import_terms(conn, records, default_category="General", default_source="Internal Guidelines")
+        logger.info(f"Successfully updated {stats['updated']} terms and added {stats['inserted']} new terms.")
         
         # Display updated database stats
+        cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM problematic_terms")
         terms_count = cursor.fetchone()[0]
         logger.info(f"Database now contains {terms_count} terms with improved feedback.")
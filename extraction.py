@@ -0,0 +1,216 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from logging_setup import init_pool_logging, pool_log_queue
+
+logger = logging.getLogger(__name__)
+
+
+def available_cpus():
+    """Number of CPUs this process may run on, which can be fewer than the machine has."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def pool_context():
+    """
+    Multiprocessing context for the worker pools of a threaded process: a fork server where there is one,
+    spawn elsewhere. Unlike forked workers, theirs do not inherit this process's threads, locks or
+    connections; like any such child, they import the main module again, so entry points keep their
+    work under `if __name__ == "__main__"`.
+    """
+    return multiprocessing.get_context('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn')
+
+
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', available_cpus()))  # Processes shared by all large PDF extractions.
+PDF_PARALLEL_MIN_PAGES = 16                                # PDFs with fewer pages are extracted in-process.
+PDF_PAGES_PER_CHUNK = 8                                    # Pages handed to a worker at a time.
+
+_pdf_pool = None                                           # Extraction pool of this process, created on first use.
+_pdf_pool_pid = None                                       # Process that created _pdf_pool; a forked child makes its own.
+_pdf_pool_lock = threading.Lock()
+
+
+@contextmanager
+def open_source(source):
+    """
+    Yield a binary file object for source, which is either a file path or an open binary file object.
+    Paths are opened and closed here; file objects are rewound and left open for the caller.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            yield f
+    else:
+        source.seek(0)
+        yield source
+
+
+def describe_source(source):
+    """Name the source in log messages."""
+    return source if isinstance(source, (str, os.PathLike)) else getattr(source, 'name', 'upload stream')
+
+
+def preload_extractors():
+    """
+    Import the document parsing libraries now instead of on first use.
+    They are imported lazily so processes that never extract a file do not pay for them.
+    """
+    import docx
+    import PyPDF2
+
+
+def extract_text_from_docx(source):
+    import docx
+    try:
+        with open_source(source) as f:
+            doc = docx.Document(f)
+        text = '\n'.join([paragraph.text for paragraph in doc.paragraphs])
+        return text
+    except Exception as e:
+        logger.error(f"Error extracting text from DOCX file {describe_source(source)}: {str(e)}")
+        raise Exception(f"Could not read DOCX file. It may be corrupted or in an unsupported format: {str(e)}")
+
+
+def _pdf_pool_executor():
+    """
+    Return the process pool shared by every PDF extraction in this process, creating it on first use.
+    Its workers are started from pool_context() rather than forked from this process, and send their log
+    records to it; see init_pool_logging(). Being one pool of
+    PDF_WORKERS processes, it also bounds the extraction work of concurrent uploads.
+    """
+    global _pdf_pool, _pdf_pool_pid
+    with _pdf_pool_lock:
+        if _pdf_pool is None or _pdf_pool_pid != os.getpid():
+            context = pool_context()
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=context, initializer=init_pool_logging,
+                                            initargs=(pool_log_queue(context), logging.getLogger().getEffectiveLevel()))
+            _pdf_pool_pid = os.getpid()
+        return _pdf_pool
+
+
+def _discard_pdf_pool(executor):
+    """Forget a pool whose worker died, so the next extraction starts a new one."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is executor:
+            _pdf_pool = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _pdf_chunk(pdf_reader, first, last):
+    """Write pages first..last-1 as a PDF of their own, so a worker parses only the pages it extracts."""
+    import PyPDF2
+    writer = PyPDF2.PdfWriter()
+    for number in range(first, last):
+        writer.add_page(pdf_reader.pages[number])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def _extract_pdf_chunk(content, first_number):
+    """Extract every page of a chunk from _pdf_chunk in a worker process, returning (page number, text) pairs."""
+    import PyPDF2
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
+    return [(first_number + offset, page.extract_text() or '') for offset, page in enumerate(pdf_reader.pages)]
+
+
+def iter_pdf_pages(source, max_workers=None):
+    """
+    Generate (page number, text) pairs for every page of a PDF, in page order, starting at page 1.
+    Large PDFs are split into chunks of PDF_PAGES_PER_CHUNK pages that are extracted in the shared process
+    pool, with at most two chunks per worker in flight; pages are yielded as soon as their chunk and all
+    earlier chunks are done, so callers can start work on the first pages while later pages are still
+    being extracted. Small PDFs, single-CPU hosts and daemonic processes extract in-process.
+    """
+    import PyPDF2
+    with open_source(source) as f:
+        content = f.read()
+
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(content))
+    page_count = len(pdf_reader.pages)
+    if page_count == 0:
+        raise Exception("PDF has no pages")
+
+    if max_workers is None:
+        max_workers = min(PDF_WORKERS, available_cpus())
+    extracted = 0
+    if max_workers > 1 and page_count >= PDF_PARALLEL_MIN_PAGES and not multiprocessing.current_process().daemon:
+        executor = _pdf_pool_executor()
+        pending = deque()
+        next_first = 0
+        try:
+            while extracted < page_count:
+                while next_first < page_count and len(pending) < 2 * max_workers:
+                    last = min(next_first + PDF_PAGES_PER_CHUNK, page_count)
+                    pending.append(executor.submit(_extract_pdf_chunk, _pdf_chunk(pdf_reader, next_first, last), next_first + 1))
+                    next_first = last
+                for number, page_text in pending.popleft().result():
+                    yield number, page_text
+                    extracted = number
+        except BrokenProcessPool:
+            logger.warning(f"PDF extraction pool failed; extracting {describe_source(source)} from page {extracted + 1} in-process")
+            _discard_pdf_pool(executor)
+        finally:
+            for future in pending:
+                future.cancel()
+
+    for number in range(extracted, page_count):
+        yield number + 1, pdf_reader.pages[number].extract_text() or ''
+
+
+def extract_text_from_pdf(source, on_page=None):
+    try:
+        try:
+            page_texts = []
+            for number, page_text in iter_pdf_pages(source):
+                page_texts.append(page_text)
+                if on_page is not None:
+                    on_page(number)
+            text = ''.join(page_texts)
+            
+            if not text.strip():
+                raise Exception("No text content could be extracted from PDF")
+                
+            return text
+        except Exception as e:
+            logger.error(f"Error reading PDF content: {str(e)}")
+            raise Exception(f"Could not extract text from PDF: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error opening PDF file {describe_source(source)}: {str(e)}")
+        raise Exception(f"Could not open PDF file: {str(e)}")
+
+
+def extract_text_from_txt(source):
+    # Read the bytes once and decode them, falling back to latin-1 if utf-8 fails
+    with open_source(source) as f:
+        content = f.read()
+    try:
+        text = content.decode('utf-8')
+    except UnicodeDecodeError:
+        text = content.decode('latin-1')
+    # Universal newlines, as reading the file in text mode gave: offsets must not depend on the line endings
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def extract_text(filename, source, on_page=None):
+    """
+    Extract the text of an uploaded file, dispatching on its extension.
+    source is a file path or a seekable binary file object such as the upload's spooled stream.
+    For PDFs, on_page(page number) is called as each page is extracted.
+    """
+    if filename.endswith('.docx'):
+        return extract_text_from_docx(source)
+    elif filename.endswith('.pdf'):
+        return extract_text_from_pdf(source, on_page)
+    else:  # For .txt files
+        return extract_text_from_txt(source)
@@ -0,0 +1,42 @@
+import html
+from io import StringIO
+
+
+def confidence_class(confidence):
+    """Map a confidence score onto the CSS class used to colour its highlight."""
+    if confidence < 0.3:
+        return "low-confidence"
+    if confidence < 0.7:
+        return "medium-confidence"
+    return "high-confidence"
+
+
+def render_highlight_span(result, matched_term):
+    """Create the highlight span, with escaped data attributes, for one analysis result."""
+    attributes = [
+        ("data-id", result["id"]),
+        ("data-feedback", result["feedback"]),
+        ("data-category", result["category"]),
+        ("data-source", result["source"]),
+        ("data-confidence", result["confidence"]),
+        ("data-context", result["context_note"]),
+    ]
+    rendered = ' '.join(f'{name}="{html.escape(str(value), quote=True)}"' for name, value in attributes)
+    return (f'<span class="highlight {confidence_class(result["confidence"])}" {rendered}>'
+            f'{html.escape(matched_term, quote=False)}</span>')
+
+
+def render_highlighted_text(text, highlights):
+    """
+    Render text as HTML with every highlight wrapped in a span, in a single pass.
+    highlights is an iterable of (start, end, result) tuples with non-overlapping spans.
+    Text between highlights is HTML-escaped so it cannot inject markup into the page.
+    """
+    output = StringIO()
+    position = 0
+    for start, end, result in sorted(highlights, key=lambda highlight: highlight[0]):
+        output.write(html.escape(text[position:start], quote=False))
+        output.write(render_highlight_span(result, text[start:end]))
+        position = end
+    output.write(html.escape(text[position:], quote=False))
+    return output.getvalue()
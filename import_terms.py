@@ -0,0 +1,289 @@
+"""
+Bulk import of problematic terms from CSV, JSON or JSONL files into terms.db.
+
+Every record needs a 'term' and a 'feedback'; 'pattern', 'category' and 'source' are optional.
+Records are read in streamed batches and upserted by term: a term already in the database gets the
+record's feedback, and its pattern, category and source where the record has them; a new term is
+inserted with the default category and source where the record has none. Categories and sources
+that do not exist yet are created. The whole import runs in one transaction, so a failed import
+leaves the database unchanged.
+
+Example:
+    python import_terms.py style_guide.csv inclusive_terms.jsonl --default-source "Internal Guidelines"
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import sqlite3
+import sys
+import time
+
+import db
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 5000
+FORMATS = ('csv', 'json', 'jsonl')
+
+
+class LookupCache:
+    """Name -> id lookups for the categories or sources table, loaded once; missing names are inserted."""
+
+    def __init__(self, cursor, table):
+        self.cursor = cursor
+        self.table = table
+        self.ids = {}
+        for row_id, name in cursor.execute(f"SELECT id, name FROM {table} ORDER BY id"):
+            self.ids.setdefault(name, row_id)
+        self.created = 0
+
+    def id_for(self, name):
+        if name is None:
+            return None
+        row_id = self.ids.get(name)
+        if row_id is None:
+            self.cursor.execute(f"INSERT INTO {self.table} (name) VALUES (?)", (name,))
+            row_id = self.ids[name] = self.cursor.lastrowid
+            self.created += 1
+        return row_id
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    if extension == 'ndjson':
+        return 'jsonl'
+    if extension not in FORMATS:
+        raise ValueError(f"Cannot tell the format of {path}; use --format with one of {', '.join(FORMATS)}")
+    return extension
+
+
+def iter_json_array(f, chunk_size=1024 * 1024):
+    """
+    Yield the elements of a JSON array one at a time, reading the file in chunks rather than parsing
+    the whole document. A top-level object is read whole and its 'terms' list is used instead.
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(chunk_size)
+    position = len(buffer) - len(buffer.lstrip())
+    if buffer[position:position + 1] == '{':
+        yield from json.loads(buffer + f.read()).get('terms', [])
+        return
+    if buffer[position:position + 1] != '[':
+        raise ValueError("Expected a JSON array of term records")
+    position += 1
+    expect_value = True
+    eof = False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n':
+            position += 1
+        if position >= len(buffer):
+            if eof:
+                raise ValueError("Unexpected end of JSON array")
+            buffer = buffer[position:] + f.read(chunk_size)
+            position = 0
+            eof = not buffer
+            continue
+        char = buffer[position]
+        if char == ']':
+            return
+        if not expect_value:
+            if char != ',':
+                raise ValueError(f"Expected ',' or ']' in JSON array, found {char!r}")
+            position += 1
+            expect_value = True
+            continue
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            more = f.read(chunk_size)
+            if not more:
+                raise
+            buffer = buffer[position:] + more
+            position = 0
+            continue
+        yield value
+        position = end
+        expect_value = False
+
+
+def iter_records(path, file_format=None):
+    """Yield (line or record number, record dict) for every record of a CSV, JSON or JSONL file."""
+    file_format = file_format or detect_format(path)
+    with open(path, 'r', encoding='utf-8-sig', newline='' if file_format == 'csv' else None) as f:
+        if file_format == 'csv':
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+        elif file_format == 'jsonl':
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    yield line_number, json.loads(line)
+        else:
+            yield from enumerate(iter_json_array(f), 1)
+
+
+def clean_record(record):
+    """
+    Normalize one input record to (term, pattern, feedback, category, source), with empty fields as None.
+    Raises ValueError for records without a term or feedback, or with a pattern that does not compile.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record is not an object")
+
+    def field(name):
+        value = record.get(name)
+        if value is None:
+            return None
+        value = str(value).strip()
+        return value or None
+
+    term, pattern, feedback = field('term'), field('pattern'), field('feedback')
+    if term is None or feedback is None:
+        raise ValueError("record needs a 'term' and a 'feedback'")
+    if pattern is not None:
+        try:
+            re.compile(pattern, re.IGNORECASE)
+        except re.error as regex_error:
+            raise ValueError(f"invalid pattern for '{term}': {regex_error}")
+    return term, pattern, feedback, field('category'), field('source')
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_terms(conn, records, default_category="General", default_source="Internal Guidelines",
+                 batch_size=BATCH_SIZE):
+    """
+    Upsert records, an iterable of (record number, term dict) pairs such as iter_records() yields, into
+    problematic_terms in a single transaction on conn.
+    Records are matched to existing terms by their exact 'term'; within the input, a later record for the
+    same term wins. Records that fail validation are skipped with a warning.
+    Returns a dict of counts (read, inserted, updated, skipped, categories_created, sources_created),
+    the elapsed seconds and the throughput in records per second.
+    """
+    started = time.perf_counter()
+    cursor = conn.cursor()
+    stats = {"read": 0, "inserted": 0, "updated": 0, "skipped": 0}
+    try:
+        categories = LookupCache(cursor, "categories")
+        sources = LookupCache(cursor, "sources")
+        default_category_id = categories.id_for(default_category)
+        default_source_id = sources.id_for(default_source)
+
+        # term -> ids of its rows; duplicated terms are all updated, as UPDATE ... WHERE term = ? would
+        term_ids = {}
+        for row_id, term in cursor.execute("SELECT id, term FROM problematic_terms"):
+            term_ids.setdefault(term, []).append(row_id)
+
+        for batch in batched(records, batch_size):
+            new_rows = {}           # term -> insert row, so repeated terms in one batch insert once
+            updates = []
+            for number, record in batch:
+                stats["read"] += 1
+                try:
+                    term, pattern, feedback, category, source = clean_record(record)
+                except ValueError as record_error:
+                    stats["skipped"] += 1
+                    logger.warning(f"Skipping record {number}: {record_error}")
+                    continue
+                category_id = categories.id_for(category)
+                source_id = sources.id_for(source)
+                if term in term_ids:
+                    updates.extend((pattern, feedback, category_id, source_id, row_id) for row_id in term_ids[term])
+                    stats["updated"] += 1
+                else:
+                    new_rows[term] = (
+                        term, pattern, feedback,
+                        category_id if category_id is not None else default_category_id,
+                        source_id if source_id is not None else default_source_id
+                    )
+
+            # Fields missing from a record keep their current values
+            cursor.executemany(
+                """UPDATE problematic_terms
+                   SET pattern = COALESCE(?, pattern), feedback = ?,
+                       category_id = COALESCE(?, category_id), source_id = COALESCE(?, source_id)
+                   WHERE id = ?""",
+                updates
+            )
+            if new_rows:
+                last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM problematic_terms").fetchone()[0]
+                cursor.executemany(
+                    "INSERT INTO problematic_terms (term, pattern, feedback, category_id, source_id) VALUES (?, ?, ?, ?, ?)",
+                    new_rows.values()
+                )
+                for row_id, term in cursor.execute("SELECT id, term FROM problematic_terms WHERE id > ?", (last_id,)):
+                    term_ids.setdefault(term, []).append(row_id)
+                stats["inserted"] += len(new_rows)
+            logger.info(f"Imported {stats['read']} records")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    elapsed = time.perf_counter() - started
+    stats.update(
+        categories_created=categories.created,
+        sources_created=sources.created,
+        seconds=elapsed,
+        records_per_second=stats["read"] / elapsed if elapsed > 0 else 0.0
+    )
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import problematic terms from CSV, JSON or JSONL files.")
+    parser.add_argument('files', nargs='+', help="term files; the format is taken from the extension")
+    parser.add_argument('--format', choices=FORMATS, help="format of every file, overriding the extensions")
+    parser.add_argument('--db', help=f"database to import into (default: {db.DB_PATH})")
+    parser.add_argument('--default-category', default="General",
+                        help="category of new terms that have none (default: General)")
+    parser.add_argument('--default-source', default="Internal Guidelines",
+                        help="source of new terms that have none (default: Internal Guidelines)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help=f"records written per executemany batch (default: {BATCH_SIZE})")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s",
+                        handlers=[logging.StreamHandler(sys.stdout)])
+    if args.db:
+        db.set_db_path(args.db)
+
+    def records():
+        for path in args.files:
+            logger.info(f"Reading {path}")
+            yield from iter_records(path, args.format)
+
+    conn = None
+    try:
+        conn = db.connect()
+        stats = import_terms(conn, records(), args.default_category, args.default_source, args.batch_size)
+    except (OSError, ValueError, csv.Error, sqlite3.Error) as e:
+        logger.error(f"Import failed, no terms were changed: {e}")
+        return 1
+    finally:
+        if conn:
+            conn.close()
+
+    logger.info(
+        f"Read {stats['read']} records: {stats['inserted']} terms added, {stats['updated']} updated, "
+        f"{stats['skipped']} skipped; {stats['categories_created']} categories and "
+        f"{stats['sources_created']} sources created"
+    )
+    logger.info(f"Imported in {stats['seconds']:.2f}s ({stats['records_per_second']:,.0f} records/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
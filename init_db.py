@@ -1,4 +1,6 @@
 import sqlite3
+import db
+import schema
 import os
 import sys
 import logging
@@ -13,67 +15,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database path
-DB_PATH = "terms.db"
-
 def init_database():
     """Initialize the database with required tables and sample data"""
-    print(f"Initializing database at {DB_PATH}...")
+    print(f"Initializing database at {db.DB_PATH}...")
     
     # Check if database exists
-    db_exists = os.path.exists(DB_PATH)
+    db_exists = os.path.exists(db.DB_PATH)
     if db_exists:
-        print(f"Found existing database at {DB_PATH}")
+        print(f"Found existing database at {db.DB_PATH}")
     else:
-        print(f"Creating new database at {DB_PATH}")
+        print(f"Creating new database at {db.DB_PATH}")
     
     # Connect to the database
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = db.connect()
         cursor = conn.cursor()
         
-        # Create tables
+        # Create tables, or upgrade an existing database to the current schema in place
         print("Creating necessary tables...")
-        
-        # Create categories table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS categories (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE
-        )
-        ''')
-        
-        # Create sources table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS sources (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL UNIQUE
-        )
-        ''')
-        
-        # Create problematic_terms table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS problematic_terms (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            term TEXT NOT NULL,
-            pattern TEXT,
-            feedback TEXT NOT NULL,
-            category_id INTEGER,
-            source_id INTEGER,
-            FOREIGN KEY (category_id) REFERENCES categories (id),
-            FOREIGN KEY (source_id) REFERENCES sources (id)
-        )
-        ''')
-        
-        # Create topics table
-        cursor.execute('''
-        CREATE TABLE IF NOT EXISTS topics (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            topic TEXT NOT NULL UNIQUE,
-            terms TEXT NOT NULL
-        )
-        ''')
+        old_version, new_version = schema.upgrade(conn)
+        if old_version != new_version:
+            print(f"Upgraded schema from version {old_version} to {new_version}")
         
         conn.commit()
         print("Tables created successfully")
@@ -131,13 +94,19 @@ def init_database():
         if topics_count == 0:
             print("Adding sample topics...")
             topics = [
-                ("Gender Inclusivity", "gender, pronoun, inclusive, diversity, equity"),
-                ("Racial Equity", "race, ethnicity, cultural, diverse, inclusion"),
-                ("Disability", "disability, accessible, accommodation, inclusive design"),
-                ("Age Discrimination", "age, ageism, elderly, older, retirement"),
-                ("General Inclusivity", "inclusive, diversity, equity, belonging, accessibility")
+                ("Gender Inclusivity", ["gender", "pronoun", "inclusive", "diversity", "equity"]),
+                ("Racial Equity", ["race", "ethnicity", "cultural", "diverse", "inclusion"]),
+                ("Disability", ["disability", "accessible", "accommodation", "inclusive design"]),
+                ("Age Discrimination", ["age", "ageism", "elderly", "older", "retirement"]),
+                ("General Inclusivity", ["inclusive", "diversity", "equity", "belonging", "accessibility"])
             ]
-            cursor.executemany("INSERT INTO topics (topic, terms) VALUES (?, ?)", topics)
+            for topic, topic_terms in topics:
+                cursor.execute("INSERT INTO topics (topic) VALUES (?)", (topic,))
+                topic_id = cursor.lastrowid
+                cursor.executemany(
+                    "INSERT INTO topic_terms (topic_id, position, term) VALUES (?, ?, ?)",
+                    [(topic_id, position, term) for position, term in enumerate(topic_terms)]
+                )
             print(f"Added {len(topics)} topics")
             
             conn.commit()
@@ -151,6 +120,7 @@ def init_database():
         cursor.execute("SELECT COUNT(*) FROM topics")
         topics_count = cursor.fetchone()[0]
         print(f"Final topics count in database: {topics_count}")
+        print(f"Schema version: {schema.schema_version(conn)}")
         
         print("Database initialization complete!")
         return True
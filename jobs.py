@@ -0,0 +1,284 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Progress fields a running job may report
+PROGRESS_FIELDS = ('stage', 'pages_extracted', 'matches_found')
+
+HEARTBEAT_INTERVAL = 10                 # Seconds between the heartbeats a process writes for its unfinished jobs.
+STALE_AFTER = 3 * HEARTBEAT_INTERVAL    # Unfinished jobs without a heartbeat for this long have lost their process.
+PROGRESS_INTERVAL = 1.0                 # Seconds between writes of a job's progress counters.
+
+INTERRUPTED_ERROR = "The job was interrupted by a server restart. Please submit it again."
+
+
+class JobStore:
+    """
+    State of asynchronous analysis jobs, kept in a SQLite table so it survives restarts and is shared
+    by every process pointed at the same file. Finished jobs are deleted ttl seconds after they finish.
+
+    Each job records the instance token of the process that runs it, and that process refreshes the
+    heartbeat of its unfinished jobs every HEARTBEAT_INTERVAL seconds. A queued or running job whose
+    heartbeat is older than STALE_AFTER lost its process (PIDs are reused, so they cannot tell) and is
+    failed, then expires like any other finished job.
+    """
+
+    def __init__(self, db_path, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db_path = db_path
+        self._pid = os.getpid()
+        self._instance = uuid.uuid4().hex
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                pages_extracted INTEGER NOT NULL DEFAULT 0,
+                matches_found INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                owner_pid INTEGER NOT NULL,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                finished REAL,
+                owner TEXT,
+                heartbeat REAL
+            )
+        """)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        for column, declaration in (('owner', 'TEXT'), ('heartbeat', 'REAL')):  # Added after the first release
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE jobs ADD COLUMN {column} {declaration}")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished)")
+        self._db.commit()
+
+    def _connection(self):
+        """
+        Return this process's connection; a forked worker opens its own instead of sharing its parent's,
+        and takes a new instance token so its jobs are told apart from those of its parent.
+        """
+        if self._pid != os.getpid():
+            self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+            self._pid = os.getpid()
+            self._instance = uuid.uuid4().hex
+        return self._db
+
+    def _execute(self, sql, params=()):
+        with self._lock:
+            db = self._connection()
+            cursor = db.execute(sql, params)
+            db.commit()
+            return cursor
+
+    def create(self, kind):
+        """Record a new queued job and return its id."""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "INSERT INTO jobs (id, kind, status, stage, owner_pid, owner, created, updated, heartbeat) "
+                "VALUES (?, ?, 'queued', 'queued', ?, ?, ?, ?, ?)",
+                (job_id, kind, os.getpid(), self._instance, now, now, now)
+            )
+            db.commit()
+        return job_id
+
+    def heartbeat(self):
+        """Mark the unfinished jobs of this process as still owned by a live process."""
+        with self._lock:
+            db = self._connection()
+            db.execute("UPDATE jobs SET heartbeat = ? WHERE owner = ? AND finished IS NULL", (time.time(), self._instance))
+            db.commit()
+
+    def update(self, job_id, **fields):
+        """Update the status or progress fields of a job."""
+        columns = [name for name in fields if name == 'status' or name in PROGRESS_FIELDS]
+        if not columns:
+            return
+        assignments = ', '.join(f"{name} = ?" for name in columns)
+        self._execute(
+            f"UPDATE jobs SET {assignments}, updated = ? WHERE id = ?",
+            [fields[name] for name in columns] + [time.time(), job_id]
+        )
+
+    def finish(self, job_id, result):
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = 'done', stage = 'done', result = ?, updated = ?, finished = ? WHERE id = ?",
+            (json.dumps(result), now, now, job_id)
+        )
+
+    def fail(self, job_id, error):
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = 'failed', error = ?, updated = ?, finished = ? WHERE id = ?",
+            (error, now, now, job_id)
+        )
+
+    def get(self, job_id):
+        """Return the job as a dictionary, or None if it does not exist or has expired."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT id, kind, status, stage, pages_extracted, matches_found, result, error, heartbeat, "
+                "created, updated, finished FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        (job_id, kind, status, stage, pages_extracted, matches_found, result, error, heartbeat,
+         created, updated, finished) = row
+
+        if finished is not None and finished < time.time() - self.ttl:
+            return None
+        if status in ('queued', 'running') and (heartbeat or updated) < time.time() - STALE_AFTER:
+            # The process that owned the job stopped before finishing it
+            error = INTERRUPTED_ERROR
+            self.fail(job_id, error)
+            status = 'failed'
+
+        job = {
+            "job_id": job_id,
+            "kind": kind,
+            "status": status,
+            "progress": {
+                "stage": stage,
+                "pages_extracted": pages_extracted,
+                "matches_found": matches_found
+            },
+            "created": created,
+            "updated": updated
+        }
+        if status == 'done':
+            job["result"] = json.loads(result)
+        elif status == 'failed':
+            job["error"] = error
+        return job
+
+    def expire(self):
+        """
+        Fail the queued and running jobs whose heartbeat is stale, and delete jobs that finished more than
+        ttl seconds ago. Returns the number deleted.
+        """
+        now = time.time()
+        with self._lock:
+            db = self._connection()
+            db.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, updated = ?, finished = ? "
+                "WHERE finished IS NULL AND COALESCE(heartbeat, updated) < ?",
+                (INTERRUPTED_ERROR, now, now, now - STALE_AFTER)
+            )
+            deleted = db.execute("DELETE FROM jobs WHERE finished < ?", (now - self.ttl,)).rowcount
+            db.commit()
+        return deleted
+
+
+class JobProgress:
+    """
+    The progress(**fields) callable handed to a job. Stage changes are written at once; counters such
+    as pages_extracted are written at most every PROGRESS_INTERVAL seconds, and flush() writes the rest.
+    """
+
+    def __init__(self, store, job_id):
+        self.store = store
+        self.job_id = job_id
+        self._pending = {}
+        self._written = time.monotonic()
+
+    def __call__(self, **fields):
+        self._pending.update(fields)
+        if 'stage' in fields or 'status' in fields or time.monotonic() - self._written >= PROGRESS_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.store.update(self.job_id, **self._pending)
+            self._pending = {}
+        self._written = time.monotonic()
+
+
+class JobRunner:
+    """
+    Bounded pool of threads that run jobs recorded in a JobStore.
+    At most max_pending jobs are queued or running at once; further submissions are refused.
+    While the process has jobs, a background thread keeps their heartbeat in the store fresh.
+    """
+
+    def __init__(self, store, max_workers, max_pending):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._heartbeat_pid = None                              # Process whose heartbeat thread is running.
+        self._heartbeat_lock = threading.Lock()
+
+    def _start_heartbeat(self):
+        """Start the heartbeat thread of this process, once; a forked worker starts its own."""
+        with self._heartbeat_lock:
+            if self._heartbeat_pid == os.getpid():
+                return
+            self._heartbeat_pid = os.getpid()
+            threading.Thread(target=self._beat, name='job-heartbeat', daemon=True).start()
+
+    def _beat(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                self.store.heartbeat()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not record the job heartbeat: {str(e)}")
+
+    def submit(self, kind, func, *args):
+        """
+        Queue func(progress, *args) as a new job and return its id, or None if the queue is full.
+        progress(**fields) records the job's progress; the return value of func is the job result,
+        and an exception fails the job with its message.
+        """
+        if not self._slots.acquire(blocking=False):
+            return None
+        try:
+            self._start_heartbeat()
+            job_id = self.store.create(kind)
+            self._executor.submit(self._run, job_id, func, args)
+        except Exception:
+            self._slots.release()
+            raise
+        return job_id
+
+    def _run(self, job_id, func, args):
+        try:
+            self.store.update(job_id, status='running')
+            progress = JobProgress(self.store, job_id)
+            result = func(progress, *args)
+            progress.flush()
+            self.store.finish(job_id, result)
+        except Exception as e:
+            logger.error(f"Job {job_id} failed: {str(e)}")
+            self.store.fail(job_id, str(e))
+        finally:
+            self._slots.release()
+
+    def drain(self, timeout):
+        """
+        Wait up to timeout seconds for every queued and running job to finish, refusing new submissions
+        meanwhile. Returns True if no job is left.
+        """
+        deadline = time.monotonic() + timeout
+        for _ in range(self._max_pending):
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                return False
+        return True
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
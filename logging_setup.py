@@ -0,0 +1,273 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import pickle
+import queue
+import random
+import struct
+import threading
+
+# Id of the request being handled by the current thread, added to every log record
+request_id_var = contextvars.ContextVar('request_id', default=None)
+
+# Whether the current request's INFO and DEBUG lines are kept; see start_request()
+request_sampled_var = contextvars.ContextVar('request_sampled', default=True)
+
+TEXT_FORMAT = "%(asctime)s [%(levelname)s] %(message)s"
+
+# Length prefix of the records a forked worker sends to its parent; see forward_logs_to_parent()
+RECORD_LENGTH = struct.Struct('>I')
+
+_log_queue = None                                       # Queue between the logging threads and the listener.
+_queue_handler = None                                   # Root handler feeding _log_queue.
+_listener = None                                        # Listener draining _log_queue.
+_listener_pid = None                                    # Process that started _listener; forked children did not.
+_pool_log_queues = {}                                   # Start method -> queue the pool workers of this process log to.
+_pool_log_pid = None                                    # Process that made _pool_log_queues; forked children make their own.
+_pool_log_lock = threading.Lock()
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Stamp each record with the current request id, and drop the INFO and DEBUG lines of requests that
+    were not sampled. Runs on the thread that logs, before the record is queued, so the request
+    context is still available.
+    """
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return record.levelno >= logging.WARNING or request_sampled_var.get()
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line. Structured values passed as extra={'fields': {...}},
+    such as stage durations, are merged into the object.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        if getattr(record, 'request_id', None):
+            entry["request_id"] = record.request_id
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic "time [LEVEL] message" format, with the request id and structured fields appended."""
+
+    def format(self, record):
+        line = super().format(record)
+        if getattr(record, 'request_id', None):
+            line += f" request_id={record.request_id}"
+        for key, value in (getattr(record, 'fields', None) or {}).items():
+            line += f" {key}={json.dumps(value, default=str)}"
+        return line
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that keeps the record's structured fields and exception info for the listener's
+    formatter, instead of flattening the record into a string on the calling thread.
+    """
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks cannot cross the queue safely; render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level=logging.INFO, log_file="app.log", max_bytes=10 * 1024 * 1024, backup_count=5,
+                      json_format=True):
+    """
+    Route every log record through a queue to a background listener thread, which writes to the console
+    and to a size-rotated log_file. The request threads only pay for putting a record on the queue.
+    Returns the started QueueListener; it is stopped, flushing the queue, when the process exits.
+    Processes forked from this one send their records back to it; see forward_logs_to_parent(), and
+    pool_log_queue() for the workers of process pools.
+    """
+    formatter = JsonFormatter() if json_format else TextFormatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    global _log_queue, _queue_handler
+    _log_queue = queue.SimpleQueue()
+    _queue_handler = StructuredQueueHandler(_log_queue)
+    _queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    return _start_listener(handlers)
+
+
+def _start_listener(handlers):
+    global _listener, _listener_pid
+    if _listener is None:
+        atexit.register(stop_logging)
+    _listener = logging.handlers.QueueListener(_log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    _listener_pid = os.getpid()
+    return _listener
+
+
+def stop_logging():
+    """Flush the queued records to the handlers and stop this process's listener thread."""
+    global _listener_pid
+    if _listener is not None and _listener_pid == os.getpid():
+        _listener.stop()
+        _listener_pid = None
+
+
+class RecordPipeHandler(logging.Handler):
+    """Send every record, pickled, over a pipe to the process that reads it with _read_records()."""
+
+    def __init__(self, fd):
+        super().__init__()
+        self.stream = os.fdopen(fd, 'wb')
+
+    def emit(self, record):
+        try:
+            data = pickle.dumps(record.__dict__)
+            self.stream.write(RECORD_LENGTH.pack(len(data)) + data)
+            self.stream.flush()
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.stream.close()
+        super().close()
+
+
+def _read_records(fd, log_queue):
+    """Put the records a worker sends over fd on log_queue until the worker closes the pipe."""
+    with os.fdopen(fd, 'rb') as stream:
+        while True:
+            header = stream.read(RECORD_LENGTH.size)
+            if len(header) < RECORD_LENGTH.size:
+                return
+            data = stream.read(RECORD_LENGTH.unpack(header)[0])
+            try:
+                log_queue.put(logging.makeLogRecord(pickle.loads(data)))
+            except Exception:
+                return
+
+
+def worker_log_pipe():
+    """Create the pipe over which a worker process about to be forked sends its log records. Returns (read fd, write fd)."""
+    return os.pipe()
+
+
+def collect_worker_logs(read_fd, write_fd):
+    """
+    In the parent, after forking a worker: write the records the worker sends to this process's log
+    handlers, so only one process writes (and rotates) the log files.
+    """
+    os.close(write_fd)
+    threading.Thread(target=_read_records, args=(read_fd, _log_queue), daemon=True).start()
+
+
+def forward_logs_to_parent(read_fd, write_fd):
+    """
+    In a forked worker: the parent's listener thread did not survive the fork, so start a new one with a
+    fresh queue, which sends this process's records to the parent over the pipe.
+    Call stop_logging() before the worker exits to flush them.
+    """
+    global _log_queue
+    os.close(read_fd)
+    _log_queue = queue.SimpleQueue()
+    _queue_handler.queue = _log_queue
+    handler = RecordPipeHandler(write_fd)
+    handler.setLevel(logging.NOTSET)
+    _start_listener([handler])
+
+
+def pool_log_queue(context):
+    """
+    In the process that starts a worker pool with the multiprocessing context: return the queue over
+    which the pool's workers send their log records, to pass to init_pool_logging() in their initializer.
+    A thread of this process puts the records on its log queue, so its listener writes them with its own.
+    Returns None if logging was not set up by configure_logging().
+    """
+    global _pool_log_pid
+    if _log_queue is None:
+        return None
+    with _pool_log_lock:
+        if _pool_log_pid != os.getpid():
+            _pool_log_queues.clear()
+            _pool_log_pid = os.getpid()
+        start_method = context.get_start_method()
+        if start_method not in _pool_log_queues:
+            log_queue = context.Queue()
+            threading.Thread(target=_relay_pool_records, args=(log_queue,), daemon=True).start()
+            _pool_log_queues[start_method] = log_queue
+        return _pool_log_queues[start_method]
+
+
+def _relay_pool_records(log_queue):
+    """Move the records pool workers put on log_queue to this process's listener."""
+    while True:
+        record = log_queue.get()
+        # Read the global on every record: a forked server worker replaces it in forward_logs_to_parent()
+        _log_queue.put(record)
+
+
+def init_pool_logging(log_queue, level):
+    """
+    In a pool worker, from the pool's initializer: replace the root handlers, which a forked worker
+    inherits without the listener thread that drained them, with one that sends the worker's records
+    over log_queue from pool_log_queue(), or that writes them to stderr if log_queue is None.
+    """
+    if log_queue is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(TextFormatter(TEXT_FORMAT))
+    else:
+        handler = StructuredQueueHandler(log_queue)
+    root = logging.getLogger()
+    for old_handler in list(root.handlers):
+        root.removeHandler(old_handler)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+
+def start_request(request_id, sample_rate):
+    """
+    Enter the logging context of a request: its records carry request_id, and its INFO and DEBUG lines
+    are kept with probability sample_rate. Returns a token for end_request().
+    """
+    return (
+        request_id_var.set(request_id),
+        request_sampled_var.set(sample_rate >= 1.0 or random.random() < sample_rate)
+    )
+
+
+def end_request(token):
+    """Leave the logging context entered by start_request()."""
+    request_token, sampled_token = token
+    request_id_var.reset(request_token)
+    request_sampled_var.reset(sampled_token)
@@ -0,0 +1,583 @@
+import heapq
+import logging
+import re
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+try:
+    from re import _parser as regex_parser
+except ImportError:                                             # Python < 3.11
+    import sre_parse as regex_parser
+
+logger = logging.getLogger(__name__)
+
+# Characters that carry a special meaning when they appear unescaped in a pattern
+REGEX_SPECIAL_CHARS = set('.^$*+?{}[]|()')
+
+# Back-references are numbered per pattern, so such patterns cannot be folded into the combined alternation
+BACKREFERENCE_PATTERN = re.compile(r'\\[1-9]|\(\?P=')
+
+# Lookarounds can examine text beyond a pattern's own width
+LOOKAROUND_PATTERN = re.compile(r'\(\?<?[=!]')
+
+
+def is_word_char(char):
+    """Mirror the definition of \\w that Python's re module uses for str patterns."""
+    return char.isalnum() or char == '_'
+
+
+def has_word_boundary(text, pos):
+    """Return True if a \\b assertion would succeed at position pos of text."""
+    before = pos > 0 and is_word_char(text[pos - 1])
+    after = pos < len(text) and is_word_char(text[pos])
+    return before != after
+
+
+# Characters that re.IGNORECASE treats as equal although their lowercase forms differ (the table in
+# re/_casefix.py); each group is folded to its first member
+IGNORECASE_EQUIVALENTS = (
+    (0x69, 0x131), (0x73, 0x17f), (0xb5, 0x3bc), (0x345, 0x3b9, 0x1fbe), (0x390, 0x1fd3), (0x3b0, 0x1fe3),
+    (0x3b2, 0x3d0), (0x3b5, 0x3f5), (0x3b8, 0x3d1), (0x3ba, 0x3f0), (0x3c0, 0x3d6), (0x3c1, 0x3f1),
+    (0x3c2, 0x3c3), (0x3c6, 0x3d5), (0x432, 0x1c80), (0x434, 0x1c81), (0x43e, 0x1c82), (0x441, 0x1c83),
+    (0x442, 0x1c84, 0x1c85), (0x44a, 0x1c86), (0x463, 0x1c87), (0x1c88, 0xa64b), (0x1e61, 0x1e9b),
+    (0xfb05, 0xfb06)
+)
+IGNORECASE_TABLE = {code: chr(group[0]) for group in IGNORECASE_EQUIVALENTS for code in group[1:]}
+# re lowercases character by character; U+0130 is the only character whose str.lower() is longer than one
+SINGLE_LOWERCASE_TABLE = {0x130: 'i'}
+
+
+def fold_ignorecase(text):
+    """
+    Map text to a string of the same length in which two characters are equal exactly when
+    re.IGNORECASE considers them equal, so literal patterns can be compared with plain string matching.
+    """
+    if text.isascii():
+        return text.lower()
+    return text.translate(SINGLE_LOWERCASE_TABLE).lower().translate(IGNORECASE_TABLE)
+
+
+def parse_literal(pattern):
+    """
+    Try to interpret a regex pattern as a plain literal, optionally wrapped in \\b assertions.
+    Returns a tuple (literal, left_boundary, right_boundary) or None if the pattern uses regex features.
+    """
+    left_boundary = pattern.startswith(r'\b')
+    if left_boundary:
+        pattern = pattern[2:]
+
+    right_boundary = pattern.endswith(r'\b') and not pattern.endswith(r'\\b')
+    if right_boundary:
+        pattern = pattern[:-2]
+
+    literal = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                return None  # Escapes such as \d, \s or \1 are not literals
+            literal.append(pattern[i + 1])
+            i += 2
+            continue
+        if char in REGEX_SPECIAL_CHARS:
+            return None
+        literal.append(char)
+        i += 1
+
+    literal = ''.join(literal)
+    if not literal:
+        return None
+    return literal, left_boundary, right_boundary
+
+
+def bounded_prefix(pattern):
+    """
+    For a custom pattern whose matches all start with the same literal and are at most some number of
+    characters long, return (folded literal prefix, maximum match length); otherwise None.
+    A match attempt of such a pattern at pos only reads text[pos - 1:pos + length + 2] (the outer characters
+    for \\b and $), which lets TermMatcher re-check only the positions near text an earlier term blanked.
+    """
+    if LOOKAROUND_PATTERN.search(pattern):
+        return None
+    try:
+        parsed = regex_parser.parse(pattern, re.IGNORECASE)
+    except Exception:
+        return None
+    shortest, longest = parsed.getwidth()
+    if shortest == 0 or longest >= regex_parser.MAXREPEAT:
+        return None
+
+    prefix = []
+    for op, value in parsed.data:
+        if op is regex_parser.LITERAL:
+            prefix.append(chr(value))
+        elif op is regex_parser.AT and not prefix:
+            continue                # \b or ^ before the literal
+        else:
+            break
+    if not prefix:
+        return None
+    return fold_ignorecase(''.join(prefix)), longest
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over case-folded literals.
+    Finds every occurrence of every literal, including overlapping ones, in a single pass over the text.
+    """
+
+    def __init__(self):
+        self.goto = [{}]        # Transitions for each state
+        self.fail = [0]         # Failure link for each state
+        self.output = [[]]      # (key, length) pairs emitted when a state is reached
+
+    def add(self, literal, key):
+        state = 0
+        for char in literal:
+            next_state = self.goto[state].get(char)
+            if next_state is None:
+                next_state = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[state][char] = next_state
+            state = next_state
+        self.output[state].append((key, len(literal)))
+
+    def build(self):
+        """Compute failure links breadth-first once all literals have been added."""
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+
+    def iter_matches(self, text):
+        """Yield (key, start, end) for every occurrence of every literal in text."""
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for pos, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                end = pos + 1
+                for key, length in output[state]:
+                    yield key, end - length, end
+
+
+class BlankedSpans:
+    """
+    The spans that earlier terms matched, which the old per-term loop overwrote with spaces before
+    running the next term. Kept as sorted, disjoint (start, end) intervals.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+
+    def __bool__(self):
+        return bool(self.starts)
+
+    def add(self, start, end):
+        """Blank text[start:end]. Returns the (start, end) pieces that were not blank before."""
+        first = bisect_left(self.ends, start)           # First interval that ends at or after start
+        last = bisect_right(self.starts, end)           # One past the last interval that starts at or before end
+        added = []
+        position = start
+        for slot in range(first, last):
+            if self.starts[slot] > position:
+                added.append((position, self.starts[slot]))
+            position = max(position, self.ends[slot])
+        if position < end:
+            added.append((position, end))
+        if first < last:
+            start = min(start, self.starts[first])
+            end = max(end, self.ends[last - 1])
+        self.starts[first:last] = [start]
+        self.ends[first:last] = [end]
+        return added
+
+    def overlapping(self, start, end):
+        """Yield the blank pieces of text[start:end]."""
+        slot = bisect_right(self.ends, start)
+        while slot < len(self.starts) and self.starts[slot] < end:
+            yield max(start, self.starts[slot]), min(end, self.ends[slot])
+            slot += 1
+
+    def char_at(self, text, pos):
+        slot = bisect_right(self.starts, pos)
+        return ' ' if slot and self.ends[slot - 1] > pos else text[pos]
+
+    def has_word_boundary(self, text, pos):
+        """has_word_boundary() on the blanked text."""
+        before = pos > 0 and is_word_char(self.char_at(text, pos - 1))
+        after = pos < len(text) and is_word_char(self.char_at(text, pos))
+        return before != after
+
+    def apply(self, text, start=0, end=None):
+        """Return text[start:end] with the blanked spans replaced by spaces."""
+        if end is None:
+            end = len(text)
+        pieces = []
+        position = start
+        for blank_start, blank_end in self.overlapping(start, end):
+            pieces.append(text[position:blank_start])
+            pieces.append(' ' * (blank_end - blank_start))
+            position = blank_end
+        pieces.append(text[position:end])
+        return ''.join(pieces)
+
+
+class TermMatcher:
+    """
+    Compiled matcher for the rows returned by get_problematic_terms().
+
+    Terms whose pattern is a plain (optionally word-bounded) literal are matched with an Aho-Corasick
+    automaton; the remaining custom patterns are located with one combined alternation. Results are
+    the same as the previous per-term loop, which ran each term's finditer() in catalog order and
+    overwrote every match with spaces before running the next term: each term's matches are
+    non-overlapping, a later term cannot match text an earlier term matched, and a later term sees
+    those spans as spaces (so `\\bbaz` matches after a blanked `k`, and zero-width matches blank nothing).
+    """
+
+    def __init__(self, terms_data):
+        self.terms = terms_data
+        self.literals = {}          # term index -> (folded literal, left_boundary, right_boundary)
+        self.regexes = {}           # term index -> compiled pattern, scanned via the combined alternation
+        self.standalone = {}        # term index -> compiled pattern, scanned on its own
+        self.bounded = {}           # term index -> maximum match length, for custom patterns with a literal prefix
+        self.invalid = []           # (term index, pattern, error message) for patterns that do not compile
+        self.max_literal_length = 0 # Length of the longest literal term
+        self.spaced_literals = False # Whether any literal contains a space, and so can match blanked text
+        self.automaton = AhoCorasick()
+        self.prefixes = AhoCorasick()   # Literal prefixes of the bounded custom patterns
+        self.max_bounded_length = 0
+        self.max_prefix_length = 0
+
+        combinable = []
+        for idx, term_info in enumerate(terms_data):
+            pattern = term_info["pattern"]
+            try:
+                regex = re.compile(pattern, re.IGNORECASE)
+            except re.error as regex_compile_error:
+                logger.warning(f"Invalid regex pattern: {pattern}. Error: {str(regex_compile_error)}")
+                self.invalid.append((idx, pattern, str(regex_compile_error)))
+                continue  # Skip this term if the pattern is invalid
+
+            literal = parse_literal(pattern)
+            if literal is not None:
+                text, left_boundary, right_boundary = literal
+                folded = fold_ignorecase(text)
+                self.automaton.add(folded, idx)
+                self.max_literal_length = max(self.max_literal_length, len(text))
+                self.spaced_literals = self.spaced_literals or ' ' in folded
+                self.literals[idx] = (folded, left_boundary, right_boundary)
+            elif regex.groups and BACKREFERENCE_PATTERN.search(pattern):
+                self.standalone[idx] = regex
+            else:
+                self.regexes[idx] = regex
+                combinable.append(pattern)
+                bounded = bounded_prefix(pattern)
+                if bounded is not None:
+                    prefix, longest = bounded
+                    self.prefixes.add(prefix, idx)
+                    self.bounded[idx] = longest
+                    self.max_bounded_length = max(self.max_bounded_length, longest)
+                    self.max_prefix_length = max(self.max_prefix_length, len(prefix))
+
+        self.automaton.build()
+        self.prefixes.build()
+
+        # A zero-width lookahead reports every position at which at least one custom pattern matches
+        self.combined = None
+        if combinable:
+            try:
+                self.combined = re.compile('(?=' + '|'.join(f'(?:{p})' for p in combinable) + ')', re.IGNORECASE)
+            except re.error as combine_error:
+                logger.warning(f"Could not combine custom patterns, scanning them individually: {str(combine_error)}")
+                self.standalone.update(self.regexes)
+                self.regexes = {}
+                self.bounded = {}
+
+    def _candidates(self, text, folded):
+        """
+        Collect, per term index, every (start, end) span at which the term's pattern matches the
+        unblanked text: all occurrences of the literals, and every match position of the combined patterns.
+        """
+        candidates = {}
+
+        if self.literals:
+            for idx, start, end in self.automaton.iter_matches(folded):
+                candidates.setdefault(idx, []).append((start, end))
+
+        if self.combined is not None:
+            for position in self.combined.finditer(text):
+                pos = position.start()
+                for idx, regex in self.regexes.items():
+                    match = regex.match(text, pos)
+                    if match:
+                        candidates.setdefault(idx, []).append(match.span())
+
+        return candidates
+
+    def _literal_spans(self, idx, text, spans, blanks):
+        """The matches finditer() would return for literal term idx on the blanked text, from its candidate spans."""
+        literal, left_boundary, right_boundary = self.literals[idx]
+        accepted = []
+        last_end = -1
+        for start, end in sorted(set(spans)):
+            if start < last_end:
+                continue  # finditer never returns overlapping matches for a single term
+            if blanks and any(literal[blank_start - start:blank_end - start].strip(' ')
+                              for blank_start, blank_end in blanks.overlapping(start, end)):
+                continue  # The blanked text has spaces where the literal has other characters
+            if left_boundary and not blanks.has_word_boundary(text, start):
+                continue
+            if right_boundary and not blanks.has_word_boundary(text, end):
+                continue
+            accepted.append((start, end))
+            last_end = end
+        return accepted
+
+    def _blanked_literals(self, folded, blanks, start, end):
+        """
+        Yield (term index, start, end) for the literal occurrences in the blanked text that overlap the newly
+        blanked text[start:end]; only literals with spaces can match there.
+        """
+        window_start = max(0, start - self.max_literal_length + 1)
+        window_end = min(len(folded), end + self.max_literal_length - 1)
+        window = blanks.apply(folded, window_start, window_end)
+        for idx, match_start, match_end in self.automaton.iter_matches(window):
+            match_start += window_start
+            match_end += window_start
+            if match_start < end and match_end > start:
+                yield idx, match_start, match_end
+
+    def _blanked_prefixes(self, folded, blanks, start, end):
+        """
+        Yield (term index, position) for the positions near the newly blanked text[start:end] at which a
+        bounded custom pattern's prefix occurs in the blanked text, so its match there may have changed.
+        """
+        window_start = max(0, start - self.max_bounded_length - 1)
+        window_end = min(len(folded), end + self.max_prefix_length)
+        window = blanks.apply(folded, window_start, window_end)
+        for idx, match_start, _ in self.prefixes.iter_matches(window):
+            match_start += window_start
+            if start - self.bounded[idx] - 1 <= match_start <= end:
+                yield idx, match_start
+
+    def _bounded_spans(self, idx, text, spans, positions, blanks):
+        """
+        The matches finditer() would return for bounded custom term idx on the blanked text: its matches in the
+        unblanked text that cannot have been affected by the blanks, and its matches at the positions near them.
+        """
+        regex = self.regexes[idx]
+        reach = self.bounded[idx] + 2
+        found = [(start, end) for start, end in spans if not any(blanks.overlapping(start - 1, start + reach))]
+        for pos in positions:
+            window_start = max(0, pos - 1)
+            window = blanks.apply(text, window_start, min(len(text), pos + reach + 1))
+            match = regex.match(window, pos - window_start)
+            if match:
+                found.append((match.start() + window_start, match.end() + window_start))
+
+        accepted = []
+        last_end = -1
+        for start, end in sorted(found):
+            if start >= last_end:
+                accepted.append((start, end))
+                last_end = end
+        return accepted
+
+    def find_matches(self, text):
+        """
+        Scan text and return a list of (term index, start, end) tuples.
+        Results are ordered by term index and then by position, matching the order of the old per-term loop.
+        """
+        folded = fold_ignorecase(text)
+        candidates = self._candidates(text, folded)
+        blanks = BlankedSpans()
+        blanked_text = None         # text with the blanks applied, built when a custom pattern needs it
+
+        pending = sorted(set(candidates) | self.regexes.keys() | self.standalone.keys())
+        queued = set(pending)
+        positions = {}              # bounded term index -> positions to re-check in the blanked text
+        matches = []
+
+        while pending:
+            idx = heapq.heappop(pending)
+            if idx in self.literals:
+                spans = self._literal_spans(idx, text, candidates.get(idx, ()), blanks)
+            elif blanks and idx in self.bounded:
+                spans = self._bounded_spans(idx, text, candidates.get(idx, ()), positions.get(idx, ()), blanks)
+            else:
+                regex = self.regexes.get(idx) or self.standalone[idx]
+                spans = sorted(candidates.get(idx, ()))
+                if blanks or idx in self.standalone or any(start == end for start, end in spans):
+                    # Blanked text, back-references and zero-width matches all follow finditer's own rules
+                    if blanked_text is None:
+                        blanked_text = blanks.apply(text) if blanks else text
+                    spans = [match.span() for match in regex.finditer(blanked_text)]
+                else:
+                    accepted = []
+                    last_end = -1
+                    for start, end in spans:
+                        if start >= last_end:
+                            accepted.append((start, end))
+                            last_end = end
+                    spans = accepted
+
+            added = []
+            for start, end in spans:
+                matches.append((idx, start, end))
+                if start < end:
+                    added.extend(blanks.add(start, end))
+            if not added:
+                continue
+
+            blanked_text = None
+            if self.spaced_literals:
+                # Spaces left by this term can complete a later literal that has spaces in the same places
+                for start, end in added:
+                    for other, match_start, match_end in self._blanked_literals(folded, blanks, start, end):
+                        if other <= idx:
+                            continue
+                        candidates.setdefault(other, []).append((match_start, match_end))
+                        if other not in queued:
+                            queued.add(other)
+                            heapq.heappush(pending, other)
+            if self.bounded:
+                for start, end in added:
+                    for other, pos in self._blanked_prefixes(folded, blanks, start, end):
+                        if other > idx:
+                            positions.setdefault(other, set()).add(pos)
+
+        return matches
+
+
+# A word (a run of \w characters) starting at a word boundary
+TOKEN_PATTERN = re.compile(r'\b\w+')
+WORD_TAIL_PATTERN = re.compile(r'\w*')
+
+# The one character re.IGNORECASE equates with word characters (ι) without being one itself, so text
+# containing it cannot be compared token by token
+COMBINING_IOTA = '\u0345'
+# IGNORECASE_TABLE restricted to word characters, folding each group to its first word character
+TOPIC_FOLD_TABLE = {
+    code: chr(next(member for member in group if is_word_char(chr(member))))
+    for group in IGNORECASE_EQUIVALENTS for code in group if is_word_char(chr(code))
+}
+
+
+class TopicIndex:
+    """
+    Compiled index of the topic terms returned by get_topics().
+
+    Counts are the same as running re.finditer(r'\\b' + re.escape(term.lower()) + r'\\b', re.IGNORECASE) on
+    text.lower() for every term of every topic, but the text is tokenized only once. Single-word terms are
+    looked up in a term-frequency table; multi-word terms are checked only where their first word occurs
+    (the phrase index). Terms that do not start and end with a word character fall back to their own regex.
+    """
+
+    def __init__(self, topics_data):
+        self.topics = list(topics_data)
+        self.words = {}             # word -> topic indexes, once per occurrence of the term in a topic
+        self.phrases = {}           # first word -> list of (phrase, topic indexes)
+        self.fallback = []          # (compiled pattern, topic index, term length)
+        self.patterns = []          # (compiled pattern, topic index, term length) for every term
+        self.max_length = 0         # Length of the longest term
+
+        phrase_topics = {}
+        for topic_idx, terms in enumerate(topics_data.values()):
+            for term in terms:
+                term_lower = term.lower()
+                self.max_length = max(self.max_length, len(term_lower))
+                pattern = (re.compile(r'\b' + re.escape(term_lower) + r'\b', re.IGNORECASE), topic_idx, len(term_lower))
+                self.patterns.append(pattern)
+                term_lower = term_lower.translate(TOPIC_FOLD_TABLE)
+                if (term_lower and is_word_char(term_lower[0]) and is_word_char(term_lower[-1])
+                        and COMBINING_IOTA not in term_lower):
+                    first_word = TOKEN_PATTERN.match(term_lower).group()
+                    if first_word == term_lower:
+                        self.words.setdefault(term_lower, []).append(topic_idx)
+                    else:
+                        phrase_topics.setdefault((first_word, term_lower), []).append(topic_idx)
+                else:
+                    self.fallback.append(pattern)
+
+        for (first_word, phrase), topic_indexes in phrase_topics.items():
+            self.phrases.setdefault(first_word, []).append((phrase, topic_indexes))
+
+    def fold(self, text, start=0, end=None):
+        """
+        Lowercase text for count(), with re.IGNORECASE's equivalent characters made equal.
+        Returns (folded text, start, end): start and end are moved along when text.lower() lengthens the
+        text, as it does for İ.
+        """
+        if end is None:
+            end = len(text)
+        folded = text.lower()
+        if len(folded) != len(text):
+            start += text.count('\u0130', 0, start)
+            end += text.count('\u0130', 0, end)
+        return folded.translate(TOPIC_FOLD_TABLE), start, end
+
+    @staticmethod
+    def _count_patterns(patterns, counts, text_lower, start, end):
+        for pattern, topic_idx, length in patterns:
+            # A match that starts before end ends within length characters of it, and \b reads one more
+            scan_end = min(len(text_lower), end + length + 1)
+            counts[topic_idx] += sum(1 for match in pattern.finditer(text_lower, start, scan_end) if match.start() < end)
+
+    def count(self, text_lower, start=0, end=None):
+        """
+        Count the matches of every topic that start within text_lower[start:end].
+        text_lower must come from fold(). Returns a list of counts, parallel to self.topics.
+        """
+        if end is None:
+            end = len(text_lower)
+        counts = [0] * len(self.topics)
+
+        if COMBINING_IOTA in text_lower:
+            self._count_patterns(self.patterns, counts, text_lower, start, end)
+            return counts
+
+        # Include the whole of a word that straddles end, but no word that starts at end
+        token_end = end
+        if 0 < end < len(text_lower) and is_word_char(text_lower[end - 1]):
+            token_end = WORD_TAIL_PATTERN.match(text_lower, end).end()
+        frequencies = Counter(TOKEN_PATTERN.findall(text_lower, start, token_end))
+
+        for word, topic_indexes in self.words.items():
+            occurrences = frequencies.get(word)
+            if occurrences:
+                for topic_idx in topic_indexes:
+                    counts[topic_idx] += occurrences
+
+        if any(first_word in frequencies for first_word in self.phrases):
+            next_allowed = {}       # phrase -> end of its last match, since finditer never overlaps matches
+            for token in TOKEN_PATTERN.finditer(text_lower, start, token_end):
+                candidates = self.phrases.get(token.group())
+                if not candidates:
+                    continue
+                pos = token.start()
+                for phrase, topic_indexes in candidates:
+                    if pos < next_allowed.get(phrase, 0) or not text_lower.startswith(phrase, pos):
+                        continue
+                    phrase_end = pos + len(phrase)
+                    if phrase_end < len(text_lower) and is_word_char(text_lower[phrase_end]):
+                        continue
+                    next_allowed[phrase] = phrase_end
+                    for topic_idx in topic_indexes:
+                        counts[topic_idx] += 1
+
+        self._count_patterns(self.fallback, counts, text_lower, start, end)
+        return counts
@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the stage duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+METRIC_PREFIX = 'dei_checker'
+
+
+class StageTimer:
+    """
+    Per-request record of stage durations and counters, e.g. time spent matching and the number of matches.
+    Stages with the same name add up; stages are reported in the order they first ran.
+    """
+
+    enabled = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}            # stage name -> seconds
+        self.counts = {}            # counter name -> value
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def count(self, name, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Format the stages and the total duration as a Server-Timing header value, in milliseconds."""
+        entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={self.elapsed() * 1000:.2f}")
+        return ', '.join(entries)
+
+
+class NullTimer:
+    """Stand-in for StageTimer when metrics are disabled; every call is a no-op."""
+
+    enabled = False
+    _context = nullcontext()
+
+    def stage(self, name):
+        return self._context
+
+    def count(self, name, value=1):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets, in the shape Prometheus expects."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is the +Inf bucket
+        self.sum = 0.0
+
+    def observe(self, value):
+        for position, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            position = len(self.buckets)
+        self.counts[position] += 1
+        self.sum += value
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """
+    Process-wide aggregation of StageTimer records: a duration histogram per endpoint and stage,
+    including the request total, and a counter per endpoint and counter name.
+    """
+
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}       # (endpoint, stage) -> Histogram
+        self._counters = {}         # (name, endpoint) -> value
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, timer):
+        """Fold one finished request's timer into the aggregates."""
+        total = timer.elapsed()
+        with self._lock:
+            for stage, seconds in list(timer.stages.items()) + [('total', total)]:
+                histogram = self._histograms.get((endpoint, stage))
+                if histogram is None:
+                    histogram = self._histograms[(endpoint, stage)] = Histogram(self.buckets)
+                histogram.observe(seconds)
+            for name, value in timer.counts.items():
+                self._counters[(name, endpoint)] = self._counters.get((name, endpoint), 0) + value
+
+    def snapshot(self):
+        """Return the aggregates as a JSON-serializable dict, which merge_snapshots() can add to others."""
+        with self._lock:
+            return {
+                "histograms": [[endpoint, stage, list(histogram.counts), histogram.sum]
+                               for (endpoint, stage), histogram in self._histograms.items()],
+                "counters": [[name, endpoint, value] for (name, endpoint), value in self._counters.items()]
+            }
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        return render_snapshot(self.snapshot(), self.buckets)
+
+
+def merge_snapshots(snapshots):
+    """Add up Metrics.snapshot() dicts, e.g. those of several processes, into one."""
+    histograms = {}
+    counters = {}
+    for snapshot in snapshots:
+        for endpoint, stage, counts, total in snapshot["histograms"]:
+            merged = histograms.get((endpoint, stage))
+            if merged is None:
+                histograms[(endpoint, stage)] = [list(counts), total]
+            else:
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+        for name, endpoint, value in snapshot["counters"]:
+            counters[(name, endpoint)] = counters.get((name, endpoint), 0) + value
+    return {
+        "histograms": [[endpoint, stage, counts, total] for (endpoint, stage), (counts, total) in histograms.items()],
+        "counters": [[name, endpoint, value] for (name, endpoint), value in counters.items()]
+    }
+
+
+def render_snapshot(snapshot, buckets=DURATION_BUCKETS):
+    """Format a Metrics.snapshot() dict in the Prometheus text exposition format."""
+    name = f"{METRIC_PREFIX}_stage_duration_seconds"
+    lines = [
+        f"# HELP {name} Time spent in each stage of a request, including the request total.",
+        f"# TYPE {name} histogram"
+    ]
+    for endpoint, stage, counts, total in sorted(snapshot["histograms"]):
+        labels = f'endpoint="{_escape_label(endpoint)}",stage="{_escape_label(stage)}"'
+        cumulative = 0
+        for bound, count in zip(buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {total}")
+        lines.append(f"{name}_count{{{labels}}} {cumulative}")
+
+    described = set()
+    for counter, endpoint, value in sorted(snapshot["counters"]):
+        name = f"{METRIC_PREFIX}_{counter}_total"
+        if name not in described:
+            lines.append(f"# TYPE {name} counter")
+            described.add(name)
+        lines.append(f'{name}{{endpoint="{_escape_label(endpoint)}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class SharedMetrics(Metrics):
+    """
+    Metrics of one of several processes serving the app, any of which may answer /metrics, combined
+    through a SQLite file they share. Each process publishes a snapshot of its own aggregates every
+    publish_interval seconds and before it renders; render() reports the sum of every snapshot.
+    When a process exits, retire() folds its snapshot into that of the processes gone before it, so
+    counts never go back. Opening the file starts the counts from zero, as restarting one process would.
+    """
+
+    def __init__(self, db_path, buckets=DURATION_BUCKETS, publish_interval=1.0):
+        super().__init__(buckets)
+        self.publish_interval = publish_interval
+        self._db_path = db_path
+        self._db_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._instance = uuid.uuid4().hex
+        self._publishing = False
+        self._changed = False
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS process_metrics (instance TEXT PRIMARY KEY, pid INTEGER NOT NULL, "
+            "snapshot TEXT NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("DELETE FROM process_metrics")
+        self._db.commit()
+
+    def _connection(self):
+        """
+        Return this process's connection. A forked worker opens its own, takes a new instance token, and
+        drops the aggregates it inherited, which belong to its parent.
+        """
+        if self._pid != os.getpid():
+            self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+            self._pid = os.getpid()
+            self._instance = uuid.uuid4().hex
+            self._publishing = False
+            with self._lock:
+                self._histograms.clear()
+                self._counters.clear()
+        return self._db
+
+    def observe(self, endpoint, timer):
+        with self._db_lock:
+            self._connection()
+            if not self._publishing:
+                self._publishing = True
+                threading.Thread(target=self._publish_periodically, daemon=True).start()
+        super().observe(endpoint, timer)
+        self._changed = True
+
+    def _publish_periodically(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(self.publish_interval)
+            if self._changed:
+                self.publish()
+
+    def publish(self):
+        """Write this process's aggregates to the shared file."""
+        self._changed = False
+        snapshot = json.dumps(self.snapshot())
+        with self._db_lock:
+            db = self._connection()
+            try:
+                db.execute("INSERT OR REPLACE INTO process_metrics (instance, pid, snapshot, updated) VALUES (?, ?, ?, ?)",
+                           (self._instance, self._pid, snapshot, time.time()))
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not publish metrics: {str(e)}")
+                db.rollback()
+
+    def render(self):
+        """Return the metrics of every process sharing the file, added up, in the Prometheus text format."""
+        self.publish()
+        with self._db_lock:
+            try:
+                rows = self._connection().execute("SELECT snapshot FROM process_metrics").fetchall()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not read the metrics of other processes: {str(e)}")
+                rows = [(json.dumps(self.snapshot()),)]
+        return render_snapshot(merge_snapshots(json.loads(row[0]) for row in rows), self.buckets)
+
+    def retire(self, pid):
+        """In the parent, once process pid has exited: fold its snapshot into that of the exited processes."""
+        with self._db_lock:
+            db = self._connection()
+            try:
+                rows = db.execute("SELECT snapshot FROM process_metrics WHERE pid = ? OR instance = 'retired'",
+                                  (pid,)).fetchall()
+                if not rows:
+                    return
+                merged = merge_snapshots(json.loads(row[0]) for row in rows)
+                db.execute("DELETE FROM process_metrics WHERE pid = ?", (pid,))
+                db.execute("INSERT OR REPLACE INTO process_metrics (instance, pid, snapshot, updated) VALUES ('retired', 0, ?, ?)",
+                           (json.dumps(merged), time.time()))
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not fold the metrics of worker {pid}: {str(e)}")
+                db.rollback()
@@ -0,0 +1,174 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from compression import iter_json
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(*parts):
+    """Build a cache key from strings and bytes, e.g. the input hash, the catalog version and request options."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode('utf-8')
+        digest.update(len(part).to_bytes(8, 'big'))         # Length prefix keeps ('ab', 'c') and ('a', 'bc') apart
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def hash_stream(stream, chunk_size=64 * 1024):
+    """Return the SHA-256 hex digest of a seekable binary stream, leaving it rewound."""
+    digest = hashlib.sha256()
+    stream.seek(0)
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        digest.update(chunk)
+    stream.seek(0)
+    return digest.hexdigest()
+
+
+def decode_response(body):
+    """Decode a response cached as JSON chunks, for callers that need it as an object rather than a body."""
+    return json.loads(b''.join(body))
+
+
+def entry_size(key, body):
+    """Memory held by a cache entry: its key, the chunk tuple and every chunk, object headers included."""
+    return sys.getsizeof(key) + sys.getsizeof(body) + sum(sys.getsizeof(chunk) for chunk in body)
+
+
+class ResultCache:
+    """
+    Cache of complete analysis responses, keyed by a hash of the input and the catalog version.
+
+    Responses are stored encoded, as the tuple of UTF-8 JSON chunks that json_response() would send, so
+    a hit is sent as it is and a miss is encoded only once, while it is sent (see stream). The first tier
+    is an in-memory LRU bounded by max_bytes, measured as the memory its keys and chunks occupy (see
+    entry_size). If db_path is set, responses are also kept in a SQLite table that survives restarts; it
+    holds at most max_entries rows, dropping the least recently stored first. Responses whose encoding
+    exceeds max_bytes are not cached in either tier.
+    """
+
+    def __init__(self, max_bytes, db_path=None, max_entries=10000):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()                           # key -> (chunks, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_path = db_path
+        self._pid = os.getpid()
+        if db_path:
+            try:
+                self._db = sqlite3.connect(db_path, check_same_thread=False)
+                self._db.execute("PRAGMA journal_mode=WAL")
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored REAL NOT NULL)"
+                )
+                self._db.execute("CREATE INDEX IF NOT EXISTS idx_results_stored ON results (stored)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                logger.error(f"Could not open result cache database {db_path}: {str(e)}")
+                self._db = None
+
+    def _connection(self):
+        """Return this process's connection; a forked worker opens its own instead of sharing its parent's."""
+        if self._db is not None and self._pid != os.getpid():
+            self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._db
+
+    def _remember(self, key, body, size):
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._size -= self._entries.pop(key)[1]
+        self._entries[key] = (body, size)
+        self._size += size
+        while self._size > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+
+    def get(self, key):
+        """Return the cached response for key as a tuple of JSON chunks, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[0]
+
+            db = self._connection()
+            if db is None:
+                return None
+            try:
+                row = db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            except sqlite3.Error as e:
+                logger.warning(f"Result cache lookup failed: {str(e)}")
+                return None
+            if row is None:
+                return None
+            value = row[0] if isinstance(row[0], bytes) else row[0].encode('utf-8')  # Rows stored before were text
+            body = (value,)
+            self._remember(key, body, entry_size(key, body))
+            return body
+
+    def stream(self, key, response):
+        """
+        Encode response, yielding its JSON chunks for the caller to send as they are produced, and store it
+        under key in every tier once it has been encoded completely. A response larger than max_bytes is
+        not kept, so its chunks are dropped as soon as it passes that size and the encoding is never held
+        whole; nor is a response whose consumer stops early, as it may be incomplete.
+        """
+        body = []
+        size = 0
+        for chunk in iter_json(response):
+            if body is not None:
+                size += len(chunk)
+                if size > self.max_bytes:
+                    body = None                                 # Too large to cache; stop holding on to it
+                else:
+                    body.append(chunk)
+            yield chunk
+        if body is not None:
+            self._store(key, tuple(body), size)
+
+    def put(self, key, response):
+        """Encode response and store it under key in every tier, for callers that do not send it themselves."""
+        for _ in self.stream(key, response):
+            pass
+
+    def _store(self, key, body, size):
+        with self._lock:
+            self._remember(key, body, entry_size(key, body))
+
+            db = self._connection()
+            if db is None:
+                return
+            try:
+                # Written chunk by chunk into a preallocated blob, so the encoding is never joined in memory
+                row = db.execute(
+                    "INSERT OR REPLACE INTO results (key, value, stored) VALUES (?, zeroblob(?), ?)", (key, size, time.time())
+                ).lastrowid
+                with db.blobopen('results', 'value', row) as blob:
+                    for chunk in body:
+                        blob.write(chunk)
+                db.execute(
+                    "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY stored DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+                db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Result cache store failed: {str(e)}")
+                db.rollback()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
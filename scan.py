@@ -0,0 +1,222 @@
+"""
+Scan a directory tree of .txt, .docx and .pdf files with the analysis engine, without the web app.
+
+Files are extracted and analyzed across a pool of worker processes, and each result is appended to
+the output as soon as it is ready: one JSON object per file for .jsonl, or one row per match for .csv
+(a file without matches gets one row with empty match columns). The output doubles as the progress
+record: run the same command again after an interruption and the files already in the output are
+skipped, unless they changed since. Files that failed are skipped too, unless --retry-errors is given.
+
+Example:
+    python scan.py uploads/ --output scan.jsonl --workers 8
+"""
+import argparse
+import csv
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+import time
+
+import db
+import segmentation
+from batch import BatchAnalyzer
+from catalog_artifact import load_or_build_catalog
+from extraction import preload_extractors
+
+logger = logging.getLogger(__name__)
+
+SCANNED_EXTENSIONS = ('.txt', '.docx', '.pdf')
+CSV_FIELDS = ['path', 'size', 'mtime_ns', 'status', 'error', 'term', 'matched', 'start', 'end', 'category', 'source',
+              'confidence', 'context_note', 'feedback']
+MATCH_FIELDS = CSV_FIELDS[5:]
+
+
+def iter_documents(root):
+    """Yield (absolute path, path relative to root, size, mtime_ns) for every scannable file, in a stable order."""
+    for directory, subdirectories, filenames in os.walk(root):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(SCANNED_EXTENSIONS):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                stat = os.stat(path)
+            except OSError as e:
+                logger.warning(f"Skipping {path}: {e}")
+                continue
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            yield path, relative, stat.st_size, stat.st_mtime_ns
+
+
+def drop_partial_line(path):
+    """Truncate a trailing line that an interrupted run did not finish writing."""
+    with open(path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            block = min(64 * 1024, position)
+            f.seek(position - block)
+            data = f.read(block)
+            if position == end and data.endswith(b'\n'):
+                return
+            newline = data.rfind(b'\n')
+            if newline != -1:
+                f.truncate(position - block + newline + 1)
+                return
+            position -= block
+        f.truncate(0)
+
+
+def read_progress(output, output_format):
+    """Return {relative path: (size, mtime_ns, status)} for the files already in the output."""
+    done = {}
+    if not os.path.exists(output):
+        return done
+    drop_partial_line(output)
+    with open(output, 'r', encoding='utf-8', newline='' if output_format == 'csv' else None) as f:
+        if output_format == 'csv':
+            records = csv.DictReader(f)
+        else:
+            records = (json.loads(line) for line in f if line.strip())
+        for record in records:
+            try:
+                done[record['path']] = (int(record['size']), int(record['mtime_ns']), record['status'])
+            except (KeyError, TypeError, ValueError):
+                continue
+    return done
+
+
+class JsonlWriter:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, record):
+        self.f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.f.flush()
+
+
+class CsvWriter:
+    def __init__(self, f, write_header):
+        self.f = f
+        self.writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        if write_header:
+            self.writer.writeheader()
+            f.flush()
+
+    def write(self, record):
+        document = {key: record.get(key) for key in ('path', 'size', 'mtime_ns', 'status', 'error')}
+        matches = record.get('matches') or [{}]
+        self.writer.writerows([dict(document, **{field: match.get(field) for field in MATCH_FIELDS}) for match in matches])
+        self.f.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scan a directory tree of .txt, .docx and .pdf files for problematic terms.")
+    parser.add_argument('root', help="directory to scan")
+    parser.add_argument('--output', default='scan_results.jsonl', help="results file, .jsonl or .csv (default: scan_results.jsonl)")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help="output format, overriding the extension of --output")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="worker processes (default: number of CPUs)")
+    parser.add_argument('--db', help=f"term database (default: {db.DB_PATH})")
+    parser.add_argument('--artifact', default=os.environ.get('CATALOG_ARTIFACT', 'catalog.artifact'),
+                        help="prebuilt catalog from catalog_artifact.py, used when it matches the database")
+    parser.add_argument('--restart', action='store_true', help="overwrite the output instead of resuming from it")
+    parser.add_argument('--retry-errors', action='store_true', help="scan again the files that failed in a previous run")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s [%(levelname)s] %(message)s")
+    if args.db:
+        db.set_db_path(args.db)
+    if not os.path.isdir(args.root):
+        print(f"{args.root} is not a directory")
+        return 1
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+
+    try:
+        catalog = load_or_build_catalog(args.artifact)
+    except Exception as e:
+        print(f"Could not load the term catalog: {e}")
+        return 1
+    if not catalog.terms:
+        print("No analysis terms available in the database. Analysis cannot be performed.")
+        return 1
+    if catalog.matcher.invalid:
+        print(f"{len(catalog.matcher.invalid)} terms have invalid patterns and are skipped; run catalog_artifact.py for details")
+
+    # The pool's workers are forked from this process, so they inherit these instead of each loading them
+    segmentation.get_tokenizers()
+    preload_extractors()
+
+    done = {} if args.restart else read_progress(args.output, output_format)
+    skipped = 0
+
+    def pending_documents():
+        nonlocal skipped
+        for document in iter_documents(args.root):
+            _, relative, size, mtime_ns = document
+            previous = done.get(relative)
+            if previous and previous[:2] == (size, mtime_ns) and not (args.retry_errors and previous[2] == 'error'):
+                skipped += 1
+                continue
+            yield document
+
+    # The first Ctrl+C lets the files in progress finish and be written; a second one drops them
+    interrupted = threading.Event()
+
+    def interrupt(signum, frame):
+        interrupted.set()
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+
+    mode = 'w' if args.restart or not os.path.exists(args.output) else 'a'
+    # This process runs no threads of its own, so its workers can be forked, inheriting the loaded modules
+    fork = multiprocessing.get_context('fork') if 'fork' in multiprocessing.get_all_start_methods() else None
+    analyzer = BatchAnalyzer(args.workers, artifact_path=args.artifact, mp_context=fork)
+    started = time.perf_counter()
+    scanned = errors = matches = 0
+    announced = False
+    next_report = started + 5
+    status = 0
+    with open(args.output, mode, encoding='utf-8', newline='' if output_format == 'csv' else None) as f:
+        if output_format == 'csv':
+            writer = CsvWriter(f, write_header=f.tell() == 0)
+        else:
+            writer = JsonlWriter(f)
+        previous_handler = signal.signal(signal.SIGINT, interrupt)
+        try:
+            for (_, relative, size, mtime_ns), result in analyzer.scan(pending_documents(), catalog, stop=interrupted):
+                record = {"path": relative, "size": size, "mtime_ns": mtime_ns,
+                          "status": "error" if "error" in result else "ok"}
+                record.update(result)
+                writer.write(record)
+                scanned += 1
+                errors += "error" in result
+                matches += len(result.get("matches", ()))
+                now = time.perf_counter()
+                if now >= next_report:
+                    next_report = now + 5
+                    print(f"{scanned} files scanned ({scanned / (now - started):.1f}/s), {errors} errors, {skipped} already done")
+                if interrupted.is_set() and not announced:
+                    announced = True
+                    print("Interrupted; finishing the files in progress (press Ctrl+C again to drop them)")
+            if interrupted.is_set():
+                print("Interrupted; the files in progress were finished. Run the same command again to resume")
+                status = 130
+        except KeyboardInterrupt:
+            print("Stopped; the files in progress will be scanned again. Run the same command again to resume")
+            status = 130
+        finally:
+            signal.signal(signal.SIGINT, previous_handler)
+            analyzer.shutdown()
+
+    elapsed = time.perf_counter() - started
+    print(f"Scanned {scanned} files in {elapsed:.1f}s ({scanned / elapsed if elapsed > 0 else 0:.1f} files/s): "
+          f"{matches} matches, {errors} errors; {skipped} files were already done. Results are in {args.output}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
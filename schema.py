@@ -0,0 +1,130 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Base layout written by the first releases of init_db.py; the migrations below build on it
+BASE_TABLES = (
+    '''
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS sources (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL UNIQUE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS problematic_terms (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        term TEXT NOT NULL,
+        pattern TEXT,
+        feedback TEXT NOT NULL,
+        category_id INTEGER,
+        source_id INTEGER,
+        FOREIGN KEY (category_id) REFERENCES categories (id),
+        FOREIGN KEY (source_id) REFERENCES sources (id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS topics (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        topic TEXT NOT NULL UNIQUE,
+        terms TEXT NOT NULL
+    )
+    '''
+)
+
+
+def _populate_topic_terms(cursor):
+    """
+    Fill topic_terms from the comma-separated topics.terms of every topic that has no rows there yet.
+    Returns the number of rows added.
+    """
+    cursor.execute(
+        "SELECT id, terms FROM topics WHERE id NOT IN (SELECT DISTINCT topic_id FROM topic_terms)"
+    )
+    rows = [
+        (topic_id, position, term)
+        for topic_id, terms in cursor.fetchall()
+        for position, term in enumerate(terms.split(", "))
+    ]
+    cursor.executemany("INSERT INTO topic_terms (topic_id, position, term) VALUES (?, ?, ?)", rows)
+    return len(rows)
+
+
+def _add_topic_terms_and_indexes(cursor):
+    """Version 1: one row per topic term instead of a comma-separated string, and indexes for lookups."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS topic_terms (
+            topic_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            term TEXT NOT NULL,
+            PRIMARY KEY (topic_id, position),
+            FOREIGN KEY (topic_id) REFERENCES topics (id) ON DELETE CASCADE
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_topic_terms_term ON topic_terms (term)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problematic_terms_term ON problematic_terms (term)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problematic_terms_category_id ON problematic_terms (category_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_problematic_terms_source_id ON problematic_terms (source_id)")
+    added = _populate_topic_terms(cursor)
+    logger.info(f"Moved {added} topic terms into topic_terms")
+
+
+def _drop_topics_terms(cursor):
+    """
+    Version 2: topic_terms becomes the only copy of the topic terms, and topics.terms is dropped.
+    Since version 1 the catalog has read topic_terms while topics.terms was still the column people
+    edited, so topic_terms is first rebuilt from topics.terms to carry those edits over.
+    """
+    cursor.execute("DELETE FROM topic_terms")
+    added = _populate_topic_terms(cursor)
+    cursor.execute("ALTER TABLE topics DROP COLUMN terms")
+    logger.info(f"Rebuilt {added} topic terms from topics.terms and dropped the column")
+
+
+# Migration n upgrades a database from schema version n - 1 to n
+MIGRATIONS = (
+    _add_topic_terms_and_indexes,
+    _drop_topics_terms,
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    """Return the schema version recorded in the database's PRAGMA user_version (0 before any migration)."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def upgrade(conn):
+    """
+    Create any missing base tables and apply the migrations the database has not had yet, in place.
+    Each migration runs in its own transaction together with the bump of PRAGMA user_version, so an
+    interrupted upgrade resumes from the last completed version. Returns (old version, new version).
+    """
+    if conn.in_transaction:
+        conn.commit()
+    cursor = conn.cursor()
+    for statement in BASE_TABLES:
+        cursor.execute(statement)
+
+    old_version = schema_version(conn)
+    if old_version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema version {old_version} is newer than this code supports ({SCHEMA_VERSION})"
+        )
+    for version in range(old_version + 1, SCHEMA_VERSION + 1):
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            MIGRATIONS[version - 1](cursor)
+            cursor.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        logger.info(f"Upgraded database schema to version {version}")
+    return old_version, SCHEMA_VERSION
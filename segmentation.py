@@ -0,0 +1,85 @@
+import logging
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Extra directory searched first for NLTK data, so hosts without network access can ship it locally
+NLTK_DATA_DIR = os.environ.get('NLTK_DATA_DIR')
+
+# Set NLTK_DOWNLOAD=1 to download missing NLTK data the first time the tokenizers are needed
+NLTK_DOWNLOAD = os.environ.get('NLTK_DOWNLOAD', '0') == '1'
+
+# A sentence runs up to terminal punctuation (and any closing quotes or brackets) followed by whitespace
+SENTENCE_PATTERN = re.compile(r'\S.*?(?:[.!?]+["\')\]]*(?=\s|$)|$)', re.DOTALL)
+
+# Words (keeping internal hyphens and apostrophes) and runs of punctuation
+WORD_PATTERN = re.compile(r"\w+(?:[-'’]\w+)*|[^\w\s]+")
+
+_tokenizers = None
+_lock = threading.Lock()
+
+
+def regex_sent_tokenize(text):
+    """Split text into sentences without NLTK. Every sentence is a substring of text."""
+    return [sentence.rstrip() for sentence in SENTENCE_PATTERN.findall(text)]
+
+
+def regex_word_tokenize(text):
+    """Split text into word and punctuation tokens without NLTK. Every token is a substring of text."""
+    return WORD_PATTERN.findall(text)
+
+
+def _nltk_tokenizers():
+    """Return NLTK's tokenizers if NLTK and its punkt data are available, otherwise None."""
+    try:
+        import nltk
+    except ImportError:
+        logger.warning("NLTK is not installed, using the built-in regex segmenter")
+        return None
+
+    if NLTK_DATA_DIR and NLTK_DATA_DIR not in nltk.data.path:
+        nltk.data.path.insert(0, NLTK_DATA_DIR)
+
+    def punkt_available():
+        try:
+            nltk.sent_tokenize("Check. Check.")
+            return True
+        except LookupError:
+            return False
+
+    if not punkt_available() and NLTK_DOWNLOAD:
+        try:
+            # Newer NLTK releases read the tokenizer from punkt_tab, older ones from punkt
+            nltk.download('punkt', quiet=True)
+            nltk.download('punkt_tab', quiet=True)
+        except Exception as e:
+            logger.error(f"Error downloading NLTK data: {str(e)}")
+
+    if not punkt_available():
+        logger.warning("NLTK punkt data not found, using the built-in regex segmenter")
+        return None
+    return nltk.sent_tokenize, nltk.word_tokenize
+
+
+def get_tokenizers():
+    """
+    Return the (sent_tokenize, word_tokenize) pair used for context analysis.
+    NLTK is imported and its data located on first use, once per process; if either is missing,
+    the regex segmenter is returned instead.
+    """
+    global _tokenizers
+    if _tokenizers is None:
+        with _lock:
+            if _tokenizers is None:
+                started = time.perf_counter()
+                tokenizers = _nltk_tokenizers()
+                if tokenizers is None:
+                    tokenizers = regex_sent_tokenize, regex_word_tokenize
+                else:
+                    logger.info(f"NLTK tokenizers loaded in {time.perf_counter() - started:.2f}s")
+                _tokenizers = tokenizers
+    return _tokenizers
+
@@ -0,0 +1,324 @@
+"""
+Production entry point: serve the app from a pool of preforked worker processes.
+
+The parent process creates the app, which loads the term catalog (from the catalog artifact if there
+is one) and, with PRELOAD_NLP, the NLTK data and document parsers, then forks the workers. The workers
+share those structures with the parent copy-on-write, so none of them pays the startup cost again.
+
+- When terms.db changes (or on SIGHUP), the parent loads the new catalog once and replaces the workers
+  one generation at a time: new workers start before the old ones are told to finish.
+- Workers finish their in-flight requests and jobs before exiting on SIGTERM.
+- A worker retires itself after --max-requests requests or when its memory exceeds --max-memory-mb,
+  and the parent starts a replacement.
+- Log records of every worker are written by the parent, so only one process rotates the log files.
+
+Any worker may take any request and workers are replaced, so the editor sessions (/sessions) are shared
+through sessions.db and /metrics adds up the metrics of every worker, past and present, through
+metrics.db (or the files named by SESSIONS_DB and METRICS_DB), as job state is shared through jobs.db.
+
+Example:
+    python serve.py --workers 4 --port 8000 --max-requests 5000
+"""
+import argparse
+import gc
+import logging
+import os
+import random
+import resource
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import make_server
+from werkzeug.wsgi import ClosingIterator
+
+os.environ.setdefault('PRELOAD_NLP', '1')                           # Load NLTK data in the parent, before forking.
+
+import db
+from catalog import database_version
+from logging_setup import collect_worker_logs, forward_logs_to_parent, stop_logging, worker_log_pipe
+from metrics import SharedMetrics
+
+logger = logging.getLogger(__name__)
+
+
+def memory_usage():
+    """Resident memory of this process in bytes, or its peak if the current value is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class WorkerLimits:
+    """
+    WSGI middleware that counts a worker's requests and sets retire once the worker has served
+    max_requests requests or grown beyond max_memory bytes (0 disables either limit).
+    A request is in flight until its response body has been sent and closed.
+    """
+
+    def __init__(self, wsgi_app, max_requests, max_memory, retire):
+        self.wsgi_app = wsgi_app
+        self.max_requests = max_requests
+        self.max_memory = max_memory
+        self.retire = retire
+        self.served = 0
+        self.active = 0
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    def __call__(self, environ, start_response):
+        with self._lock:
+            self.active += 1
+            self.served += 1
+        try:
+            return ClosingIterator(self.wsgi_app(environ, start_response), self._finished)
+        except BaseException:
+            self._finished()
+            raise
+
+    def _finished(self):
+        with self._lock:
+            self.active -= 1
+            if not self.active:
+                self._idle.notify_all()
+            served = self.served
+        if self.max_requests and served >= self.max_requests:
+            logger.info(f"Worker {os.getpid()} served {served} requests; retiring it")
+            self.retire.set()
+        elif self.max_memory and memory_usage() > self.max_memory:
+            logger.info(f"Worker {os.getpid()} uses {memory_usage() / 2**20:.0f} MB; retiring it")
+            self.retire.set()
+
+    def wait_idle(self, timeout):
+        """Wait up to timeout seconds for the requests in flight to finish. Returns True if none are left."""
+        with self._idle:
+            return self._idle.wait_for(lambda: not self.active, timeout)
+
+
+def run_worker(application, listener, args):
+    """Serve requests from the shared listening socket until told to stop or retired. Returns the exit status."""
+    retire = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: retire.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)                    # The parent handles Ctrl+C for the group
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    # The parent replaces this worker when terms.db changes, so it does not watch the file itself
+    application.catalog_cache.watch = False
+
+    max_requests = args.max_requests
+    if max_requests and args.max_requests_jitter:
+        # Spread the recycling of workers that started together
+        max_requests += random.randint(0, args.max_requests_jitter)
+    limits = WorkerLimits(application.app.wsgi_app, max_requests, args.max_memory_mb * 2**20, retire)
+    application.app.wsgi_app = limits
+
+    server = make_server(args.host, args.port, application.app, threaded=True, fd=listener.fileno())
+    # Every worker wakes up for each new connection and only one of them gets it; the others must see
+    # EAGAIN and go back to polling, or they block in accept() and never notice shutdown()
+    server.socket.setblocking(False)
+
+    def stop_when_retired():
+        retire.wait()
+        server.shutdown()           # Returns once serve_forever() has stopped accepting connections
+
+    threading.Thread(target=stop_when_retired, daemon=True).start()
+    logger.info(f"Worker {os.getpid()} started")
+    server.serve_forever(poll_interval=0.5)
+
+    # No new connections are accepted now; let the accepted ones finish
+    deadline = time.monotonic() + args.graceful_timeout
+    if not limits.wait_idle(args.graceful_timeout):
+        logger.warning(f"Worker {os.getpid()} stopped with requests still in flight")
+    if not application.job_runner.drain(max(0.0, deadline - time.monotonic())):
+        logger.warning(f"Worker {os.getpid()} stopped with jobs still running")
+    if isinstance(application.metrics, SharedMetrics):
+        application.metrics.publish()                               # The parent folds it into the exited workers' metrics
+    logger.info(f"Worker {os.getpid()} stopped after {limits.served} requests")
+    return 0
+
+
+class Arbiter:
+    """Parent process: forks the workers, replaces the ones that exit, and reloads them when terms.db changes."""
+
+    def __init__(self, application, listener, args):
+        self.application = application
+        self.listener = listener
+        self.args = args
+        self.workers = {}           # pid -> start time
+        self.retiring = {}          # pids told to stop, which are not replaced when they exit -> time to kill them
+        self.stopping = False
+        self.reload_requested = False
+
+    def spawn(self):
+        read_fd, write_fd = worker_log_pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                forward_logs_to_parent(read_fd, write_fd)
+                status = run_worker(self.application, self.listener, self.args)
+            except BaseException:
+                logger.exception(f"Worker {os.getpid()} failed")
+            finally:
+                stop_logging()
+                os._exit(status)
+        collect_worker_logs(read_fd, write_fd)
+        self.workers[pid] = time.monotonic()
+        return pid
+
+    def stop_worker(self, pid, sig=signal.SIGTERM):
+        """Tell a worker to stop; it is killed if it is still running --graceful-timeout seconds (plus 5) later."""
+        self.retiring.setdefault(pid, time.monotonic() + self.args.graceful_timeout + 5)
+        try:
+            os.kill(pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def kill_overdue(self):
+        """Kill the stopping workers that missed their deadline."""
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now >= deadline and pid in self.workers:
+                logger.warning(f"Killing worker {pid}, which did not stop in time")
+                self.retiring[pid] = float('inf')
+                self.stop_worker(pid, signal.SIGKILL)
+
+    def active_workers(self):
+        return len(self.workers) - len(self.retiring.keys() & self.workers.keys())
+
+    def reap(self):
+        """Collect exited workers; run() replaces the ones that were not retired."""
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.workers.pop(pid, None)
+            self.exited(pid)
+            if pid in self.retiring:
+                del self.retiring[pid]
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code:
+                logger.error(f"Worker {pid} exited with status {code}")
+            if started is not None and time.monotonic() - started < 1.0:
+                time.sleep(1.0)     # Do not respawn in a tight loop if workers die at startup
+
+    def exited(self, pid):
+        """Account for a worker that exited: its metrics stay counted once it no longer publishes them."""
+        if isinstance(self.application.metrics, SharedMetrics):
+            self.application.metrics.retire(pid)
+
+    def reload(self):
+        """Load the current catalog in the parent, then replace every worker with one forked from it."""
+        self.reload_requested = False
+        cache = self.application.catalog_cache
+        cache.invalidate()
+        catalog = cache.get()
+        if catalog.error:
+            logger.error(f"Keeping the current workers; the new term catalog failed to load: {catalog.error}")
+            return
+        logger.info(f"Reloading workers with a catalog of {len(catalog.terms)} terms")
+        self.freeze()
+        old = list(self.workers)
+        for pid in old:
+            self.spawn()
+            self.stop_worker(pid)
+
+    def freeze(self):
+        # Move the preloaded objects out of the collector's reach, so collections in the workers do not
+        # touch (and so copy) the pages they share with the parent
+        gc.collect()
+        gc.freeze()
+
+    def run(self):
+        def stop(signum, frame):
+            self.stopping = True
+
+        def request_reload(signum, frame):
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGHUP, request_reload)
+
+        self.freeze()
+        version = database_version(db.DB_PATH)
+        next_check = time.monotonic() + self.args.reload_interval
+        while not self.stopping:
+            self.reap()
+            self.kill_overdue()
+            while not self.stopping and self.active_workers() < self.args.workers:
+                self.spawn()
+
+            if self.args.reload_interval and time.monotonic() >= next_check:
+                next_check = time.monotonic() + self.args.reload_interval
+                current = database_version(db.DB_PATH)
+                if current != version:
+                    version = current
+                    self.reload_requested = True
+            if self.reload_requested:
+                self.reload()
+            time.sleep(0.2)
+
+        self.shutdown()
+
+    def shutdown(self):
+        logger.info("Stopping workers")
+        for pid in list(self.workers):
+            self.stop_worker(pid)
+        while self.workers and any(deadline != float('inf') for deadline in self.retiring.values()):
+            self.reap()
+            self.kill_overdue()
+            time.sleep(0.1)
+        while self.workers:
+            try:
+                pid, _ = os.waitpid(-1, 0)
+            except ChildProcessError:
+                break
+            self.workers.pop(pid, None)
+            self.exited(pid)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the DEI checker from preforked worker processes.")
+    parser.add_argument('--host', default=os.environ.get('HOST', '127.0.0.1'), help="address to listen on")
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)), help="port to listen on")
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', os.cpu_count() or 1)),
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('--max-requests', type=int, default=0,
+                        help="replace a worker after it served this many requests (default: 0, never)")
+    parser.add_argument('--max-requests-jitter', type=int, default=0,
+                        help="add up to this many requests to each worker's limit, so workers do not restart together")
+    parser.add_argument('--max-memory-mb', type=int, default=0,
+                        help="replace a worker once its resident memory exceeds this (default: 0, never)")
+    parser.add_argument('--reload-interval', type=float, default=2.0,
+                        help="seconds between checks of terms.db for changes; 0 reloads only on SIGHUP (default: 2)")
+    parser.add_argument('--graceful-timeout', type=float, default=30.0,
+                        help="seconds a stopping worker may spend finishing requests and jobs (default: 30)")
+    args = parser.parse_args(argv)
+
+    # The socket is bound once and shared by every worker, which accept connections from it in turn
+    listener = socket.create_server((args.host, args.port), backlog=2048)
+    listener.set_inheritable(True)
+
+    import app as application
+    # Requests reach whichever worker accepts them, and workers are replaced, so their state is shared
+    config = application.app.config
+    config['SESSIONS_DB'] = config['SESSIONS_DB'] or 'sessions.db'
+    config['METRICS_DB'] = config['METRICS_DB'] or 'metrics.db'
+    application.create_app()
+    logger.info(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+    Arbiter(application, listener, args).run()
+    listener.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,400 @@
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+from analysis import WORD_START_PATTERN, compact_term_info, count_topic_matches, score_matches, score_topics
+from metrics import NULL_TIMER
+from segmentation import get_tokenizers
+
+logger = logging.getLogger(__name__)
+
+NEIGHBORHOOD = 4096             # Characters on either side of an edit that are segmented into sentences
+CONTEXT_WORDS = 6               # Words of context beyond the term window (5 tokens) on either side
+
+
+class EditError(ValueError):
+    """Raised for edits that cannot be applied to the session's text."""
+
+
+def apply_edits(text, edits):
+    """
+    Apply edits to text. edits is a list of dicts with 'start', 'end' (offsets into text) and 'text',
+    and the edited ranges must not overlap. Returns (new_text, dirty_start, dirty_end_old, dirty_end_new):
+    the span of text that changed, in old and new offsets.
+    """
+    parsed = []
+    for edit in edits:
+        try:
+            start, end, replacement = int(edit['start']), int(edit['end']), edit.get('text', '')
+        except (KeyError, TypeError, ValueError):
+            raise EditError("Each edit needs integer 'start' and 'end' offsets and a 'text' string")
+        if not isinstance(replacement, str) or not 0 <= start <= end <= len(text):
+            raise EditError(f"Edit range {start}-{end} is outside the document")
+        parsed.append((start, end, replacement))
+    if not parsed:
+        raise EditError("No edits provided")
+
+    parsed.sort()
+    for (_, previous_end, _), (start, _, _) in zip(parsed, parsed[1:]):
+        if start < previous_end:
+            raise EditError("Edits must not overlap")
+
+    pieces = []
+    position = 0
+    for start, end, replacement in parsed:
+        pieces.append(text[position:start])
+        pieces.append(replacement)
+        position = end
+    pieces.append(text[position:])
+
+    delta = sum(len(replacement) - (end - start) for start, end, replacement in parsed)
+    dirty_start = parsed[0][0]
+    dirty_end_old = max(end for _, end, _ in parsed)
+    return ''.join(pieces), dirty_start, dirty_end_old, dirty_end_old + delta
+
+
+def _sentence_spans(text, start, end):
+    """Sentence spans of text[start:end], as absolute offsets."""
+    sent_tokenize, _ = get_tokenizers()
+    segment = text[start:end]
+    spans = []
+    cursor = 0
+    for sentence in sent_tokenize(segment):
+        position = segment.find(sentence, cursor)
+        if position == -1:
+            continue
+        spans.append((start + position, start + position + len(sentence)))
+        cursor = position + len(sentence)
+    return spans
+
+
+def _grow(text, spans, first, last, words):
+    """
+    Extend the sentence range spans[first:last] by whole sentences on either side until each extension
+    holds at least words words. Returns the new (first, last), or None if the spans run out before that
+    (and the spans do not reach the edge of the document).
+    """
+    def enough(start, end):
+        return len(WORD_START_PATTERN.findall(text, start, end)) >= words
+
+    new_first = first
+    while not enough(spans[new_first][0], spans[first][0]):
+        if new_first == 0:
+            if spans[0][0] > 0 and text[:spans[0][0]].strip():
+                return None
+            break
+        new_first -= 1
+
+    new_last = last
+    while not enough(spans[last - 1][1], spans[new_last - 1][1]):
+        if new_last == len(spans):
+            if text[spans[-1][1]:].strip():
+                return None
+            break
+        new_last += 1
+    return new_first, new_last
+
+
+def plan_region(text, dirty_start, dirty_end, margin):
+    """
+    Choose the part of the edited text to re-analyze around the changed span [dirty_start, dirty_end).
+    Returns (core_start, core_end, window_start, window_end), or None if the whole document should be
+    re-analyzed. Findings that start in the core are recomputed; the window adds enough whole sentences
+    around the core that their context scores see the same tokens and sentences as a full analysis.
+    """
+    low = max(0, dirty_start - NEIGHBORHOOD)
+    high = min(len(text), dirty_end + NEIGHBORHOOD)
+    while low > 0 and not text[low - 1].isspace():
+        low -= 1
+    while high < len(text) and not text[high].isspace():
+        high += 1
+    if low == 0 and high == len(text):
+        return None                 # The neighborhood is the whole document anyway
+
+    spans = _sentence_spans(text, low, high)
+    if not spans:
+        return None
+    # The first and last sentences of a neighborhood that does not reach the document edge may be cut short
+    if low > 0:
+        spans = spans[1:]
+    if high < len(text):
+        spans = spans[:-1]
+    if not spans:
+        return None
+
+    starts = [start for start, _ in spans]
+    ends = [end for _, end in spans]
+    first = max(0, bisect_right(ends, dirty_start - margin) - 1)
+    last = min(len(spans), bisect_left(starts, dirty_end + margin) + 1)
+    if first >= last:
+        return None
+
+    core = _grow(text, spans, first, last, CONTEXT_WORDS)
+    if core is None:
+        return None
+    window = _grow(text, spans, core[0], core[1], CONTEXT_WORDS)
+    if window is None:
+        return None
+
+    core_start = 0 if core[0] == 0 and low == 0 else spans[core[0]][0]
+    core_end = len(text) if core[1] == len(spans) and high == len(text) else spans[core[1] - 1][1]
+    window_start = 0 if window[0] == 0 and low == 0 else spans[window[0]][0]
+    window_end = len(text) if window[1] == len(spans) and high == len(text) else spans[window[1] - 1][1]
+    # Margin for matches and topic terms that start in the core but end after it
+    window_end = min(len(text), max(window_end, core_end + margin))
+    return core_start, core_end, window_start, window_end
+
+
+class AnalysisSession:
+    """
+    Last analysis of one document in the live editor: its text, every finding, and the document's
+    topic match counts. Findings keep their id across edits; only findings near an edit are recomputed.
+    """
+
+    def __init__(self, document_id, text, catalog, timer=NULL_TIMER):
+        self.document_id = document_id
+        self.lock = threading.Lock()
+        self.touched = time.monotonic()
+        self.revision = None            # Token of the copy stored by a shared SessionStore
+        self.version = -1
+        self._next_id = 0
+        self.reset(text, catalog, timer)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['lock'], state['touched']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.touched = time.monotonic()
+
+    def _new_id(self):
+        self._next_id += 1
+        return f"f{self._next_id}"
+
+    def reset(self, text, catalog, timer=NULL_TIMER):
+        """Analyze the whole text from scratch."""
+        self.text = text
+        self.catalog_version = catalog.version
+        self.version += 1
+        self.findings = {
+            self._new_id(): finding for finding in score_matches(text, catalog.terms, catalog.matcher, timer)
+        }
+        with timer.stage('topics'):
+            self.topic_counts, self.word_count = count_topic_matches(
+                text, catalog.topics, topic_index=catalog.topic_index
+            )
+
+    def margin(self, catalog):
+        return max(catalog.matcher.max_literal_length, catalog.topic_index.max_length) + 1
+
+    def edit(self, edits, catalog, timer=NULL_TIMER):
+        """
+        Apply edits and re-analyze the affected sentences.
+        Returns (removed ids, added {id: finding}, shift), where shift is (offset, delta): findings that
+        start at or after offset in the previous text moved by delta characters. shift is None when the
+        whole document was re-analyzed, in which case every previous finding is in removed.
+        """
+        new_text, dirty_start, dirty_end_old, dirty_end_new = apply_edits(self.text, edits)
+        delta = dirty_end_new - dirty_end_old
+
+        region = None
+        if catalog.version == self.catalog_version:
+            with timer.stage('segment'):
+                region = plan_region(new_text, dirty_start, dirty_end_new, self.margin(catalog))
+        if region is None:
+            logger.debug(f"Re-analyzing session {self.document_id} in full")
+            removed = list(self.findings)
+            self.reset(new_text, catalog, timer)
+            return removed, dict(self.findings), None
+
+        core_start, core_end, window_start, window_end = region
+        old_core_end = core_end - delta
+        old_window_end = window_end - delta
+
+        # Topic counts are additive over regions: swap the old core's counts for the new core's
+        with timer.stage('topics'):
+            old_counts, old_words = count_topic_matches(
+                self.text[window_start:old_window_end], catalog.topics,
+                core_start - window_start, old_core_end - window_start, topic_index=catalog.topic_index
+            )
+            new_counts, new_words = count_topic_matches(
+                new_text[window_start:window_end], catalog.topics,
+                core_start - window_start, core_end - window_start, topic_index=catalog.topic_index
+            )
+        for topic in self.topic_counts:
+            self.topic_counts[topic] += new_counts[topic] - old_counts[topic]
+        self.word_count += new_words - old_words
+
+        # Drop findings that start in the old core and shift the ones after it
+        removed = []
+        kept = {}
+        for finding_id, (idx, start, end, confidence, note) in self.findings.items():
+            if core_start <= start < old_core_end:
+                removed.append(finding_id)
+            elif start >= old_core_end:
+                kept[finding_id] = (idx, start + delta, end + delta, confidence, note)
+            else:
+                kept[finding_id] = (idx, start, end, confidence, note)
+
+        window = new_text[window_start:window_end]
+        added = {}
+        for idx, start, end, confidence, note in score_matches(window, catalog.terms, catalog.matcher, timer):
+            start += window_start
+            end += window_start
+            if not core_start <= start < core_end:
+                continue
+            added[self._new_id()] = (idx, start, end, confidence, note)
+
+        kept.update(added)
+        self.findings = kept
+        self.text = new_text
+        self.version += 1
+        return removed, added, (old_core_end, delta)
+
+    def topics(self):
+        return score_topics(self.topic_counts, self.word_count)
+
+    def describe(self, findings, catalog):
+        """
+        Serialize findings for a response: {id: [term id, start, end, confidence, context note]} with
+        offsets in characters (code points) of the session text, and the metadata of their terms.
+        """
+        terms = {}
+        serialized = {}
+        for finding_id, (idx, start, end, confidence, note) in findings.items():
+            if idx not in terms:
+                terms[idx] = compact_term_info(catalog.terms[idx])
+            serialized[finding_id] = [idx, start, end, confidence, note]
+        return {
+            "findings": serialized,
+            "terms": {str(idx): term for idx, term in terms.items()}
+        }
+
+
+class SessionStore:
+    """
+    LRU of AnalysisSessions, bounded by max_sessions and expiring idle sessions after ttl seconds.
+
+    Without db_path the sessions live in this process only. With it they are also kept in a SQLite table
+    shared by every process pointed at the same file, so the edits of a session may reach any of them.
+    Each process keeps the sessions it used in memory and reloads one only when another process stored a
+    newer revision; save() stores an edited session only if no other process saved it in the meantime.
+    """
+
+    def __init__(self, max_sessions, ttl, db_path=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._db_path = db_path
+        self._pid = os.getpid()
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (document_id TEXT PRIMARY KEY, revision TEXT NOT NULL, "
+                "state BLOB NOT NULL, touched REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_sessions_touched ON sessions (touched)")
+            self._db.commit()
+
+    def _connection(self):
+        """Return this process's connection; a forked worker opens its own instead of sharing its parent's."""
+        if self._db is not None and self._pid != os.getpid():
+            self._db = sqlite3.connect(self._db_path, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._db
+
+    def _expire(self, now):
+        while self._sessions:
+            document_id, session = next(iter(self._sessions.items()))
+            if now - session.touched <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[document_id]
+
+    def create(self, text, catalog, document_id=None, timer=NULL_TIMER):
+        session = AnalysisSession(document_id or uuid.uuid4().hex, text, catalog, timer)
+        with self._lock:
+            db = self._connection()
+            if db is not None:
+                now = time.time()
+                session.revision = uuid.uuid4().hex
+                db.execute(
+                    "INSERT OR REPLACE INTO sessions (document_id, revision, state, touched) VALUES (?, ?, ?, ?)",
+                    (session.document_id, session.revision, pickle.dumps(session), now)
+                )
+                db.execute("DELETE FROM sessions WHERE touched < ?", (now - self.ttl,))
+                db.execute(
+                    "DELETE FROM sessions WHERE document_id IN "
+                    "(SELECT document_id FROM sessions ORDER BY touched DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,)
+                )
+                db.commit()
+            self._sessions.pop(session.document_id, None)
+            self._sessions[session.document_id] = session
+            self._expire(time.monotonic())
+        return session
+
+    def get(self, document_id):
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            session = self._sessions.get(document_id)
+            db = self._connection()
+            if db is not None:
+                row = db.execute("SELECT revision, touched FROM sessions WHERE document_id = ?", (document_id,)).fetchone()
+                if row is None or time.time() - row[1] > self.ttl:
+                    self._sessions.pop(document_id, None)
+                    return None
+                if session is None or session.revision != row[0]:
+                    # Edited by another process since this one last saw it
+                    state = db.execute("SELECT state FROM sessions WHERE document_id = ?", (document_id,)).fetchone()
+                    if state is None:
+                        return None
+                    session = pickle.loads(state[0])
+                    self._sessions[document_id] = session
+            if session is not None:
+                session.touched = now
+                self._sessions.move_to_end(document_id)
+            return session
+
+    def save(self, session):
+        """
+        Store an edited session for the other processes. Returns False, and forgets this process's copy,
+        if another process saved the session since this copy was loaded; the edit is then lost.
+        """
+        with self._lock:
+            db = self._connection()
+            if db is None:
+                return True
+            loaded_revision = session.revision
+            session.revision = uuid.uuid4().hex
+            updated = db.execute(
+                "UPDATE sessions SET revision = ?, state = ?, touched = ? WHERE document_id = ? AND revision = ?",
+                (session.revision, pickle.dumps(session), time.time(), session.document_id, loaded_revision)
+            ).rowcount
+            db.commit()
+            if not updated:
+                if self._sessions.get(session.document_id) is session:
+                    del self._sessions[session.document_id]
+                return False
+            return True
+
+    def delete(self, document_id):
+        with self._lock:
+            deleted = self._sessions.pop(document_id, None) is not None
+            db = self._connection()
+            if db is not None:
+                deleted = db.execute("DELETE FROM sessions WHERE document_id = ?", (document_id,)).rowcount > 0 or deleted
+                db.commit()
+            return deleted
@@ -3,6 +3,75 @@ function escapeRegExp(string) {
     return string.replace(/[.*+?^${}()|[\]\\]/g, '\\$&');
 }
 
+// Function to escape text for HTML; attribute values also need their quotes escaped
+function escapeHtml(string, quote = false) {
+    let escaped = string.replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;');
+    if (quote) {
+        escaped = escaped.replace(/"/g, '&quot;').replace(/'/g, '&#x27;');
+    }
+    return escaped;
+}
+
+// Function to map a confidence score onto the CSS class used to colour its highlight
+function confidenceClass(confidence) {
+    if (confidence < 0.3) return 'low-confidence';
+    if (confidence < 0.7) return 'medium-confidence';
+    return 'high-confidence';
+}
+
+// Function to expand a compact (offset-based) analysis response into the full response format,
+// rendering the highlighted text in the browser instead of receiving it from the server
+function expandCompactResult(result, text) {
+    // Offsets count Unicode code points, as Python does, so index the text by code point
+    const characters = Array.from(text);
+    const analysis = result.matches.map(([termId, start, end, confidence, noteId], index) => {
+        const term = result.terms[termId];
+        return {
+            id: `term-${termId}-${index}`,
+            term: characters.slice(start, end).join(''),
+            feedback: term.feedback,
+            category: term.category,
+            source: term.source,
+            confidence: confidence,
+            context_note: result.notes[noteId],
+            start: start,
+            end: end
+        };
+    });
+
+    let inputText = '';
+    let position = 0;
+    [...analysis].sort((a, b) => a.start - b.start).forEach(issue => {
+        const attributes = [
+            ['data-id', issue.id],
+            ['data-feedback', issue.feedback],
+            ['data-category', issue.category],
+            ['data-source', issue.source],
+            ['data-confidence', Number.isInteger(issue.confidence) ? issue.confidence.toFixed(1) : issue.confidence],
+            ['data-context', issue.context_note]
+        ].map(([name, value]) => `${name}="${escapeHtml(String(value), true)}"`).join(' ');
+        inputText += escapeHtml(characters.slice(position, issue.start).join(''));
+        inputText += `<span class="highlight ${confidenceClass(issue.confidence)}" ${attributes}>${escapeHtml(issue.term)}</span>`;
+        position = issue.end;
+    });
+    inputText += escapeHtml(characters.slice(position).join(''));
+
+    return {
+        analysis: analysis,
+        topics: result.topics,
+        original_text: text,
+        input_text: inputText
+    };
+}
+
+// Function to turn a response into the full format; uploads carry their extracted text, typed text is passed in
+function toFullResult(result, text) {
+    if (result && result.format === 'compact') {
+        return expandCompactResult(result, result.text !== undefined ? result.text : text);
+    }
+    return result;
+}
+
 // Global variable to store analysis results
 let globalResults = null;
 
@@ -709,14 +778,14 @@ document.addEventListener("DOMContentLoaded", () => {
                 headers: {
                     "Content-Type": "application/json",
                 },
-                body: JSON.stringify({ text: inputText }),
+                body: JSON.stringify({ text: inputText, format: "compact" }),
             });
 
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const data = await response.json();
+            const data = toFullResult(await response.json(), inputText);
             
             // Store results globally
             globalResults = data;
@@ -746,6 +815,7 @@ document.addEventListener("DOMContentLoaded", () => {
 
         const formData = new FormData();
         formData.append("file", file);
+        formData.append("format", "compact");
 
         try {
             const response = await fetch("/upload", {
@@ -757,7 +827,7 @@ document.addEventListener("DOMContentLoaded", () => {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
 
-            const result = await response.json();
+            const result = toFullResult(await response.json());
             
             if (result.error) {
                 throw new Error(result.error);
@@ -947,14 +1017,14 @@ document.addEventListener("DOMContentLoaded", () => {
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ text: inputText })
+                body: JSON.stringify({ text: inputText, format: 'compact' })
             });
             
             if (!response.ok) {
                 throw new Error(`Server responded with status: ${response.status}`);
             }
             
-            const result = await response.json();
+            const result = toFullResult(await response.json(), inputText);
             
             // Hide loading and process results
             hideLoading();
@@ -978,6 +1048,7 @@ document.addEventListener("DOMContentLoaded", () => {
         
         const formData = new FormData();
         formData.append('file', fileInput.files[0]);
+        formData.append('format', 'compact');
         
         // Show loading indicator
         showLoading();
@@ -992,7 +1063,7 @@ document.addEventListener("DOMContentLoaded", () => {
                 throw new Error(`Server responded with status: ${response.status}`);
             }
             
-            const result = await response.json();
+            const result = toFullResult(await response.json());
             
             // Hide loading and process results
             hideLoading();
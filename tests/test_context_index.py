@@ -0,0 +1,132 @@
+"""
+Context scoring from a per-document ContextIndex against tokenizing the document again for every match,
+as analyze_term_context() used to.
+"""
+import random
+import unittest
+
+from analysis import analyze_term_context
+from context_index import BENIGN_CONTEXT_INDICATORS, ContextIndex
+from segmentation import regex_sent_tokenize, regex_word_tokenize
+
+# Distinct words, so each word of a document made from them can only be found at its own position
+WORDS = ['alpha', 'policy', 'Quoted', 'example', 'references', 'team', 'chairman', 'discussion', 'word', 'Mention',
+         'crazy', 'guys', 'manpower', 'older', 'design', 'notes', 'draft', 'review', 'staff', 'reader']
+PUNCTUATION = ['', '', '', ',', '.', '!', '?', ' "', '" ', ' (', ') ']
+VOCABULARY = ['the', 'policy', 'Quoted', 'example', 'references', 're-cited', "isn't", 'discussion', 'term',
+              'Mention', 'word', 'team', '"', ',', '.', '!', '?', '(', ')', '...', '\n', '  ']
+
+
+def baseline_context(text, span, window_size=5):
+    """
+    analyze_term_context() as it was before the ContextIndex, on its tokenizer path, with the regex
+    word tokenizer in place of nltk.word_tokenize.
+    """
+    start, end = span
+    words = regex_word_tokenize(text)
+    term_position = -1
+    for i, word in enumerate(words):
+        word_start = text.find(word, max(0, start-50), min(len(text), end+50))
+        if word_start != -1 and start >= word_start and end <= word_start + len(word):
+            term_position = i
+            break
+
+    if term_position == -1:
+        return 1.0, "Could not analyze context"
+
+    start_pos = max(0, term_position - window_size)
+    end_pos = min(len(words), term_position + window_size + 1)
+    context_words = words[start_pos:term_position] + words[term_position+1:end_pos]
+
+    context_text = ' '.join(context_words).lower()
+    for indicator in BENIGN_CONTEXT_INDICATORS:
+        if indicator in context_text:
+            return 0.5, f"May be in benign context ('{indicator}' found nearby)"
+    return 1.0, "No benign context indicators found"
+
+
+def reference_context(text, span, window_size=5):
+    start, end = span
+    tokens = []
+    cursor = 0
+    for token in regex_word_tokenize(text):
+        token_start = text.find(token, cursor)
+        tokens.append((token, token_start, token_start + len(token)))
+        cursor = token_start + len(token)
+
+    overlapping = [i for i, (_, token_start, token_end) in enumerate(tokens) if token_start < end and token_end > start]
+    if overlapping:
+        first, last = overlapping[0], overlapping[-1] + 1
+        context_words = [token for token, _, _ in tokens[max(0, first - window_size):first] + tokens[last:last + window_size]]
+        context_text = ' '.join(context_words).lower()
+    else:
+        cursor = 0
+        context_text = None
+        for sentence in regex_sent_tokenize(text):
+            sentence_start = text.find(sentence, cursor)
+            cursor = sentence_start + len(sentence)
+            if sentence_start <= start and end <= cursor:
+                context_text = sentence.lower()
+                break
+        if context_text is None:
+            return 1.0, "Could not analyze context"
+
+    for indicator in BENIGN_CONTEXT_INDICATORS:
+        if indicator in context_text:
+            return 0.5, f"May be in benign context ('{indicator}' found nearby)"
+    return 1.0, "No benign context indicators found"
+
+
+class ContextIndexTest(unittest.TestCase):
+    def test_random_documents_and_spans(self):
+        rng = random.Random(20261018)
+        for _ in range(500):
+            text = ' '.join(rng.choice(VOCABULARY) for _ in range(rng.randint(1, 60)))
+            index = ContextIndex(text, regex_sent_tokenize, regex_word_tokenize)
+            for _ in range(10):
+                start = rng.randrange(len(text))
+                span = (start, rng.randint(start + 1, min(len(text), start + 20)))
+                self.assertEqual(analyze_term_context(text, span, context_index=index), reference_context(text, span),
+                                 msg=f"text={text!r} span={span}")
+
+    def test_single_token_matches_agree_with_baseline(self):
+        rng = random.Random(20261019)
+        for _ in range(500):
+            words = rng.sample(WORDS, rng.randint(1, len(WORDS)))
+            pieces = []
+            for word in words:
+                pieces.append(word + rng.choice(PUNCTUATION))
+            text = ' '.join(pieces)
+            index = ContextIndex(text, regex_sent_tokenize, regex_word_tokenize)
+            for word in words:
+                word_start = text.index(word)
+                # The whole word, as \b-delimited patterns match, and a part of it, as bare patterns can
+                first = rng.randrange(len(word))
+                for span in ((word_start, word_start + len(word)),
+                             (word_start + first, word_start + rng.randint(first + 1, len(word)))):
+                    self.assertEqual(analyze_term_context(text, span, context_index=index), baseline_context(text, span),
+                                     msg=f"text={text!r} span={span}")
+
+    def test_behavior_beyond_single_tokens(self):
+        # A match over several words looks at the words on either side of the whole match
+        text = "An example of older workers in the team"
+        index = ContextIndex(text, regex_sent_tokenize, regex_word_tokenize)
+        span = (text.index("older"), text.index("workers") + len("workers"))
+        self.assertEqual(analyze_term_context(text, span, context_index=index),
+                         (0.5, "May be in benign context ('example' found nearby)"))
+
+        # A match that overlaps no token falls back to its sentence, where the baseline gave up
+        text = "A line  quoted from the draft. Then more"
+        index = ContextIndex(text, regex_sent_tokenize, regex_word_tokenize)
+        span = (text.index("  ") + 1, text.index("  ") + 2)
+        self.assertEqual(baseline_context(text, span), (1.0, "Could not analyze context"))
+        self.assertEqual(analyze_term_context(text, span, context_index=index),
+                         (0.5, "May be in benign context ('quote' found nearby)"))
+
+        # Outside every sentence there is still nothing to go on
+        span = (text.index(". ") + 1, text.index(". ") + 2)
+        self.assertEqual(analyze_term_context(text, span, context_index=index), (1.0, "Could not analyze context"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+TermMatcher against the per-term loop it replaced, which ran each pattern's finditer() in catalog order
+and overwrote every match with spaces before running the next pattern.
+"""
+import random
+import re
+import unittest
+
+from matcher import TermMatcher
+
+ALPHABET = 'abkfoz sSſıIiİσςΣKµμ_-.'
+CUSTOM_PATTERNS = [
+    r'\bfo(?:o|ob)?\b', r'a b{1,2}', r'ſk?', r'\bi ı', r'o$', r's\b', r'\bk[ao]\b', r'σ ?a', r'fo+b?', r'\bbaz',
+    r'x*', r'a\s+b', r'(a|b)\1', r'\bfoo (bar|baz)\b', r'o*', r'(?<=a)b', r'k\b', r'[ab]+', r'\s', r'b\w*', r'ab|a'
+]
+
+
+def reference_matches(text, terms_data):
+    matches = []
+    for idx, term_info in enumerate(terms_data):
+        try:
+            regex = re.compile(term_info["pattern"], re.IGNORECASE)
+        except re.error:
+            continue
+        for match in regex.finditer(text):
+            matches.append((idx, match.start(), match.end()))
+            text = text[:match.start()] + ' ' * (match.end() - match.start()) + text[match.end():]
+    return matches
+
+
+def random_terms(rng):
+    def word():
+        return ''.join(rng.choice(ALPHABET.replace(' ', '')) for _ in range(rng.randint(1, 3)))
+
+    terms = []
+    for _ in range(rng.randint(1, 8)):
+        kind = rng.random()
+        if kind < 0.3:
+            pattern = r'\b' + re.escape(' '.join(word() for _ in range(rng.randint(1, 3)))) + r'\b'
+        elif kind < 0.55:
+            pattern = re.escape(rng.choice([word(), f"{word()} {word()}", f" {word()}"]))
+        elif kind < 0.95:
+            pattern = rng.choice(CUSTOM_PATTERNS)
+        else:
+            pattern = '(unbalanced'
+        terms.append({"pattern": pattern})
+    return terms
+
+
+class TermMatcherTest(unittest.TestCase):
+    def assertSameMatches(self, text, terms_data):
+        self.assertEqual(TermMatcher(terms_data).find_matches(text), reference_matches(text, terms_data),
+                         msg=f"text={text!r} patterns={[term['pattern'] for term in terms_data]}")
+
+    def test_later_terms_see_blanked_matches(self):
+        self.assertSameMatches("foobar", [{"pattern": "bar"}, {"pattern": "fo+b?"}])
+        self.assertSameMatches("kbaz", [{"pattern": "k"}, {"pattern": r"\bbaz"}])
+        self.assertSameMatches("kbaz", [{"pattern": "k"}, {"pattern": r"\bbaz\b"}])
+        self.assertSameMatches("fooXbar", [{"pattern": "x"}, {"pattern": r"\bfoo bar\b"}])
+
+    def test_zero_width_matches_do_not_block_later_terms(self):
+        self.assertSameMatches("axb", [{"pattern": "x*"}, {"pattern": "axb"}])
+
+    def test_literals_fold_like_ignorecase(self):
+        for text, literal in [("ſ", "s"), ("İ", "i"), ("ı", "I"), ("ς", "σ"), ("ΑΣ", "ας"), ("K", "k"), ("µ", "μ")]:
+            self.assertSameMatches(text, [{"pattern": re.escape(literal)}])
+            self.assertSameMatches(literal, [{"pattern": re.escape(text)}])
+
+    def test_random_catalogs(self):
+        rng = random.Random(20261018)
+        for _ in range(3000):
+            text = ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 40)))
+            self.assertSameMatches(text, random_terms(rng))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+"""
+Incremental re-analysis of editor sessions against analyzing the edited document from scratch.
+"""
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+
+import sessions
+from analysis import count_topic_matches, score_matches
+from catalog import Catalog
+
+WORDS = ['the', 'team', 'guys', 'crazy', 'chairman', 'chair', 'man', 'manpower', 'older', 'age', 'inclusive',
+         'design', 'quoted', 'example', 'policy', 'word', 'term', "isn't", 'mention']
+SEPARATORS = [' ', ' ', ' ', ', ', '. ', '! ', '? ', '.\n', ' "', '" ']
+PATTERNS = [r'\bguys\b', r'\bcrazy\b', r'\bchair ?man\b', 'manpower', r'\bolder workers?\b', r'\b(he|she)\b']
+TOPICS = {"Inclusive": ["inclusive", "inclusive design"], "Age": ["age", "older"], "Teams": ["team", "chair"]}
+
+
+def random_text(rng, words):
+    pieces = []
+    for _ in range(words):
+        pieces.append(rng.choice(WORDS))
+        pieces.append(rng.choice(SEPARATORS))
+    return ''.join(pieces)
+
+
+def random_edits(rng, text):
+    """One to three non-overlapping edits of text, close together as in typing."""
+    center = rng.randint(0, len(text))
+    points = sorted(rng.randint(max(0, center - 40), min(len(text), center + 40)) for _ in range(2 * rng.randint(1, 3)))
+    return [
+        {"start": start, "end": end, "text": rng.choice(['', random_text(rng, rng.randint(1, 6)), rng.choice(SEPARATORS)])}
+        for start, end in zip(points[::2], points[1::2])
+    ]
+
+
+class SessionEditTest(unittest.TestCase):
+    def test_random_edits_match_full_analysis(self):
+        rng = random.Random(20261018)
+        terms = [{"term": pattern, "pattern": pattern, "feedback": "", "category": None, "source": None}
+                 for pattern in PATTERNS]
+        catalog = Catalog(1, terms, TOPICS)
+        incremental = 0
+
+        # A small neighborhood lets documents of a few hundred words take the incremental path
+        with mock.patch.object(sessions, 'NEIGHBORHOOD', 300):
+            for _ in range(60):
+                session = sessions.AnalysisSession('doc', random_text(rng, rng.randint(50, 600)), catalog)
+                for _ in range(10):
+                    edits = random_edits(rng, session.text)
+                    previous = dict(session.findings)
+                    removed, added, shift = session.edit(edits, catalog)
+                    incremental += shift is not None
+
+                    text = session.text
+                    msg = f"edits={edits} text={text!r}"
+                    self.assertEqual(sorted(session.findings.values()), sorted(score_matches(text, terms, catalog.matcher)),
+                                     msg=msg)
+                    counts, words = count_topic_matches(text, TOPICS, topic_index=catalog.topic_index)
+                    self.assertEqual((session.topic_counts, session.word_count), (counts, words), msg=msg)
+                    # The reported changes turn the previous findings into the current ones
+                    self.assertEqual(set(previous) - set(removed) | set(added), set(session.findings), msg=msg)
+        self.assertGreater(incremental, 100)
+
+
+class SharedSessionStoreTest(unittest.TestCase):
+    def test_edits_through_two_stores_on_one_file(self):
+        terms = [{"term": pattern, "pattern": pattern, "feedback": "", "category": None, "source": None}
+                 for pattern in PATTERNS]
+        catalog = Catalog(1, terms, TOPICS)
+        with tempfile.TemporaryDirectory() as directory:
+            # Two stores on the same file stand in for two worker processes
+            path = os.path.join(directory, 'sessions.db')
+            first = sessions.SessionStore(10, 60, path)
+            second = sessions.SessionStore(10, 60, path)
+
+            session = first.create("the team of guys", catalog)
+            other = second.get(session.document_id)
+            self.assertEqual(other.text, session.text)
+
+            other.edit([{"start": 0, "end": 3, "text": "a crazy"}], catalog)
+            self.assertTrue(second.save(other))
+            reloaded = first.get(session.document_id)
+            self.assertEqual((reloaded.text, reloaded.version), ("a crazy team of guys", 1))
+            self.assertEqual(sorted(reloaded.findings.values()), sorted(score_matches(reloaded.text, terms, catalog.matcher)))
+
+            # An edit of a copy that another store saved over since is refused
+            session.edit([{"start": 0, "end": 0, "text": "chairman "}], catalog)
+            self.assertFalse(first.save(session))
+            self.assertEqual(first.get(session.document_id).text, "a crazy team of guys")
+
+            self.assertTrue(second.delete(session.document_id))
+            self.assertIsNone(first.get(session.document_id))
+
+
+if __name__ == '__main__':
+    unittest.main()
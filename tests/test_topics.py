@@ -0,0 +1,69 @@
+"""
+Topic counting from one tokenization (TopicIndex) against the per-term regex loop it replaced.
+"""
+import random
+import re
+import unittest
+
+from analysis import analyze_topics, count_topic_matches
+from matcher import TopicIndex
+
+ALPHABET = 'abkfo sSſıIiİσςΣKµμ̇ͅ-.'
+WORDS = ['alpha', 'beta', 'gamma', 'delta', 'ſigma', 'İota', 'kappa', 'omega']
+
+
+def reference_topics(text, topics_data):
+    text_lower = text.lower()
+    topic_matches = {}
+    for topic, terms in topics_data.items():
+        matches = 0
+        for term in terms:
+            pattern = r'\b' + re.escape(term.lower()) + r'\b'
+            matches += len(re.findall(pattern, text_lower, re.IGNORECASE))
+        if matches > 0:
+            relevance = min(1.0, matches / (len(text_lower.split()) / 50))
+            topic_matches[topic] = {"matches": matches, "relevance": relevance}
+    return {k: v for k, v in sorted(topic_matches.items(), key=lambda item: item[1]['relevance'], reverse=True)}
+
+
+class TopicIndexTest(unittest.TestCase):
+    def test_random_text_and_terms(self):
+        rng = random.Random(20261018)
+
+        def word():
+            return ''.join(rng.choice(ALPHABET.replace(' ', '')) for _ in range(rng.randint(1, 3)))
+
+        for _ in range(2000):
+            topics = {
+                f"Topic {number}": [' '.join(word() for _ in range(rng.randint(1, 2))) for _ in range(rng.randint(1, 4))]
+                for number in range(rng.randint(1, 4))
+            }
+            text = ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 60)))
+            self.assertEqual(analyze_topics(text, topics, TopicIndex(topics)), reference_topics(text, topics),
+                             msg=f"text={text!r} topics={topics}")
+
+    def test_region_counts_add_up(self):
+        rng = random.Random(7)
+        topics = {
+            "Words": WORDS[:4],
+            "Phrases": ["alpha beta", "gamma delta omega", "ſigma kappa"],
+            "Punctuation": ["-beta", "kappa.", "İota"]
+        }
+        index = TopicIndex(topics)
+        for _ in range(300):
+            text = ' '.join(rng.choice(WORDS + ['-beta', 'kappa.', 'KAPPA', '--', 'x']) for _ in range(rng.randint(0, 40)))
+            whole, whole_words = count_topic_matches(text, topics, topic_index=index)
+            cuts = sorted(rng.sample(range(len(text) + 1), min(3, len(text) + 1)))
+            bounds = [0] + cuts + [len(text)]
+            totals = dict.fromkeys(topics, 0)
+            words = 0
+            for start, end in zip(bounds, bounds[1:]):
+                counts, region_words = count_topic_matches(text, topics, start, end, topic_index=index)
+                for topic, count in counts.items():
+                    totals[topic] += count
+                words += region_words
+            self.assertEqual((totals, words), (whole, whole_words), msg=f"text={text!r} cuts={cuts}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import logging
+import os
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TextCache:
+    """
+    On-disk cache of text extracted from uploaded files, keyed by the SHA-256 of the raw upload bytes.
+
+    Each entry is a UTF-8 file under cache_dir, so the cache survives restarts and is shared by every
+    process pointed at the same directory. When the files exceed max_bytes, the least recently used
+    entries (by modification time, which is refreshed on every hit) are deleted.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(entry.stat().st_size for entry in self._entries())
+
+    def _entries(self):
+        for subdir in os.scandir(self.cache_dir):
+            if subdir.is_dir():
+                yield from (entry for entry in os.scandir(subdir.path) if entry.name.endswith('.txt'))
+
+    def _path(self, digest, extension):
+        # Different extractors give different text for the same bytes, so the extension is part of the key
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}{extension.lower()}.txt")
+
+    def get(self, digest, extension):
+        """Return the cached text for an upload, or None."""
+        path = self._path(digest, extension)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            os.utime(path)
+            return text
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Could not read extracted text cache entry {path}: {str(e)}")
+            return None
+
+    def put(self, digest, extension, text):
+        """Store the extracted text for an upload, evicting old entries if the cache is over budget."""
+        path = self._path(digest, extension)
+        encoded = text.encode('utf-8')
+        if len(encoded) > self.max_bytes:
+            return
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file and rename it so readers never see a partial entry
+            with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), delete=False) as f:
+                f.write(encoded)
+            os.replace(f.name, path)
+        except OSError as e:
+            logger.warning(f"Could not write extracted text cache entry {path}: {str(e)}")
+            return
+
+        with self._lock:
+            self._size += len(encoded)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry.stat().st_mtime)
+        self._size = sum(entry.stat().st_size for entry in entries)
+        for entry in entries:
+            if self._size <= self.max_bytes * 0.9:              # Leave some headroom so eviction is not run on every put
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self._size -= size
+            except OSError:
+                pass